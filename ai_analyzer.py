@@ -1,6 +1,11 @@
 import os
 import json
 import time
+from contextlib import contextmanager
+from job_context import JobCancelled
+from metrics import ai_request
+from tracing import span
+from process_runner import run_command
 try:
     from openai import OpenAI
 except ImportError:
@@ -14,8 +19,16 @@ except ImportError:
     Anthropic = None
 
 class AIAnalyzer:
-    def __init__(self, provider='openai'):
+    def __init__(self, provider='openai', context=None):
+        """
+        Args:
+            provider: 'openai' o 'claude'
+            context: JobContext del trabajo (opcional). Si se cancela, no se
+                     hacen más peticiones y se cierra el cliente HTTP para
+                     abortar las que estén en curso.
+        """
         self.provider = provider
+        self.context = context
         
         # Inicializar valores por defecto de duración
         self.min_duration = 35
@@ -45,39 +58,95 @@ class AIAnalyzer:
                 self.client = None
         else:
             raise ValueError(f"Proveedor no soportado: {provider}")
+
+        self._register_client(self.client)
+
+    def _register_client(self, client):
+        """Cierra el cliente HTTP al cancelar el trabajo (aborta peticiones en curso)"""
+        if self.context is not None and client is not None and hasattr(client, 'close'):
+            self.context.on_cancel(client.close)
+
+    def _check_cancelled(self):
+        if self.context is not None:
+            self.context.check_cancelled()
+
+    def _sleep(self, seconds):
+        """Espera entre peticiones; se interrumpe si el trabajo se cancela"""
+        if self.context is not None:
+            self.context.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    @contextmanager
+    def _api_call(self, provider, operation, **args):
+        """Petición a la API de IA: métricas de latencia / 429 y span en la traza del trabajo"""
+        with ai_request(provider, operation), span(self.context, operation, 'ai', provider=provider, **args):
+            yield
+
+    def _record_tokens(self, model, response):
+        """Suma los tokens de la respuesta al uso de recursos del trabajo"""
+        if self.context is not None:
+            self.context.usage.add_response(model, response)
+
+    def _record_audio(self, seconds):
+        """Suma los segundos de audio enviados a Whisper al uso de recursos del trabajo"""
+        if self.context is not None:
+            self.context.usage.add_audio('whisper-1', seconds)
+
+    def _whisper_client(self):
+        """Cliente de OpenAI para Whisper (Claude no soporta transcripción)"""
+        if self.provider == 'openai':
+            return self.client
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self._register_client(client)
+        return client
     
-    def transcribe_audio(self, audio_path):
+    def transcribe_audio(self, audio_path, bitrate=None):
         """
         Transcribe el audio usando Whisper de OpenAI
         Para archivos grandes, divide en chunks
+
+        Args:
+            audio_path: Audio a transcribir
+            bitrate: Bitrate del audio en bits/s (perfil de audio de la ingesta); si no
+                     se indica se calcula con el tamaño y la duración del archivo
         """
         print(f"🎤 Transcribiendo audio con Whisper...")
         
-        # Verificar tamaño del audio
         audio_size = os.path.getsize(audio_path)
         max_size = 24 * 1024 * 1024  # 24MB (límite de Whisper es 25MB)
-        
-        if audio_size > max_size:
-            print(f"⚠️  Audio muy grande ({audio_size/1024/1024:.1f}MB), dividiendo en chunks...")
-            return self._transcribe_audio_chunked(audio_path)
-        
-        return self._transcribe_audio_single(audio_path)
+        if audio_size <= max_size:
+            return self._transcribe_audio_single(audio_path)
+
+        # Duración máxima por petición según el bitrate (con margen por contenedor y VBR)
+        duration = self._audio_duration(audio_path)
+        bitrate = bitrate or audio_size * 8 / max(duration, 1)
+        chunk_seconds = int(max_size * 8 * 0.9 / bitrate)
+        print(f"⚠️  Audio muy grande ({audio_size/1024/1024:.1f}MB), dividiendo en chunks de {chunk_seconds / 60:.0f} minutos...")
+        return self._transcribe_audio_chunked(audio_path, duration, chunk_seconds)
+
+    def _audio_duration(self, audio_path):
+        cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+               '-of', 'default=noprint_wrappers=1:nokey=1', audio_path]
+        return float(run_command(cmd, self.context, check=True).stdout.strip())
     
     def _transcribe_audio_single(self, audio_path):
         """Transcribe audio completo de una vez"""
-        if self.provider == 'openai':
-            client = self.client
-        else:
+        if self.provider != 'openai':
             print("⚠️  Claude no soporta transcripción. Usando OpenAI Whisper...")
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
+        client = self._whisper_client()
+
+        self._check_cancelled()
         with open(audio_path, 'rb') as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="verbose_json",
-                timestamp_granularities=["segment"]
-            )
+            with self._api_call('openai', 'transcribe'):
+                transcript = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file,
+                    response_format="verbose_json",
+                    timestamp_granularities=["segment"]
+                )
+        # verbose_json incluye la duración del audio
+        self._record_audio(getattr(transcript, 'duration', 0))
         
         return {
             'text': transcript.text,
@@ -91,33 +160,31 @@ class AIAnalyzer:
             ]
         }
     
-    def _transcribe_audio_chunked(self, audio_path):
+    def _transcribe_audio_chunked(self, audio_path, duration, chunk_seconds):
         """Transcribe audio en chunks para archivos grandes"""
-        from pydub import AudioSegment
-        
         print("📊 Dividiendo audio en chunks...")
         
-        # Cargar audio
-        audio = AudioSegment.from_file(audio_path)
-        duration_ms = len(audio)
-        chunk_length_ms = 10 * 60 * 1000  # 10 minutos
+        duration_ms = int(duration * 1000)
+        chunk_length_ms = chunk_seconds * 1000
+        base_path, extension = os.path.splitext(audio_path)
         
         all_segments = []
         chunk_num = 1
         
-        if self.provider == 'openai':
-            client = self.client
-        else:
-            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        client = self._whisper_client()
         
         # Procesar en chunks
         for start_ms in range(0, duration_ms, chunk_length_ms):
             end_ms = min(start_ms + chunk_length_ms, duration_ms)
-            chunk = audio[start_ms:end_ms]
             
-            # Guardar chunk temporal
-            chunk_path = audio_path.replace('.mp3', f'_chunk_{chunk_num}.mp3')
-            chunk.export(chunk_path, format="mp3", bitrate="64k")
+            self._check_cancelled()
+
+            # Guardar chunk temporal: copia del tramo sin recodificar (el audio ya está en el perfil de voz)
+            chunk_path = f"{base_path}_chunk_{chunk_num}{extension}"
+            run_command([
+                'ffmpeg', '-y', '-v', 'error', '-ss', str(start_ms / 1000), '-t', str((end_ms - start_ms) / 1000),
+                '-i', audio_path, '-c', 'copy', chunk_path
+            ], self.context, check=True, media_duration=(end_ms - start_ms) / 1000)
             
             print(f"🎤 Transcribiendo chunk {chunk_num} ({start_ms/1000:.0f}s - {end_ms/1000:.0f}s)...")
             
@@ -127,12 +194,14 @@ class AIAnalyzer:
                 for attempt in range(max_retries):
                     try:
                         with open(chunk_path, 'rb') as audio_file:
-                            transcript = client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=audio_file,
-                                response_format="verbose_json",
-                                timestamp_granularities=["segment"]
-                            )
+                            with self._api_call('openai', 'transcribe', chunk=chunk_num, attempt=attempt + 1):
+                                transcript = client.audio.transcriptions.create(
+                                    model="whisper-1",
+                                    file=audio_file,
+                                    response_format="verbose_json",
+                                    timestamp_granularities=["segment"]
+                                )
+                        self._record_audio((end_ms - start_ms) / 1000)
                         
                         # Ajustar timestamps al offset del chunk
                         offset_seconds = start_ms / 1000
@@ -147,7 +216,7 @@ class AIAnalyzer:
                         
                         # Delay entre chunks
                         if start_ms + chunk_length_ms < duration_ms:
-                            time.sleep(2)
+                            self._sleep(2)
                         
                         break  # Éxito
                         
@@ -157,13 +226,16 @@ class AIAnalyzer:
                             if attempt < max_retries - 1:
                                 wait_time = 20 * (attempt + 1)
                                 print(f"  ⏳ Rate limit en transcripción, esperando {wait_time}s...")
-                                time.sleep(wait_time)
+                                self._sleep(wait_time)
                             else:
                                 raise
                         else:
                             raise
                 
+            except JobCancelled:
+                raise
             except Exception as e:
+                self._check_cancelled()
                 print(f"  ⚠️  Error en chunk {chunk_num}: {e}")
             
             finally:
@@ -183,10 +255,12 @@ class AIAnalyzer:
             'segments': all_segments
         }
     
-    def find_viral_moments(self, transcript, video_duration, short_duration='short'):
+    def find_viral_moments(self, transcript, video_duration, short_duration='short', candidates=None):
         """
         Analiza la transcripción y encuentra TODOS los momentos virales
         short_duration: 'short' (35-60s) o 'long' (70-90s)
+        candidates: Ventanas preseleccionadas localmente (MomentRanker); si la
+                    transcripción no entra en un prompt sólo se envían esas ventanas
         """
         # Configurar rangos según duración seleccionada
         if short_duration == 'long':
@@ -213,6 +287,15 @@ class AIAnalyzer:
 
         print(f"📊 Tokens estimados: {estimated_tokens:,}")
 
+        # Si excede el límite, enviar sólo las ventanas preseleccionadas
+        if estimated_tokens > max_tokens and candidates:
+            moments = self._find_viral_moments_in_candidates(
+                transcript, video_duration, duration_text, example_end, candidates, max_tokens
+            )
+            if moments:
+                return moments
+            print("⚠️  Sin momentos en las ventanas preseleccionadas, se analiza la transcripción completa...")
+
         # Si excede el límite, usar método chunked
         if estimated_tokens > max_tokens:
             print(f"⚠️  Transcripción muy grande ({estimated_tokens:,} tokens > {max_tokens:,}), procesando en chunks...")
@@ -220,6 +303,31 @@ class AIAnalyzer:
 
         return self._find_viral_moments_single(transcript, video_duration, duration_text, example_end)
     
+    def _find_viral_moments_in_candidates(self, transcript, video_duration, duration_text, example_end,
+                                          candidates, max_tokens):
+        """Analiza sólo los segmentos de las ventanas candidatas (con margen para ajustar los cortes)"""
+        margin = max(10, (self.max_duration - min(c['end'] - c['start'] for c in candidates)) / 2 + 10)
+        ranges = [(c['start'] - margin, c['end'] + margin) for c in candidates]
+        reduced = {'segments': [
+            seg for seg in transcript['segments']
+            if any(seg['end'] > start and seg['start'] < end for start, end in ranges)
+        ]}
+
+        estimated_tokens = len(json.dumps(reduced['segments'])) // 4
+        print(f"🏁 Analizando {len(candidates)} ventanas preseleccionadas: "
+              f"{len(reduced['segments'])} de {len(transcript['segments'])} segmentos (~{estimated_tokens:,} tokens)")
+
+        if estimated_tokens > max_tokens:
+            moments = self._find_viral_moments_chunked(reduced, video_duration, duration_text, example_end)
+        else:
+            moments = self._find_viral_moments_single(reduced, video_duration, duration_text, example_end)
+
+        # Descartar momentos que la IA ubicó fuera de las ventanas enviadas
+        return [
+            moment for moment in moments
+            if any(moment['start_time'] < end and moment['end_time'] > start for start, end in ranges)
+        ]
+
     def _find_viral_moments_single(self, transcript, video_duration, duration_text, example_end):
         """Procesa toda la transcripción de una vez"""
         prompt = f"""Analiza la siguiente transcripción de video y encuentra TODOS los momentos interesantes y virales para crear shorts.
@@ -291,17 +399,20 @@ EJEMPLO INCORRECTO (genérico o de otro momento):
 Genera tantos momentos como encuentres (mínimo 2, máximo 15). Prioriza CALIDAD sobre cantidad.
 Asegúrate de que el JSON sea válido, los tiempos estén dentro de 0 a {video_duration} segundos, y que CADA copy hable del contenido REAL del clip."""
 
+        self._check_cancelled()
         try:
             if self.provider == 'openai':
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo-1106",
-                    messages=[
-                        {"role": "system", "content": "Eres un experto en crear contenido viral para redes sociales. DEBES analizar cada momento individualmente mirando SOLO el texto entre start_time y end_time de ese momento. Las key_phrases y copies deben reflejar ÚNICAMENTE lo que se dice en ESE segmento temporal específico, NO mezcles contenido de otros momentos. Respondes únicamente con JSON válido sin texto adicional."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    response_format={"type": "json_object"},
-                    temperature=0.7
-                )
+                with self._api_call(self.provider, 'find_viral_moments'):
+                    response = self.client.chat.completions.create(
+                        model="gpt-3.5-turbo-1106",
+                        messages=[
+                            {"role": "system", "content": "Eres un experto en crear contenido viral para redes sociales. DEBES analizar cada momento individualmente mirando SOLO el texto entre start_time y end_time de ese momento. Las key_phrases y copies deben reflejar ÚNICAMENTE lo que se dice en ESE segmento temporal específico, NO mezcles contenido de otros momentos. Respondes únicamente con JSON válido sin texto adicional."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        response_format={"type": "json_object"},
+                        temperature=0.7
+                    )
+                self._record_tokens("gpt-3.5-turbo-1106", response)
 
                 content = response.choices[0].message.content
                 # Limpiar posibles caracteres extra o texto antes/después del JSON
@@ -316,14 +427,16 @@ Asegúrate de que el JSON sea válido, los tiempos estén dentro de 0 a {video_d
                 result = json.loads(json_str)
 
             else:
-                response = self.client.messages.create(
-                    model="claude-3-haiku-20240307",
-                    max_tokens=4096,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
+                with self._api_call(self.provider, 'find_viral_moments'):
+                    response = self.client.messages.create(
+                        model="claude-3-haiku-20240307",
+                        max_tokens=4096,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.7
+                    )
+                self._record_tokens("claude-3-haiku-20240307", response)
 
                 content = response.content[0].text
                 start = content.find('{')
@@ -456,25 +569,30 @@ Responde ÚNICAMENTE con JSON válido:
                 retry_delay = 10
                 
                 for attempt in range(max_retries):
+                    self._check_cancelled()
                     try:
                         if self.provider == 'openai':
-                            response = self.client.chat.completions.create(
-                                model="gpt-3.5-turbo-1106",
-                                messages=[
-                                    {"role": "system", "content": "Analista de contenido viral. Responde solo JSON."},
-                                    {"role": "user", "content": prompt}
-                                ],
-                                response_format={"type": "json_object"},
-                                temperature=0.7
-                            )
+                            with self._api_call(self.provider, 'find_viral_moments', chunk=chunk_num, attempt=attempt + 1):
+                                response = self.client.chat.completions.create(
+                                    model="gpt-3.5-turbo-1106",
+                                    messages=[
+                                        {"role": "system", "content": "Analista de contenido viral. Responde solo JSON."},
+                                        {"role": "user", "content": prompt}
+                                    ],
+                                    response_format={"type": "json_object"},
+                                    temperature=0.7
+                                )
+                            self._record_tokens("gpt-3.5-turbo-1106", response)
                             result = json.loads(response.choices[0].message.content)
                         else:
-                            response = self.client.messages.create(
-                                model="claude-3-haiku-20240307",
-                                max_tokens=2048,
-                                messages=[{"role": "user", "content": prompt}],
-                                temperature=0.7
-                            )
+                            with self._api_call(self.provider, 'find_viral_moments', chunk=chunk_num, attempt=attempt + 1):
+                                response = self.client.messages.create(
+                                    model="claude-3-haiku-20240307",
+                                    max_tokens=2048,
+                                    messages=[{"role": "user", "content": prompt}],
+                                    temperature=0.7
+                                )
+                            self._record_tokens("claude-3-haiku-20240307", response)
                             content = response.content[0].text
                             start = content.find('{')
                             end = content.rfind('}') + 1
@@ -489,7 +607,7 @@ Responde ÚNICAMENTE con JSON válido:
                             if attempt < max_retries - 1:
                                 wait_time = retry_delay * (attempt + 1)
                                 print(f"  ⏳ Rate limit alcanzado, esperando {wait_time}s...")
-                                time.sleep(wait_time)
+                                self._sleep(wait_time)
                             else:
                                 raise
                         else:
@@ -507,11 +625,14 @@ Responde ÚNICAMENTE con JSON válido:
                 # Delay entre chunks
                 if current_time < video_duration - chunk_duration:
                     if self.provider == 'claude':
-                        time.sleep(3)
+                        self._sleep(3)
                     else:
-                        time.sleep(1)
+                        self._sleep(1)
                 
+            except JobCancelled:
+                raise
             except Exception as e:
+                self._check_cancelled()
                 print(f"  ⚠️  Error en chunk {chunk_num}: {e}")
             
             current_time = end_time
@@ -1,13 +1,31 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, request, jsonify, send_file, render_template_string, Response, stream_with_context
 import os
 import json
 import uuid
 import time
+import socket
 from datetime import datetime
 from werkzeug.utils import secure_filename
-import threading
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, File, Data, Epilogue, NeedData
 from video_processor import VideoProcessor
 from ai_analyzer import AIAnalyzer
+from chunked_upload import ChunkedUploadManager, UploadSessionError
+from zip_stream import stream_zip
+from job_store import JobStore, TERMINAL_STATUSES
+from job_scheduler import JobScheduler, QueueFullError, MIN_PRIORITY, MAX_PRIORITY
+from job_context import JobContext, JobCancelled
+from job_checkpoint import JobCheckpoint
+from webcam_detector import WebcamDetector
+from moment_ranker import MomentRanker, MIN_DURATION_FOR_RANKING
+from render_queue import RenderQueue, RenderError
+from process_runner import ProcessStalled
+from storage_manager import StorageManager, OUTPUT_NAME_RE, GB
+from metrics import REGISTRY, STAGE_DURATION, JOBS_BY_STATUS, UPLOAD_BYTES, ai_request
+from tracing import Tracer, span
+from resource_usage import sum_usage
+from tiktok_session_pool import TikTokSessionPool, tiktok_credentials, tiktok_password
+from publish_queue import PublishQueue, Publisher, parse_publish_windows
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -18,16 +36,120 @@ app.config['MAX_CONTENT_LENGTH'] = None  # Sin límite de tamaño
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
 app.config['TEMP_FOLDER'] = 'temp'
+app.config['DATA_FOLDER'] = 'data'
 
 # Crear directorios si no existen
-for folder in [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'], app.config['TEMP_FOLDER']]:
+for folder in [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'], app.config['TEMP_FOLDER'], app.config['DATA_FOLDER']]:
     os.makedirs(folder, exist_ok=True)
 
-# Almacenamiento en memoria de trabajos
-jobs = {}
+# Almacenamiento persistente de trabajos (SQLite)
+job_store = JobStore(
+    os.getenv('JOB_DB_PATH', os.path.join(app.config['DATA_FOLDER'], 'jobs.db')),
+    retention_days=int(os.getenv('JOB_RETENTION_DAYS', '30')),
+    max_jobs=int(os.getenv('JOB_MAX_COUNT', '100000'))
+)
+
+# Planificador: número máximo de pipelines simultáneos y tamaño de la cola
+job_scheduler = JobScheduler(
+    job_store,
+    lambda job_id, options, context: run_job(job_id, options, context),
+    max_concurrent=int(os.getenv('MAX_CONCURRENT_JOBS', '2')),
+    max_queued=int(os.getenv('MAX_QUEUED_JOBS', '20'))
+)
+
+# Renders: 'local' (en este proceso) o 'distributed' (workers de render_worker.py)
+render_queue = None
+if os.getenv('RENDER_MODE', 'local') == 'distributed':
+    render_queue = RenderQueue(
+        os.getenv('RENDER_QUEUE_PATH', os.path.join(app.config['DATA_FOLDER'], 'render_queue.db')),
+        journal_mode=os.getenv('RENDER_QUEUE_JOURNAL', 'DELETE')
+    )
+    print("🎬 Modo de render distribuido: los shorts los generan los workers de render")
+
+# Disco: carpeta temporal por trabajo, cuotas por área (GB, 0 = sin límite) y antigüedad
+storage_manager = StorageManager(
+    job_store,
+    app.config['UPLOAD_FOLDER'],
+    app.config['OUTPUT_FOLDER'],
+    app.config['TEMP_FOLDER'],
+    quotas={
+        'uploads': float(os.getenv('UPLOADS_MAX_GB', '50')) * GB,
+        'outputs': float(os.getenv('OUTPUTS_MAX_GB', '50')) * GB,
+        'temp': float(os.getenv('TEMP_MAX_GB', '20')) * GB
+    },
+    max_age_days=float(os.getenv('FILES_MAX_AGE_DAYS', '14')) or None,
+    min_free_bytes=float(os.getenv('STORAGE_MIN_FREE_GB', '5')) * GB
+)
+
+# Trazas de los trabajos (Chrome trace JSON, se abren en chrome://tracing o Perfetto)
+TRACE_FOLDER = os.getenv('TRACE_FOLDER', os.path.join(app.config['DATA_FOLDER'], 'traces'))
+
+def trace_path(job_id):
+    return os.path.join(TRACE_FOLDER, f"{job_id}.json")
+
+# Sesiones de TikTok persistentes (perfiles de Chrome con login) para la publicación automática
+tiktok_session_pool = TikTokSessionPool(
+    os.getenv('TIKTOK_PROFILES_DIR', os.path.join(app.config['DATA_FOLDER'], 'tiktok_profiles')),
+    sessions_per_account=int(os.getenv('TIKTOK_SESSIONS_PER_ACCOUNT', '1')),
+    idle_timeout=int(os.getenv('TIKTOK_SESSION_IDLE_TIMEOUT', '1800')),
+    profile_max_age_days=float(os.getenv('TIKTOK_PROFILE_MAX_AGE_DAYS', '30'))
+)
+
+# Cola de publicaciones: el trabajo termina sin esperar a TikTok; el publicador
+# (publish_worker.py, o este proceso con PUBLISHER_ENABLED) sube los shorts con
+# el ritmo de cada cuenta, ventanas horarias y reintentos
+publish_queue = PublishQueue(
+    os.getenv('PUBLISH_QUEUE_PATH', os.path.join(app.config['DATA_FOLDER'], 'publish_queue.db')),
+    min_interval=int(os.getenv('PUBLISH_MIN_INTERVAL', '30')),
+    max_per_day=int(os.getenv('PUBLISH_MAX_PER_DAY', '20')),
+    max_attempts=int(os.getenv('PUBLISH_MAX_ATTEMPTS', '4')),
+    retry_base=int(os.getenv('PUBLISH_RETRY_BASE', '60'))
+)
+publisher = Publisher(
+    publish_queue,
+    job_store,
+    tiktok_session_pool,
+    tiktok_password,
+    socket.gethostname(),
+    windows=parse_publish_windows(os.getenv('PUBLISH_WINDOWS', ''))
+)
+
+# Instantáneas de métricas de cada proceso (servidor y workers de render) para /metrics
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(app.config['DATA_FOLDER'], 'metrics'))
+
+def start_background_services():
+    """
+    Arranca los hilos de fondo (retención de trabajos y planificador).
+
+    No se arrancan al importar el módulo: con gunicorn cada proceso worker
+    los inicia después del fork (ver gunicorn.conf.py), porque los hilos no
+    sobreviven al fork del proceso maestro. El límite de pipelines es global
+    porque se aplica sobre la base de datos compartida.
+    """
+    REGISTRY.enable_snapshots(METRICS_DIR)
+    job_store.start_retention()
+    job_scheduler.start()
+    storage_manager.start(int(os.getenv('STORAGE_CHECK_INTERVAL', '300')))
+    # El publicador corre normalmente en su propio proceso (publish_worker.py).
+    # Si se activa aquí, el candado del publicador deja que sólo un worker de
+    # gunicorn lo arranque: los perfiles de Chrome no se comparten entre procesos
+    if os.getenv('PUBLISHER_ENABLED', 'false').lower() == 'true':
+        if publisher.start():
+            tiktok_session_pool.start()
+            if os.getenv('TIKTOK_USERNAME'):
+                tiktok_session_pool.warm(*tiktok_credentials())
+
+# Sesiones de subida reanudables (estado en disco, dentro de uploads/.sessions)
+chunked_uploads = ChunkedUploadManager(app.config['UPLOAD_FOLDER'])
 
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
 
+# Tamaño de lectura del cuerpo de la petición en subidas en streaming
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Segundos sin eventos tras los que se envía un heartbeat por SSE
+SSE_HEARTBEAT_INTERVAL = 15
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -37,6 +159,13 @@ def index():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
+    if storage_manager.disk_critical():
+        return insufficient_storage_response()
+
+    # Modo ingest en streaming: extraer el audio mientras llega el video
+    if request.args.get('ingest') == 'stream':
+        return upload_video_streaming()
+
     if 'video' not in request.files:
         return jsonify({'error': 'No se encontró el archivo de video'}), 400
     
@@ -60,6 +189,7 @@ def upload_video():
     
     try:
         file.save(filepath)
+        UPLOAD_BYTES.inc(os.path.getsize(filepath), mode='form')
         print(f"✅ Video guardado exitosamente")
         
         # Verificar que existe
@@ -74,139 +204,500 @@ def upload_video():
         return jsonify({'error': f'Error al guardar el archivo: {str(e)}'}), 500
     
     # Crear trabajo
-    jobs[job_id] = {
-        'id': job_id,
-        'status': 'uploaded',
-        'filename': filename,
-        'filepath': filepath,
-        'progress': 0,
-        'message': 'Video cargado correctamente',
-        'shorts': [],
-        'created_at': datetime.now().isoformat()
-    }
-    
+    create_job(job_id, filename, filepath)
+
     return jsonify({'job_id': job_id, 'message': 'Video cargado correctamente'})
 
+def insufficient_storage_response():
+    """Respuesta 507 cuando el disco está por debajo del espacio libre mínimo"""
+    return jsonify({'error': 'El servidor no tiene espacio en disco suficiente, intenta más tarde'}), 507
+
+def create_job(job_id, filename, filepath, **extra):
+    """Registra un trabajo nuevo para un video ya guardado en disco"""
+    return job_store.create(
+        job_id,
+        status='uploaded',
+        filename=filename,
+        filepath=filepath,
+        progress=0,
+        message='Video cargado correctamente',
+        created_at=datetime.now().isoformat(),
+        **extra
+    )
+
+def upload_video_streaming():
+    """
+    Recibe el multipart por bloques sin esperar a que termine la subida.
+
+    Cada bloque del campo 'video' se escribe en disco y a la vez se envía a
+    un FFmpeg que extrae el audio para Whisper. Al terminar la subida el
+    audio y la duración del video ya están disponibles, así que el
+    procesamiento empieza directamente por la transcripción.
+    """
+    content_type, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if content_type != 'multipart/form-data' or not boundary:
+        return jsonify({'error': 'Se esperaba multipart/form-data'}), 400
+
+    job_id = str(uuid.uuid4())
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    video_processor = VideoProcessor(storage_manager.job_dir(job_id))
+
+    filename = None
+    filepath = None
+    out = None
+    extractor = None
+    receiving_video = False
+    finished = False
+
+    print(f"📤 Recibiendo video en streaming (Job ID: {job_id})...")
+
+    try:
+        while not finished:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            decoder.receive_data(chunk if chunk else None)
+
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, File) and event.name == 'video':
+                    if not event.filename or not allowed_file(event.filename):
+                        return jsonify({'error': 'Formato de archivo no permitido'}), 400
+
+                    filename = secure_filename(f"{job_id}_{event.filename}")
+                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                    out = open(filepath, 'wb')
+                    extractor = video_processor.start_streaming_audio_extraction(job_id)
+                    receiving_video = True
+                elif isinstance(event, Data):
+                    if receiving_video:
+                        out.write(event.data)
+                        UPLOAD_BYTES.inc(len(event.data), mode='stream')
+                        extractor.feed(event.data)
+                        if not event.more_data:
+                            out.close()
+                            receiving_video = False
+                elif isinstance(event, Epilogue):
+                    finished = True
+                    break
+                event = decoder.next_event()
+
+            if not chunk:
+                break
+
+        if filepath is None:
+            return jsonify({'error': 'No se encontró el archivo de video'}), 400
+        if receiving_video or not finished:
+            raise Exception("La subida terminó antes de recibir el video completo")
+
+        file_size = os.path.getsize(filepath) / (1024 * 1024 * 1024)
+        print(f"✅ Video guardado exitosamente: {filepath} ({file_size:.2f} GB)")
+
+    except Exception as e:
+        print(f"❌ Error recibiendo archivo en streaming: {e}")
+        if extractor:
+            extractor.abort()
+        if out and not out.closed:
+            out.close()
+        if filepath and os.path.exists(filepath):
+            os.remove(filepath)
+        storage_manager.remove_job_dir(job_id)
+        return jsonify({'error': f'Error al guardar el archivo: {str(e)}'}), 500
+
+    # El audio y los datos de ffprobe quedan listos para el procesamiento
+    audio_path = extractor.finish()
+    video_duration = video_processor.get_video_duration(filepath)
+
+    create_job(
+        job_id, filename, filepath,
+        ingest='stream',
+        audio_path=audio_path,
+        video_duration=video_duration or None
+    )
+
+    return jsonify({
+        'job_id': job_id,
+        'message': 'Video cargado correctamente',
+        'audio_ready': audio_path is not None
+    })
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Crea una sesión de subida reanudable: {filename, size, checksum?}"""
+    if storage_manager.disk_critical():
+        return insufficient_storage_response()
+
+    data = request.get_json() or {}
+    filename = data.get('filename', '')
+
+    if not allowed_file(filename):
+        return jsonify({'error': 'Formato de archivo no permitido'}), 400
+
+    try:
+        meta = chunked_uploads.create(filename, data.get('size'), data.get('checksum'))
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    return jsonify({
+        'upload_id': meta['upload_id'],
+        'size': meta['size'],
+        'chunk_size': meta['chunk_size']
+    }), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_range(upload_id):
+    """Recibe un rango de bytes (cabecera Content-Range), en cualquier orden"""
+    try:
+        received = chunked_uploads.write_range(
+            upload_id,
+            request.headers.get('Content-Range'),
+            request.stream
+        )
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    UPLOAD_BYTES.inc(request.content_length or 0, mode='chunked')
+    return jsonify({'upload_id': upload_id, 'received': received})
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_session_status(upload_id):
+    """Rangos recibidos hasta ahora, para reanudar una subida interrumpida"""
+    try:
+        return jsonify(chunked_uploads.status(upload_id))
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    try:
+        chunked_uploads.abort(upload_id)
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    return jsonify({'message': 'Subida cancelada'})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Verifica que el archivo esté completo y crea el trabajo"""
+    try:
+        filename, filepath = chunked_uploads.finalize(upload_id)
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    # El id de la sesión se reutiliza como id del trabajo
+    create_job(upload_id, filename, filepath, ingest='chunked')
+
+    return jsonify({'job_id': upload_id, 'message': 'Video cargado correctamente'})
+
 @app.route('/api/process/<job_id>', methods=['POST'])
 def process_video(job_id):
-    if job_id not in jobs:
+    job = job_store.get(job_id, include_shorts=False)
+    if job is None:
         return jsonify({'error': 'Trabajo no encontrado'}), 404
-    
-    job = jobs[job_id]
-    
-    if job['status'] == 'processing':
+
+    if job['status'] in ('queued', 'processing'):
         return jsonify({'error': 'El video ya está siendo procesado'}), 400
     
     # Obtener configuración
     data = request.get_json() or {}
-    ai_provider = data.get('ai_provider', os.getenv('AI_PROVIDER', 'openai'))
-    short_duration = data.get('short_duration', 'short')  # 'short' o 'long'
-    split_screen_mode = data.get('split_screen_mode', None)  # None, 'webcam_corner', 'auto'
-    auto_publish_tiktok = data.get('auto_publish_tiktok', False)  # Auto publicar en TikTok
-    viral_text_language = data.get('viral_text_language', 'auto')  # 'auto', 'es', 'en'
-
-    # Iniciar procesamiento en segundo plano
-    thread = threading.Thread(
-        target=process_video_background,
-        args=(job_id, ai_provider, short_duration, split_screen_mode, auto_publish_tiktok, viral_text_language)
-    )
-    thread.daemon = True
-    thread.start()
+    priority = data.get('priority', 0)
+    if isinstance(priority, bool):
+        return jsonify({'error': 'priority debe ser un número entero'}), 400
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority debe ser un número entero'}), 400
+    priority = max(MIN_PRIORITY, min(MAX_PRIORITY, priority))
+
+    options = {
+        'ai_provider': data.get('ai_provider', os.getenv('AI_PROVIDER', 'openai')),
+        'short_duration': data.get('short_duration', 'short'),  # 'short' o 'long'
+        'split_screen_mode': data.get('split_screen_mode', None),  # None, 'webcam_corner', 'auto'
+        'auto_publish_tiktok': data.get('auto_publish_tiktok', False),  # Auto publicar en TikTok
+        'viral_text_language': data.get('viral_text_language', 'auto')  # 'auto', 'es', 'en'
+    }
 
-    return jsonify({'message': 'Procesamiento iniciado', 'job_id': job_id})
+    # Encolar en el planificador (limita los pipelines simultáneos)
+    try:
+        position = job_scheduler.submit(job_id, options, priority=priority)
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    return jsonify({'message': 'Procesamiento en cola', 'job_id': job_id, 'queue_position': position})
+
+@app.route('/api/process/<job_id>/resume', methods=['POST'])
+def resume_processing(job_id):
+    """
+    Vuelve a encolar un trabajo fallido o cancelado con sus opciones
+    originales. Las etapas ya terminadas (audio, transcripción, momentos,
+    shorts) se reutilizan desde sus checkpoints.
+    """
+    job = job_store.get(job_id, include_shorts=False)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+
+    if job['status'] not in ('error', 'cancelled') or not job.get('options'):
+        return jsonify({'error': 'Sólo se pueden reanudar trabajos fallidos o cancelados'}), 409
+
+    try:
+        position = job_scheduler.submit(job_id, job['options'], priority=job.get('priority') or 0)
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    return jsonify({'message': 'Reanudación en cola', 'job_id': job_id, 'queue_position': position})
+
+def queue_full_response(error):
+    """Respuesta 429 con Retry-After cuando la cola está llena"""
+    response = jsonify({
+        'error': 'Hay demasiados trabajos en cola, intenta más tarde',
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@app.route('/api/process/<job_id>', methods=['DELETE'])
+def cancel_processing(job_id):
+    """Cancela un trabajo en cola o en proceso (los shorts ya generados se conservan)"""
+    if not job_store.exists(job_id):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
 
-def process_video_background(job_id, ai_provider, short_duration, split_screen_mode=None, auto_publish_tiktok=False, viral_text_language='auto'):
+    result = job_scheduler.cancel(job_id)
+    if result is None:
+        return jsonify({'error': 'El trabajo no está en cola ni en proceso'}), 409
+    if result == 'cancelled':
+        return jsonify({'message': 'Trabajo cancelado', 'job_id': job_id, 'status': 'cancelled'})
+    return jsonify({'message': 'Cancelando trabajo...', 'job_id': job_id, 'status': 'cancelling'}), 202
+
+def run_job(job_id, options, context):
+    """Punto de entrada del planificador para ejecutar un trabajo"""
+    process_video_background(job_id, context=context, **options)
+
+def process_video_background(job_id, ai_provider, short_duration, split_screen_mode=None, auto_publish_tiktok=False, viral_text_language='auto', context=None):
+    # Sin planificador (llamada directa) el trabajo no se puede cancelar
+    context = context or JobContext(job_id)
+    context.tracer = Tracer(job_id, trace_path(job_id))
+    job_span = context.tracer.begin('job', 'job', ai_provider=ai_provider, short_duration=short_duration)
+    shorts = []
     try:
-        job = jobs[job_id]
-        job['status'] = 'processing'
-        job['progress'] = 5
-        job['message'] = 'Inicializando procesamiento...'
+        job = job_store.get(job_id, include_shorts=False)
+        job_store.update(job_id, status='processing', progress=5, message='Inicializando procesamiento...')
+        # Un trabajo reanudado suma el uso de sus ejecuciones anteriores
+        context.usage.merge(job.get('usage'))
         
         # Inicializar procesadores
-        video_processor = VideoProcessor(app.config['TEMP_FOLDER'])
-        ai_analyzer = AIAnalyzer(ai_provider)
+        job_dir = storage_manager.job_dir(job_id)
+        context.usage.watch_disk(job_dir)
+        video_processor = VideoProcessor(job_dir, context)
+        ai_analyzer = AIAnalyzer(ai_provider, context)
         
-        # Extraer audio y transcribir
-        job['progress'] = 10
-        job['message'] = 'Extrayendo audio del video...'
+        # Artefactos de ejecuciones anteriores (reanudación tras un fallo)
+        checkpoint = JobCheckpoint(job_dir)
+
+        # Ingesta: audio y volumen con una sola lectura del original (sin decodificar el video)
+        job_store.update(job_id, progress=10, message='Extrayendo audio del video...')
         
-        audio_path = video_processor.extract_audio(job['filepath'])
+        ingest = checkpoint.load('ingest')
+        if ingest is not None:
+            print(f"♻️  Ingesta ya realizada: {ingest['audio_path']}")
+        else:
+            # Reutilizar el audio extraído durante la subida si está disponible
+            upload_audio_path = job.get('audio_path')
+            reuse_audio = bool(upload_audio_path and os.path.exists(upload_audio_path))
+            if reuse_audio:
+                print(f"♻️  Usando audio extraído durante la subida: {upload_audio_path}")
+
+            ingest = video_processor.ingest(job['filepath'], extract_audio=not reuse_audio)
+
+            if reuse_audio:
+                # Mover el audio a la carpeta del trabajo para que sobreviva a un reinicio
+                ingest['audio_path'] = checkpoint.path('audio' + os.path.splitext(upload_audio_path)[1])
+                os.replace(upload_audio_path, ingest['audio_path'])
+            if ingest['audio_path'] is None:
+                raise Exception("El video no tiene pista de audio")
+
+            files = [path for path in [ingest['audio_path'], ingest['pcm_path']] if path]
+            checkpoint.save('ingest', ingest, files=files)
+            job_store.update(job_id, video_width=ingest['width'], video_height=ingest['height'])
+        audio_path = ingest['audio_path']
         
-        job['progress'] = 20
-        job['message'] = 'Transcribiendo audio...'
+        job_store.update(job_id, progress=20, message='Transcribiendo audio...')
         
-        transcript = ai_analyzer.transcribe_audio(audio_path)
+        transcript = checkpoint.load('transcript')
+        if transcript is not None:
+            print("♻️  Transcripción ya disponible, se reutiliza")
+        else:
+            with STAGE_DURATION.time(stage='transcribe'), span(context, 'transcribe', 'stage'):
+                transcript = ai_analyzer.transcribe_audio(audio_path, ingest.get('audio_bitrate'))
+            checkpoint.save('transcript', transcript)
         
         # Analizar contenido y encontrar momentos relevantes
-        job['progress'] = 40
-        job['message'] = 'Analizando contenido y buscando momentos destacados...'
+        job_store.update(job_id, progress=40, message='Analizando contenido y buscando momentos destacados...')
         
-        video_duration = video_processor.get_video_duration(job['filepath'])
+        video_duration = (job.get('video_duration') or ingest['duration'] or
+                          video_processor.get_video_duration(job['filepath']))
         
         # Pasar short_duration al analizador
-        moments = ai_analyzer.find_viral_moments(transcript, video_duration, short_duration)
+        moments_params = {'ai_provider': ai_provider, 'short_duration': short_duration}
+        moments = checkpoint.load('moments', moments_params)
+        if moments is not None:
+            print(f"♻️  {len(moments)} momentos ya analizados, se reutilizan")
+        else:
+            # Videos largos: preselección local de ventanas para no enviar horas de transcripción a la IA
+            candidates = None
+            if video_duration >= MIN_DURATION_FOR_RANKING:
+                try:
+                    with STAGE_DURATION.time(stage='prerank'), span(context, 'prerank', 'stage'):
+                        candidates = MomentRanker(context).rank(
+                            transcript, video_duration, ingest.get('pcm_path'), audio_path
+                        )
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    # La preselección es una optimización: sin ella la IA recibe la transcripción completa
+                    print(f"⚠️  Error en la preselección de momentos, se usa la transcripción completa: {e}")
+                    candidates = None
+            with STAGE_DURATION.time(stage='find_viral_moments'), span(context, 'find_viral_moments', 'stage'):
+                moments = ai_analyzer.find_viral_moments(transcript, video_duration, short_duration, candidates)
+            checkpoint.save('moments', moments, moments_params)
         
+        # Modo split screen automático: ubicar la cámara en unos pocos keyframes del original
+        webcam_region = None
+        if split_screen_mode == 'auto':
+            webcam = checkpoint.load('webcam')
+            if webcam is None:
+                with STAGE_DURATION.time(stage='webcam_detection'), span(context, 'webcam_detection', 'stage'):
+                    posters = video_processor.extract_posters(job['filepath'], video_duration)
+                    region = WebcamDetector(context).detect(posters, ingest['width'], ingest['height'])
+                for path in posters:
+                    os.remove(path)
+                webcam = {'region': region}
+                checkpoint.save('webcam', webcam)
+                if region:
+                    print(f"🎯 Cámara detectada en {region['width']}x{region['height']} desde ({region['x']},{region['y']}) "
+                          f"(puntaje {region['score']})")
+                else:
+                    print("⚠️  No se detectó la cámara, se usa la región por defecto")
+            webcam_region = webcam['region']
+
         # Crear shorts
-        job['progress'] = 50
-        job['message'] = f'Generando {len(moments)} shorts...'
+        job_store.update(job_id, progress=50, message=f'Generando {len(moments)} shorts...', failed_shorts=[])
+
+        def short_checkpoint_params(moment):
+            """Parámetros que determinan un short (checkpoint short_N)"""
+            return {
+                'moment': moment,
+                'split_screen_mode': split_screen_mode,
+                'viral_text_language': viral_text_language
+            }
+
+        # Los shorts de una ejecución anterior sólo se conservan si esta los
+        # reutiliza desde su checkpoint; los demás (otros momentos, menos
+        # shorts) no los produjo esta ejecución
+        reusable = [i + 1 for i, moment in enumerate(moments)
+                    if checkpoint.load(f'short_{i+1}', short_checkpoint_params(moment)) is not None]
+        removed = job_store.clear_shorts(job_id, keep=reusable)
+        if removed:
+            print(f"🧹 {removed} shorts de una ejecución anterior descartados")
         
         shorts = []
-        for i, moment in enumerate(moments):
-            progress = 50 + (40 * (i + 1) / len(moments))
-            job['progress'] = int(progress)
-            job['message'] = f'Creando short {i+1} de {len(moments)}...'
-            
-            # Generar subtítulos
-            subtitles = ai_analyzer.generate_subtitles(
-                transcript,
-                moment['start_time'],
-                moment['end_time']
-            )
+        render_tasks = []
+        if render_queue is not None:
+            context.on_cancel(lambda: render_queue.cancel_job(job_id))
+
+        def publish_short(short):
+            """Hace visible un short terminado (estado del trabajo y evento SSE 'short')"""
+            short.setdefault('download_url', f"/api/download/{short['filename']}")
+            shorts.append(short)
+            job_store.add_short(job_id, short)
+
+        failed_shorts = []
+
+        def fail_short(short, error):
+            """
+            Un short cuyo render se colgó (watchdog) o falló en los workers se
+            marca fallido y el trabajo sigue con los demás. Sin checkpoint:
+            al reanudar el trabajo se vuelve a intentar.
+            """
+            print(f"❌ Short {short['id']} fallido: {error}")
+            # Si otra ejecución ya lo había generado, su fila apunta al archivo anterior
+            job_store.delete_short(job_id, short['id'])
+            failed_shorts.append({**short, 'error': str(error)[:500]})
+            job_store.update(job_id, failed_shorts=failed_shorts)
+
+        # Los momentos más valiosos primero: el mejor short se puede revisar
+        # mientras se renderizan los demás. El id del short sigue el orden
+        # cronológico (nombres de archivo y checkpoints).
+        render_order = sorted(range(len(moments)), key=lambda i: moments[i].get('score', 0), reverse=True)
+        for position, i in enumerate(render_order):
+            moment = moments[i]
+            context.check_cancelled()
+            progress = 50 + (40 * (position + 1) / len(moments))
+            job_store.update(job_id, progress=int(progress), message=f'Creando short {position+1} de {len(moments)}...')
+            with span(context, f'short {i+1}', 'short', start_time=moment['start_time'], end_time=moment['end_time'],
+                      score=moment.get('score')):
+                output_filename = f"short_{job_id}_{i+1}.mp4"
+                output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+
+                # Short ya generado en una ejecución anterior
+                short_params = short_checkpoint_params(moment)
+                short = checkpoint.load(f'short_{i+1}', short_params)
+                if short is not None:
+                    print(f"♻️  Short {i+1} ya generado, se reutiliza")
+                    publish_short(short)
+                    continue
+
+                subtitle_params = {'moment': moment, 'viral_text_language': viral_text_language}
+                short_inputs = checkpoint.load(f'subtitles_{i+1}', subtitle_params)
+                if short_inputs is not None:
+                    subtitles = short_inputs['subtitles']
+                    viral_text = short_inputs['viral_text']
+                else:
+                    # Generar subtítulos
+                    subtitles = ai_analyzer.generate_subtitles(
+                        transcript,
+                        moment['start_time'],
+                        moment['end_time']
+                    )
             
-            # Crear short con subtítulos
-            output_filename = f"short_{job_id}_{i+1}.mp4"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-
-            # Extraer texto viral DIRECTAMENTE de la transcripción del segmento
-            viral_text = None
-
-            # Función para extraer el texto real del segmento temporal
-            def extract_segment_text(transcript, start_time, end_time):
-                """Extrae el texto completo del segmento temporal de la transcripción"""
-                segment_text = ""
-                for seg in transcript['segments']:
-                    seg_start = seg.get('start', 0)
-                    seg_end = seg.get('end', 0)
-
-                    # Si el segmento está dentro del rango del momento
-                    if (seg_start >= start_time and seg_start < end_time) or \
-                       (seg_end > start_time and seg_end <= end_time) or \
-                       (seg_start <= start_time and seg_end >= end_time):
-                        text = seg.get('text', '').strip()
-                        if text:
-                            segment_text += " " + text
-
-                return segment_text.strip() if segment_text else None
-
-            def generate_viral_title(segment_text, language='auto'):
-                """Genera un título viral usando IA basado en el contenido del segmento"""
-                if not segment_text:
-                    return None
-
-                try:
-                    from openai import OpenAI
-                    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-                    # Configurar idioma del prompt
-                    language_instruction = ""
-                    if language == 'es':
-                        language_instruction = "- El título DEBE estar en ESPAÑOL."
-                    elif language == 'en':
-                        language_instruction = "- El título DEBE estar en INGLÉS (English)."
-                    else:  # auto
-                        language_instruction = "- Detecta el idioma del contenido y usa ese mismo idioma para el título."
 
-                    prompt = f"""Analiza el siguiente fragmento de un video y crea un título viral de MÁXIMO 8 PALABRAS.
+                    # Extraer texto viral DIRECTAMENTE de la transcripción del segmento
+                    viral_text = None
+
+                    # Función para extraer el texto real del segmento temporal
+                    def extract_segment_text(transcript, start_time, end_time):
+                        """Extrae el texto completo del segmento temporal de la transcripción"""
+                        segment_text = ""
+                        for seg in transcript['segments']:
+                            seg_start = seg.get('start', 0)
+                            seg_end = seg.get('end', 0)
+
+                            # Si el segmento está dentro del rango del momento
+                            if (seg_start >= start_time and seg_start < end_time) or \
+                               (seg_end > start_time and seg_end <= end_time) or \
+                               (seg_start <= start_time and seg_end >= end_time):
+                                text = seg.get('text', '').strip()
+                                if text:
+                                    segment_text += " " + text
+
+                        return segment_text.strip() if segment_text else None
+
+                    def generate_viral_title(segment_text, language='auto'):
+                        """Genera un título viral usando IA basado en el contenido del segmento"""
+                        if not segment_text:
+                            return None
+
+                        try:
+                            from openai import OpenAI
+                            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+                            # Configurar idioma del prompt
+                            language_instruction = ""
+                            if language == 'es':
+                                language_instruction = "- El título DEBE estar en ESPAÑOL."
+                            elif language == 'en':
+                                language_instruction = "- El título DEBE estar en INGLÉS (English)."
+                            else:  # auto
+                                language_instruction = "- Detecta el idioma del contenido y usa ese mismo idioma para el título."
+
+                            prompt = f"""Analiza el siguiente fragmento de un video y crea un título viral de MÁXIMO 8 PALABRAS.
 
 CONTENIDO DEL VIDEO:
 "{segment_text}"
@@ -230,182 +721,287 @@ EJEMPLOS DE TÍTULOS SEGÚN EL TONO:
 
 Responde SOLO con el título, sin explicaciones ni comillas."""
 
-                    response = client.chat.completions.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": "Eres un experto en crear títulos virales para redes sociales. Te adaptas perfectamente al tono y lenguaje del contenido original."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=50,
-                        temperature=0.7
+                            with ai_request('openai', 'title'), span(context, 'title', 'ai', provider='openai'):
+                                response = client.chat.completions.create(
+                                    model="gpt-3.5-turbo",
+                                    messages=[
+                                        {"role": "system", "content": "Eres un experto en crear títulos virales para redes sociales. Te adaptas perfectamente al tono y lenguaje del contenido original."},
+                                        {"role": "user", "content": prompt}
+                                    ],
+                                    max_tokens=50,
+                                    temperature=0.7
+                                )
+                            context.usage.add_response("gpt-3.5-turbo", response)
+
+                            title = response.choices[0].message.content.strip()
+                            # Limpiar comillas si las agregó
+                            title = title.strip('"').strip("'")
+
+                            # Dividir en dos líneas si tiene más de 4 palabras
+                            words = title.split()
+                            if len(words) > 4:
+                                mid_point = len(words) // 2
+                                line1 = " ".join(words[:mid_point])
+                                line2 = " ".join(words[mid_point:])
+                                title = f"{line1}\n{line2}"
+
+                            return title
+
+                        except Exception as e:
+                            print(f"⚠️  Error generando título viral: {str(e)}")
+                            return None
+
+                    # Extraer texto completo del segmento
+                    segment_text = extract_segment_text(transcript, moment['start_time'], moment['end_time'])
+
+                    # Generar título viral con IA
+                    viral_text = None
+                    if segment_text:
+                        print(f"📝 Contenido del segmento ({moment['start_time']}s - {moment['end_time']}s):")
+                        print(f"   '{segment_text[:100]}...'")
+                        context.check_cancelled()
+                        with STAGE_DURATION.time(stage='title_generation'), span(context, 'title_generation', 'stage'):
+                            viral_text = generate_viral_title(segment_text, viral_text_language)
+
+                    if viral_text:
+                        print(f"📝 Texto viral extraído del segmento ({moment['start_time']}s - {moment['end_time']}s): '{viral_text}'")
+                    else:
+                        print(f"⚠️  No se pudo extraer texto del segmento, usando fallback...")
+
+                    # Fallback a key_phrases si no se pudo extraer texto
+                    if not viral_text:
+                        if moment.get('key_phrases') and len(moment['key_phrases']) > 0:
+                            viral_text = moment['key_phrases'][0]
+                            print(f"   Usando key_phrase: '{viral_text}'")
+                        elif moment.get('title'):
+                            viral_text = moment['title']
+                            print(f"   Usando título: '{viral_text}'")
+
+                    checkpoint.save(
+                        f'subtitles_{i+1}',
+                        {'subtitles': subtitles, 'viral_text': viral_text},
+                        subtitle_params
                     )
 
-                    title = response.choices[0].message.content.strip()
-                    # Limpiar comillas si las agregó
-                    title = title.strip('"').strip("'")
-
-                    # Dividir en dos líneas si tiene más de 4 palabras
-                    words = title.split()
-                    if len(words) > 4:
-                        mid_point = len(words) // 2
-                        line1 = " ".join(words[:mid_point])
-                        line2 = " ".join(words[mid_point:])
-                        title = f"{line1}\n{line2}"
+                # Crear short con subtítulos
+                render_args = {
+                    'input_video': job['filepath'],
+                    'output_path': output_path,
+                    'start_time': moment['start_time'],
+                    'end_time': moment['end_time'],
+                    'subtitles': subtitles,
+                    'split_screen_mode': split_screen_mode,
+                    'viral_text': viral_text,
+                    # Pistas del original de la ingesta: el render no vuelve a consultar ffprobe
+                    'video_info': ingest.get('source') if ingest['width'] else None,
+                    'webcam_region': webcam_region
+                }
+                short = {
+                    'id': i + 1,
+                    'filename': output_filename,
+                    'title': moment['title'],
+                    'description': moment['description'],
+                    'start_time': moment['start_time'],
+                    'end_time': moment['end_time'],
+                    'duration': moment['end_time'] - moment['start_time'],
+                    'relevance_score': moment['score'],
+                    'instagram_copy': moment.get('instagram_copy', ''),
+                    'download_url': f"/api/download/{output_filename}"
+                }
 
-                    return title
+                if render_queue is not None:
+                    # Modo distribuido: el render lo hace un worker; se espera después del bucle
+                    task_id = render_queue.submit(job_id, i + 1, render_args)
+                    render_tasks.append((task_id, short, short_params, output_path))
+                    continue
 
-                except Exception as e:
-                    print(f"⚠️  Error generando título viral: {str(e)}")
-                    return None
-
-            # Extraer texto completo del segmento
-            segment_text = extract_segment_text(transcript, moment['start_time'], moment['end_time'])
-
-            # Generar título viral con IA
-            viral_text = None
-            if segment_text:
-                print(f"📝 Contenido del segmento ({moment['start_time']}s - {moment['end_time']}s):")
-                print(f"   '{segment_text[:100]}...'")
-                viral_text = generate_viral_title(segment_text, viral_text_language)
-
-            if viral_text:
-                print(f"📝 Texto viral extraído del segmento ({moment['start_time']}s - {moment['end_time']}s): '{viral_text}'")
-            else:
-                print(f"⚠️  No se pudo extraer texto del segmento, usando fallback...")
-
-            # Fallback a key_phrases si no se pudo extraer texto
-            if not viral_text:
-                if moment.get('key_phrases') and len(moment['key_phrases']) > 0:
-                    viral_text = moment['key_phrases'][0]
-                    print(f"   Usando key_phrase: '{viral_text}'")
-                elif moment.get('title'):
-                    viral_text = moment['title']
-                    print(f"   Usando título: '{viral_text}'")
-
-            video_processor.create_short(
-                job['filepath'],
-                output_path,
-                moment['start_time'],
-                moment['end_time'],
-                subtitles,
-                split_screen_mode,
-                viral_text
-            )
-            
-            shorts.append({
-                'id': i + 1,
-                'filename': output_filename,
-                'title': moment['title'],
-                'description': moment['description'],
-                'start_time': moment['start_time'],
-                'end_time': moment['end_time'],
-                'duration': moment['end_time'] - moment['start_time'],
-                'relevance_score': moment['score'],
-                'instagram_copy': moment.get('instagram_copy', '')
-            })
+                try:
+                    video_processor.create_short(**render_args)
+                except ProcessStalled as e:
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                    fail_short(short, e)
+                    continue
+                checkpoint.save(f'short_{i+1}', short, short_params, files=[output_path])
+                publish_short(short)
+
+        # Esperar los renders de los workers (en orden de puntaje)
+        for done, (task_id, short, short_params, output_path) in enumerate(render_tasks):
+            job_store.update(job_id, message=f'Esperando renders ({done} de {len(render_tasks)} listos)...')
+            try:
+                with span(context, f"wait_render short {short['id']}", 'render_queue', task_id=task_id):
+                    result = render_queue.wait(task_id, context)
+            except RenderError as e:
+                # El worker ya agotó sus reintentos con este short
+                fail_short(short, e)
+                continue
+            # CPU y memoria del render en el worker
+            context.usage.merge(result.get('usage'))
+            checkpoint.save(f"short_{short['id']}", short, short_params, files=[output_path])
+            publish_short(short)
         
-        # Publicar en TikTok si está activado
+        # Publicar en TikTok si está activado: se encola y el trabajo termina
+        # sin esperar; el publicador (publish_queue.py) sube los shorts al
+        # ritmo de la cuenta, en orden de puntaje
         if auto_publish_tiktok:
-            job['progress'] = 90
-            job['message'] = 'Publicando en TikTok...'
-
-            try:
-                from tiktok_uploader import TikTokUploader
-
-                # Credenciales de TikTok desde variables de entorno
-                tiktok_username = os.getenv('TIKTOK_USERNAME', 'stiffclipss')
-                tiktok_password = os.getenv('TIKTOK_PASSWORD', 'password')
-
-                print(f"🎵 Publicando {len(shorts)} shorts en TikTok...")
-                print("⚠️  Se abrirá una ventana de Chrome para la subida semi-automática")
-
-                with TikTokUploader(tiktok_username, tiktok_password, headless=False) as uploader:
-                    if uploader.login():
-                        for i, short in enumerate(shorts):
-                            video_path = os.path.join(app.config['OUTPUT_FOLDER'], short['filename'])
-
-                            # Usar el título y descripción generados por la IA
-                            caption = short['title']
-                            hashtags = ['viral', 'fyp', 'shorts', 'tiktok']
-
-                            # Si hay copy de Instagram, usarlo como base
-                            if short.get('instagram_copy'):
-                                # Extraer hashtags del copy
-                                copy_lines = short['instagram_copy'].split('\n')
-                                for line in copy_lines:
-                                    if line.strip().startswith('#'):
-                                        tags = line.strip().split()
-                                        hashtags.extend([tag.replace('#', '') for tag in tags if tag.startswith('#')])
-
-                            # Eliminar duplicados
-                            hashtags = list(dict.fromkeys(hashtags))[:5]  # Máximo 5 hashtags
-
-                            print(f"   📤 Publicando short {i+1}/{len(shorts)}: {short['title']}")
-                            success = uploader.upload_video(video_path, caption, hashtags)
-
-                            if success:
-                                short['tiktok_published'] = True
-                                print(f"   ✅ Short {i+1} publicado en TikTok")
-                            else:
-                                short['tiktok_published'] = False
-                                print(f"   ⚠️  Error publicando short {i+1}")
-
-                            # Esperar entre publicaciones
-                            if i < len(shorts) - 1:
-                                time.sleep(30)
-
-                        print("✅ Todos los shorts han sido publicados en TikTok")
-                    else:
-                        print("❌ No se pudo iniciar sesión en TikTok")
-
-            except Exception as e:
-                print(f"⚠️  Error publicando en TikTok: {e}")
-                import traceback
-                traceback.print_exc()
+            job_store.update(job_id, progress=90, message='Encolando publicaciones en TikTok...')
+            tiktok_username, _ = tiktok_credentials()
+            for short in shorts:
+                # Usar el título y descripción generados por la IA
+                hashtags = ['viral', 'fyp', 'shorts', 'tiktok']
+
+                # Si hay copy de Instagram, usarlo como base
+                if short.get('instagram_copy'):
+                    # Extraer hashtags del copy
+                    copy_lines = short['instagram_copy'].split('\n')
+                    for line in copy_lines:
+                        if line.strip().startswith('#'):
+                            tags = line.strip().split()
+                            hashtags.extend([tag.replace('#', '') for tag in tags if tag.startswith('#')])
+
+                # Eliminar duplicados
+                hashtags = list(dict.fromkeys(hashtags))[:5]  # Máximo 5 hashtags
+
+                publish_queue.enqueue(job_id, short['id'], tiktok_username, {
+                    'video_path': os.path.join(app.config['OUTPUT_FOLDER'], short['filename']),
+                    'caption': short['title'],
+                    'hashtags': hashtags
+                })
+                short['publish_status'] = 'queued'
+                job_store.update_short(job_id, short['id'], publish_status='queued')
+            print(f"🎵 {len(shorts)} shorts encolados para publicar en TikTok")
 
         # Limpiar archivos temporales
-        job['progress'] = 95
-        job['message'] = 'Finalizando...'
+        job_store.update(job_id, progress=95, message='Finalizando...')
 
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            print(f"🧹 Archivo de audio temporal eliminado")
-
-        # Limpiar archivos huérfanos en uploads (archivos de audio que no deberían estar ahí)
-        try:
-            for file in os.listdir(app.config['UPLOAD_FOLDER']):
-                if file.endswith('.mp3'):
-                    orphan_path = os.path.join(app.config['UPLOAD_FOLDER'], file)
-                    os.remove(orphan_path)
-                    print(f"🧹 Archivo huérfano eliminado: {file}")
-        except Exception as e:
-            print(f"⚠️  No se pudieron limpiar archivos huérfanos: {e}")
+        # Los checkpoints (incluido el audio) sólo sirven para reanudar
+        checkpoint.clear()
+        print(f"🧹 Archivos temporales del trabajo eliminados")
 
         # Completar trabajo
-        job['status'] = 'completed'
-        job['progress'] = 100
-
-        published_count = sum(1 for s in shorts if s.get('tiktok_published', False))
-        if auto_publish_tiktok and published_count > 0:
-            job['message'] = f'¡Completado! {len(shorts)} shorts generados y {published_count} publicados en TikTok'
+        queued_count = sum(1 for s in shorts if s.get('publish_status') == 'queued')
+        if auto_publish_tiktok and queued_count > 0:
+            message = f'¡Completado! {len(shorts)} shorts generados y {queued_count} en cola para TikTok'
         else:
-            job['message'] = f'¡Completado! {len(shorts)} shorts generados'
+            message = f'¡Completado! {len(shorts)} shorts generados'
+        if failed_shorts:
+            message += f' ({len(failed_shorts)} fallidos)'
 
-        job['shorts'] = shorts
+        # Los shorts ya se guardaron a medida que terminaban (publish_short)
+        job_store.update(job_id, status='completed', progress=100, message=message)
+        job_span.args['status'] = 'completed'
         
     except Exception as e:
-        job['status'] = 'error'
-        job['message'] = f'Error: {str(e)}'
+        # Un error provocado por la cancelación (proceso terminado, cliente
+        # HTTP cerrado) también cuenta como cancelación
+        if isinstance(e, JobCancelled) or context.cancelled:
+            # Los checkpoints se conservan para poder reanudar el trabajo
+            print(f"🛑 Trabajo {job_id} cancelado con {len(shorts)} shorts generados")
+            job_span.args['status'] = 'cancelled'
+            job_store.update(
+                job_id,
+                status='cancelled',
+                message=f'Cancelado ({len(shorts)} shorts generados)'
+            )
+            return
+
+        # Que los workers no sigan renderizando shorts de un trabajo fallido
+        if render_queue is not None:
+            render_queue.cancel_job(job_id)
+
+        job_span.args.update(status='error', error=str(e)[:200])
+        job_store.update(job_id, status='error', message=f'Error: {str(e)}')
         print(f"Error procesando video {job_id}: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        context.usage.stop_watching()
+        job_store.update(job_id, usage=context.usage.to_dict())
+        job_span.end(shorts=len(shorts))
+        try:
+            context.tracer.save()
+        except OSError as e:
+            print(f"⚠️  No se pudo guardar la traza del trabajo {job_id}: {e}")
 
 @app.route('/api/status/<job_id>')
 def get_status(job_id):
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+
+    if job['status'] == 'queued':
+        job.update(job_scheduler.queue_info(job_id) or {})
+
+    return jsonify(job)
+
+def format_sse(event_type, data, event_id=None):
+    """Serializa un evento en formato Server-Sent Events"""
+    message = f"event: {event_type}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
+@app.route('/api/events/<job_id>')
+def job_events(job_id):
+    """
+    Stream SSE con el progreso de un trabajo
+
+    Eventos:
+        snapshot: estado completo al conectar (sin Last-Event-ID)
+        progress: cambios de status / progress / message
+        short: cada short terminado
+        done: estado final ('completed' o 'error'); el stream se cierra
+
+    Al reconectar, EventSource envía Last-Event-ID y se retoma desde ahí.
+    """
+    job = job_store.get(job_id)
+    if job is None:
         return jsonify({'error': 'Trabajo no encontrado'}), 404
-    
-    return jsonify(jobs[job_id])
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+    def generate():
+        yield "retry: 3000\n\n"
+
+        if last_event_id is None:
+            after_id = job_store.last_event_id(job_id)
+            yield format_sse('snapshot', {
+                'status': job['status'],
+                'progress': job['progress'],
+                'message': job['message'],
+                'shorts': job['shorts']
+            }, after_id)
+            if job['status'] in TERMINAL_STATUSES:
+                yield format_sse('done', {'status': job['status'], 'message': job['message']}, after_id)
+                return
+        else:
+            try:
+                after_id = int(last_event_id)
+            except ValueError:
+                after_id = 0
+
+        while True:
+            events = job_store.wait_for_events(job_id, after_id, SSE_HEARTBEAT_INTERVAL)
+            if not events:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ": heartbeat\n\n"
+                continue
+
+            for event in events:
+                after_id = event['id']
+                yield format_sse(event['type'], event['data'], event['id'])
+                if event['type'] == 'done':
+                    return
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/api/download/<filename>')
 def download_file(filename):
@@ -413,12 +1009,213 @@ def download_file(filename):
     
     if not os.path.exists(filepath):
         return jsonify({'error': 'Archivo no encontrado'}), 404
+
+    # Orden LRU del gestor de disco
+    match = OUTPUT_NAME_RE.match(filename)
+    if match:
+        job_store.touch_access(match.group(1))
     
     return send_file(filepath, as_attachment=True)
 
+@app.route('/api/download/job/<job_id>')
+def download_job_zip(job_id):
+    """
+    Descarga todos los shorts de un trabajo en un ZIP generado al vuelo,
+    junto con un manifest.json con títulos, copies y timestamps
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+
+    shorts = [
+        short for short in job.get('shorts', [])
+        if os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], short['filename']))
+    ]
+    if not shorts:
+        return jsonify({'error': 'El trabajo no tiene shorts para descargar'}), 404
+
+    job_store.touch_access(job_id)
+
+    manifest = {
+        'job_id': job_id,
+        'source_filename': job['filename'],
+        'created_at': job['created_at'],
+        'shorts': shorts
+    }
+
+    def zip_entries():
+        yield 'manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        for short in shorts:
+            yield short['filename'], os.path.join(app.config['OUTPUT_FOLDER'], short['filename'])
+
+    return Response(
+        stream_with_context(stream_zip(zip_entries())),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename=shorts_{job_id}.zip',
+            # Evitar que un proxy acumule la respuesta antes de enviarla
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/storage')
+def storage_status():
+    """Uso de disco por área, cuotas, presión y resultado de la última limpieza"""
+    return jsonify(storage_manager.report())
+
+@app.route('/api/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """
+    Traza del trabajo en formato Chrome trace (abrir en chrome://tracing o
+    https://ui.perfetto.dev). Si el trabajo corre en este proceso se exporta
+    la traza en curso; si no, la guardada al terminar su última ejecución.
+    """
+    if job_store.get(job_id, include_shorts=False) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+
+    context = job_scheduler.running_context(job_id)
+    if context is not None and context.tracer is not None:
+        trace = context.tracer.export()
+    elif os.path.exists(trace_path(job_id)):
+        with open(trace_path(job_id), 'r', encoding='utf-8') as f:
+            trace = json.load(f)
+    else:
+        return jsonify({'error': 'El trabajo no tiene traza todavía'}), 404
+
+    return Response(
+        json.dumps(trace, ensure_ascii=False),
+        mimetype='application/json',
+        headers={'Content-Disposition': f'attachment; filename=trace_{job_id}.json'}
+    )
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato Prometheus (todos los procesos que comparten data/metrics)"""
+    # La profundidad de la cola sale de la base de datos compartida
+    for status in ('queued', 'processing'):
+        JOBS_BY_STATUS.set(job_store.count_by_status(status), status=status)
+    return Response(REGISTRY.render(local_metrics=[JOBS_BY_STATUS]), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/jobs/<job_id>/publish')
+def get_publish_status(job_id):
+    """Estado de las publicaciones encoladas de un trabajo (una por short y cuenta)"""
+    if job_store.get(job_id, include_shorts=False) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    tasks = [{
+        'short_id': task['short_id'],
+        'platform': task['platform'],
+        'account': task['account'],
+        'status': task['status'],
+        'attempts': task['attempts'],
+        'error': task['error'],
+        'not_before': datetime.fromtimestamp(task['not_before']).isoformat(),
+        'finished_at': datetime.fromtimestamp(task['finished_at']).isoformat() if task['finished_at'] else None
+    } for task in publish_queue.tasks_for_job(job_id)]
+    return jsonify({'job_id': job_id, 'publications': tasks})
+
+@app.route('/api/jobs/<job_id>/publish', methods=['DELETE'])
+def cancel_publish(job_id):
+    """Cancela las publicaciones pendientes de un trabajo"""
+    if job_store.get(job_id, include_shorts=False) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    cancelled = publish_queue.cancel_job(job_id)
+    for task in publish_queue.tasks_for_job(job_id):
+        if task['status'] == 'cancelled':
+            job_store.update_short(job_id, task['short_id'], publish_status='cancelled')
+    return jsonify({'job_id': job_id, 'cancelled': cancelled})
+
+def date_param(name):
+    """
+    Parámetro de fecha ISO 8601 normalizado al formato de created_at (hora
+    local sin zona, 'YYYY-MM-DDTHH:MM:SS'), para compararlo como texto en SQLite.
+    Una fecha con zona horaria se convierte a la hora local.
+
+    Raises:
+        ValueError si el valor no es una fecha ISO 8601 válida
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        raise ValueError(f"'{name}' debe ser una fecha ISO 8601 ({value})")
+    return moment.isoformat()
+
 @app.route('/api/jobs')
 def list_jobs():
-    return jsonify(list(jobs.values()))
+    """
+    Lista paginada de trabajos
+
+    Query params:
+        status: Estados separados por coma (ej. processing,completed)
+        from / to: Rango de fechas de creación en ISO 8601
+        cursor: Cursor 'next_cursor' de la página anterior
+        limit: Trabajos por página (1-500, por defecto 50)
+        fields: Campos a devolver separados por coma; 'shorts' sólo se incluye si se pide
+    """
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        page, next_cursor = job_store.list_jobs(
+            statuses=statuses,
+            created_from=date_param('from'),
+            created_to=date_param('to'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            fields=fields
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Parámetro inválido: {e}'}), 400
+
+    response = jsonify({'jobs': page, 'next_cursor': next_cursor})
+    # ETag del contenido: si la página no cambió se responde 304 sin cuerpo
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+# Criterios de agrupación de /api/usage
+USAGE_GROUPS = {
+    'provider': lambda record: record['options'].get('ai_provider') or 'desconocido',
+    'extension': lambda record: os.path.splitext(record['filename'] or '')[1].lower().lstrip('.') or 'desconocida',
+    'status': lambda record: record['status'],
+    'day': lambda record: (record['created_at'] or '')[:10]
+}
+
+@app.route('/api/usage')
+def usage_totals():
+    """
+    Recursos consumidos sumando todos los trabajos: CPU y memoria de FFmpeg,
+    disco temporal, minutos de audio, tokens por modelo y costo estimado
+
+    Query params:
+        from / to: Rango de fechas de creación en ISO 8601
+        group_by: provider, extension, status o day (además del total)
+    """
+    group_by = request.args.get('group_by')
+    if group_by and group_by not in USAGE_GROUPS:
+        return jsonify({'error': f"group_by debe ser uno de: {', '.join(USAGE_GROUPS)}"}), 400
+    try:
+        created_from, created_to = date_param('from'), date_param('to')
+    except ValueError as e:
+        return jsonify({'error': f'Parámetro inválido: {e}'}), 400
+
+    records = job_store.usage_records(created_from, created_to)
+    result = {'jobs': len(records), 'total': sum_usage(record['usage'] for record in records)}
+
+    if group_by:
+        groups = {}
+        for record in records:
+            groups.setdefault(USAGE_GROUPS[group_by](record), []).append(record['usage'])
+        result['groups'] = {
+            key: {'jobs': len(usages), **sum_usage(usages)}
+            for key, usages in sorted(groups.items())
+        }
+    return jsonify(result)
 
 # Template HTML (continúa en el siguiente mensaje debido al límite de longitud)
 HTML_TEMPLATE = '''
@@ -665,11 +1462,20 @@ HTML_TEMPLATE = '''
                 <div id="progressMessage" style="text-align: center; color: #666; margin-top: 10px;">
                     Iniciando...
                 </div>
+                <button class="btn" id="cancelBtn" onclick="cancelProcessing()" style="margin-top: 20px; background: #e74c3c;">
+                    🛑 Cancelar
+                </button>
             </div>
             
             <div class="results-section" id="resultsSection">
                 <h2 style="text-align: center; margin-bottom: 20px;">✨ Shorts Generados</h2>
                 <div id="shortsGrid" class="shorts-grid"></div>
+                <button class="btn" onclick="downloadAllShorts()" style="margin-top: 30px; display: block; margin-left: auto; margin-right: auto;">
+                    📦 Descargar Todos (ZIP)
+                </button>
+                <button class="btn" onclick="downloadTrace()" style="margin-top: 30px; display: block; margin-left: auto; margin-right: auto; background: #7f8c8d;">
+                    ⏱️ Descargar traza
+                </button>
                 <button class="btn" onclick="location.reload()" style="margin-top: 30px; display: block; margin-left: auto; margin-right: auto;">
                     🔄 Procesar Otro Video
                 </button>
@@ -740,8 +1546,26 @@ HTML_TEMPLATE = '''
             }
         });
         
+        // Archivos grandes: subida reanudable por rangos con varias conexiones en paralelo
+        const CHUNKED_UPLOAD_THRESHOLD = 512 * 1024 * 1024;
+        const PARALLEL_UPLOADS = 4;
+
+        function onUploadComplete(jobId) {
+            currentJobId = jobId;
+            configSection.style.display = 'block';
+            uploadSection.style.display = 'block';
+            progressSection.style.display = 'none';
+            uploadZone.style.opacity = '0.5';
+            uploadZone.style.pointerEvents = 'none';
+        }
+
         function uploadVideo(file) {
             console.log('🚀 Iniciando subida de:', file.name);
+
+            if (file.size >= CHUNKED_UPLOAD_THRESHOLD) {
+                uploadVideoChunked(file);
+                return;
+            }
             
             const formData = new FormData();
             formData.append('video', file);
@@ -768,12 +1592,7 @@ HTML_TEMPLATE = '''
                         console.log('📦 Respuesta:', response);
                         
                         if (response.job_id) {
-                            currentJobId = response.job_id;
-                            configSection.style.display = 'block';
-                            uploadSection.style.display = 'block';
-                            progressSection.style.display = 'none';
-                            uploadZone.style.opacity = '0.5';
-                            uploadZone.style.pointerEvents = 'none';
+                            onUploadComplete(response.job_id);
                         } else {
                             alert('❌ Error: ' + (response.error || 'Error desconocido'));
                             location.reload();
@@ -797,10 +1616,91 @@ HTML_TEMPLATE = '''
             });
             
             console.log('📡 Enviando petición POST...');
-            xhr.open('POST', '/api/upload', true);
+            xhr.open('POST', '/api/upload?ingest=stream', true);
             xhr.send(formData);
         }
         
+        async function uploadVideoChunked(file) {
+            uploadSection.style.display = 'none';
+            progressSection.style.display = 'block';
+            resultsSection.style.display = 'none';
+
+            // Si se vuelve a elegir el mismo archivo se reanuda la sesión anterior
+            const resumeKey = 'upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+
+            try {
+                let uploadId = localStorage.getItem(resumeKey);
+                let session = null;
+
+                if (uploadId) {
+                    const response = await fetch('/api/uploads/' + uploadId);
+                    if (response.ok) {
+                        session = await response.json();
+                        console.log('♻️ Reanudando subida:', uploadId);
+                    }
+                }
+
+                if (!session) {
+                    const response = await fetch('/api/uploads', {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({filename: file.name, size: file.size})
+                    });
+                    session = await response.json();
+                    if (!response.ok) throw new Error(session.error);
+                    uploadId = session.upload_id;
+                    session.received = [];
+                    localStorage.setItem(resumeKey, uploadId);
+                }
+
+                const pending = [];
+                for (let start = 0; start < file.size; start += session.chunk_size) {
+                    const end = Math.min(start + session.chunk_size, file.size);
+                    if (!session.received.some(([s, e]) => s <= start && e >= end)) {
+                        pending.push([start, end]);
+                    }
+                }
+                let uploadedBytes = file.size - pending.reduce((total, [s, e]) => total + e - s, 0);
+
+                async function uploadWorker() {
+                    while (pending.length > 0) {
+                        const [start, end] = pending.shift();
+                        for (let attempt = 1; ; attempt++) {
+                            try {
+                                const response = await fetch('/api/uploads/' + uploadId, {
+                                    method: 'PUT',
+                                    headers: {'Content-Range': `bytes ${start}-${end - 1}/${file.size}`},
+                                    body: file.slice(start, end)
+                                });
+                                if (!response.ok) throw new Error((await response.json()).error);
+                                break;
+                            } catch (error) {
+                                if (attempt >= 5) throw error;
+                                console.warn('⚠️ Reintentando rango', start, error);
+                                await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                            }
+                        }
+                        uploadedBytes += end - start;
+                        updateProgress(Math.round((uploadedBytes / file.size) * 50), 'Subiendo video...');
+                    }
+                }
+
+                await Promise.all(Array.from({length: PARALLEL_UPLOADS}, uploadWorker));
+
+                updateProgress(50, 'Verificando archivo...');
+                const response = await fetch('/api/uploads/' + uploadId + '/complete', {method: 'POST'});
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error);
+
+                localStorage.removeItem(resumeKey);
+                onUploadComplete(data.job_id);
+            } catch (error) {
+                console.error('❌ Error en subida por partes:', error);
+                alert('❌ Error al subir el archivo: ' + error.message + '\nSelecciona el mismo archivo para reanudar la subida.');
+                location.reload();
+            }
+        }
+
         async function startProcessing() {
             if (!currentJobId) return;
 
@@ -828,7 +1728,10 @@ HTML_TEMPLATE = '''
                 if (response.ok) {
                     uploadSection.style.display = 'none';
                     progressSection.style.display = 'block';
+                    updateProgress(0, 'En cola (posición ' + data.queue_position + ')...');
                     startStatusCheck();
+                } else if (response.status === 429) {
+                    alert('⏳ ' + data.error + ' (reintentar en ' + data.retry_after + 's)');
                 } else {
                     alert('❌ Error: ' + data.error);
                 }
@@ -837,9 +1740,102 @@ HTML_TEMPLATE = '''
             }
         }
         
+        let eventSource = null;
+
         function startStatusCheck() {
+            // Preferir Server-Sent Events; el polling queda como alternativa
+            if (!window.EventSource) {
+                startPolling();
+                return;
+            }
+
+            let failures = 0;
+            eventSource = new EventSource(`/api/events/${currentJobId}`);
+
+            eventSource.addEventListener('snapshot', (e) => {
+                failures = 0;
+                const data = JSON.parse(e.data);
+                updateProgress(data.progress, data.message);
+                (data.shorts || []).forEach(addShortCard);
+            });
+
+            // Cada short terminado se muestra en cuanto llega (los mejores primero)
+            eventSource.addEventListener('short', (e) => {
+                failures = 0;
+                addShortCard(JSON.parse(e.data));
+            });
+
+            eventSource.addEventListener('progress', (e) => {
+                failures = 0;
+                const data = JSON.parse(e.data);
+                if (data.progress !== undefined) {
+                    document.getElementById('progressBar').style.width = data.progress + '%';
+                    document.getElementById('progressBar').textContent = data.progress + '%';
+                }
+                if (data.message !== undefined) {
+                    document.getElementById('progressMessage').textContent = data.message;
+                }
+            });
+
+            eventSource.addEventListener('done', () => {
+                eventSource.close();
+                eventSource = null;
+                // Una sola consulta para obtener el resultado final
+                checkStatus();
+            });
+
+            eventSource.onerror = () => {
+                failures++;
+                // EventSource reconecta solo (con Last-Event-ID); si falla repetidamente, polling
+                if (failures >= 3 || eventSource.readyState === EventSource.CLOSED) {
+                    console.warn('⚠️ SSE no disponible, usando polling');
+                    eventSource.close();
+                    eventSource = null;
+                    startPolling();
+                }
+            };
+        }
+
+        function startPolling() {
             statusCheckInterval = setInterval(checkStatus, 2000);
         }
+
+        async function resumeProcessing() {
+            try {
+                const response = await fetch('/api/process/' + currentJobId + '/resume', {method: 'POST'});
+                const data = await response.json();
+                if (response.ok) {
+                    updateProgress(0, 'Reanudando (posición ' + data.queue_position + ')...');
+                    startStatusCheck();
+                } else {
+                    alert('❌ Error: ' + data.error);
+                    location.reload();
+                }
+            } catch (error) {
+                alert('❌ Error al reanudar: ' + error.message);
+                location.reload();
+            }
+        }
+
+        async function cancelProcessing() {
+            if (!currentJobId || !confirm('¿Cancelar el procesamiento? Los shorts ya generados se conservan.')) return;
+
+            const cancelBtn = document.getElementById('cancelBtn');
+            cancelBtn.disabled = true;
+            try {
+                const response = await fetch('/api/process/' + currentJobId, {method: 'DELETE'});
+                const data = await response.json();
+                if (response.ok) {
+                    document.getElementById('progressMessage').textContent = data.message;
+                } else {
+                    cancelBtn.disabled = false;
+                    alert('❌ Error: ' + data.error);
+                }
+            } catch (error) {
+                cancelBtn.disabled = false;
+                alert('❌ Error al cancelar: ' + error.message);
+            }
+        }
         
         async function checkStatus() {
             if (!currentJobId) return;
@@ -851,14 +1847,26 @@ HTML_TEMPLATE = '''
                 document.getElementById('progressBar').style.width = data.progress + '%';
                 document.getElementById('progressBar').textContent = data.progress + '%';
                 document.getElementById('progressMessage').textContent = data.message;
+                (data.shorts || []).forEach(addShortCard);
                 
                 if (data.status === 'completed') {
                     clearInterval(statusCheckInterval);
                     showResults(data.shorts);
+                } else if (data.status === 'cancelled') {
+                    clearInterval(statusCheckInterval);
+                    if (data.shorts && data.shorts.length > 0) {
+                        showResults(data.shorts);
+                    } else {
+                        alert('🛑 ' + data.message);
+                        location.reload();
+                    }
                 } else if (data.status === 'error') {
                     clearInterval(statusCheckInterval);
-                    alert('❌ ' + data.message);
-                    location.reload();
+                    if (confirm('❌ ' + data.message + '\n\n¿Reanudar el procesamiento? Las etapas ya terminadas no se repiten.')) {
+                        resumeProcessing();
+                    } else {
+                        location.reload();
+                    }
                 }
             } catch (error) {
                 console.error('Error checking status:', error);
@@ -869,56 +1877,76 @@ HTML_TEMPLATE = '''
             progressSection.style.display = 'none';
             resultsSection.style.display = 'block';
             
+            document.getElementById('shortsGrid').innerHTML = '';
+            shorts.forEach(addShortCard);
+        }
+
+        function addShortCard(short) {
+            // Los resultados se muestran mientras el trabajo sigue en proceso
+            resultsSection.style.display = 'block';
             const grid = document.getElementById('shortsGrid');
-            grid.innerHTML = '';
-            
-            shorts.forEach(short => {
-                const card = document.createElement('div');
-                card.className = 'short-card';
 
-                let htmlContent = '<div style="display: flex; justify-content: space-between; margin-bottom: 15px;">';
-                htmlContent += '<div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; width: 40px; height: 40px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 1.2rem;">';
-                htmlContent += short.id;
+            // Un short repetido (snapshot, reconexión, polling) reemplaza su tarjeta
+            const existing = document.getElementById('short-card-' + short.id);
+            if (existing) existing.remove();
+
+            const card = document.createElement('div');
+            card.className = 'short-card';
+            card.id = 'short-card-' + short.id;
+            card.dataset.score = short.relevance_score;
+
+            let htmlContent = '<div style="display: flex; justify-content: space-between; margin-bottom: 15px;">';
+            htmlContent += '<div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; width: 40px; height: 40px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; font-size: 1.2rem;">';
+            htmlContent += short.id;
+            htmlContent += '</div>';
+            htmlContent += '<div style="background: #ffc107; color: #333; padding: 8px 15px; border-radius: 20px; font-weight: bold; font-size: 0.9rem;">';
+            htmlContent += '⭐ ' + short.relevance_score + '/100';
+            htmlContent += '</div></div>';
+            htmlContent += '<div style="color: #333; font-size: 1.3rem; font-weight: 600; margin-bottom: 10px;">' + short.title + '</div>';
+            htmlContent += '<div style="color: #666; font-size: 0.95rem; line-height: 1.6; margin-bottom: 15px;">' + short.description + '</div>';
+            htmlContent += '<div style="display: flex; gap: 15px; margin-bottom: 15px; color: #999; font-size: 0.9rem;">';
+            htmlContent += '<span>⏱️ ' + Math.round(short.duration) + 's</span>';
+            htmlContent += '<span>📐 9:16</span>';
+            htmlContent += '<span>🕐 ' + formatTime(short.start_time) + '</span>';
+            htmlContent += '</div>';
+
+            if (short.instagram_copy) {
+                htmlContent += '<div style="background: #f8f9ff; padding: 15px; border-radius: 10px; margin: 15px 0; border-left: 4px solid #667eea;">';
+                htmlContent += '<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">';
+                htmlContent += '<strong style="color: #667eea;">📱 Copy para Instagram:</strong>';
+                htmlContent += '<button id="btn-copy-' + short.id + '" onclick="copiarTexto(' + short.id + ')" style="background: #667eea; color: white; border: none; padding: 5px 12px; border-radius: 5px; cursor: pointer; font-size: 0.85rem;">';
+                htmlContent += '📋 Copiar</button></div>';
+                htmlContent += '<pre id="copy-' + short.id + '" style="white-space: pre-wrap; font-family: inherit; color: #333; margin: 0; font-size: 0.9rem; line-height: 1.6;"></pre>';
                 htmlContent += '</div>';
-                htmlContent += '<div style="background: #ffc107; color: #333; padding: 8px 15px; border-radius: 20px; font-weight: bold; font-size: 0.9rem;">';
-                htmlContent += '⭐ ' + short.relevance_score + '/100';
-                htmlContent += '</div></div>';
-                htmlContent += '<div style="color: #333; font-size: 1.3rem; font-weight: 600; margin-bottom: 10px;">' + short.title + '</div>';
-                htmlContent += '<div style="color: #666; font-size: 0.95rem; line-height: 1.6; margin-bottom: 15px;">' + short.description + '</div>';
-                htmlContent += '<div style="display: flex; gap: 15px; margin-bottom: 15px; color: #999; font-size: 0.9rem;">';
-                htmlContent += '<span>⏱️ ' + Math.round(short.duration) + 's</span>';
-                htmlContent += '<span>📐 9:16</span>';
-                htmlContent += '<span>🕐 ' + formatTime(short.start_time) + '</span>';
-                htmlContent += '</div>';
-
-                if (short.instagram_copy) {
-                    htmlContent += '<div style="background: #f8f9ff; padding: 15px; border-radius: 10px; margin: 15px 0; border-left: 4px solid #667eea;">';
-                    htmlContent += '<div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">';
-                    htmlContent += '<strong style="color: #667eea;">📱 Copy para Instagram:</strong>';
-                    htmlContent += '<button id="btn-copy-' + short.id + '" onclick="copiarTexto(' + short.id + ')" style="background: #667eea; color: white; border: none; padding: 5px 12px; border-radius: 5px; cursor: pointer; font-size: 0.85rem;">';
-                    htmlContent += '📋 Copiar</button></div>';
-                    htmlContent += '<pre id="copy-' + short.id + '" style="white-space: pre-wrap; font-family: inherit; color: #333; margin: 0; font-size: 0.9rem; line-height: 1.6;"></pre>';
-                    htmlContent += '</div>';
-                }
+            }
 
-                htmlContent += '<button class="download-btn" onclick="downloadShort(&quot;' + short.filename + '&quot;)">';
-                htmlContent += '⬇️ Descargar Short</button>';
+            htmlContent += '<button class="download-btn" onclick="downloadShort(&quot;' + short.filename + '&quot;, &quot;' + (short.download_url || '') + '&quot;)">';
+            htmlContent += '⬇️ Descargar Short</button>';
 
-                card.innerHTML = htmlContent;
-                grid.appendChild(card);
+            card.innerHTML = htmlContent;
+            // Ordenadas por puntaje: cada tarjeta va antes de la primera con menor puntaje
+            const next = Array.from(grid.children).find(other => Number(other.dataset.score) < short.relevance_score);
+            grid.insertBefore(card, next || null);
 
-                // Agregar el contenido del Instagram copy de forma segura
-                if (short.instagram_copy) {
-                    const copyElement = document.getElementById('copy-' + short.id);
-                    if (copyElement) {
-                        copyElement.textContent = short.instagram_copy;
-                    }
+            // Agregar el contenido del Instagram copy de forma segura
+            if (short.instagram_copy) {
+                const copyElement = document.getElementById('copy-' + short.id);
+                if (copyElement) {
+                    copyElement.textContent = short.instagram_copy;
                 }
-            });
+            }
         }
         
-        function downloadShort(filename) {
-            window.location.href = `/api/download/${filename}`;
+        function downloadShort(filename, downloadUrl) {
+            window.location.href = downloadUrl || `/api/download/${filename}`;
+        }
+        
+        function downloadAllShorts() {
+            window.location.href = `/api/download/job/${currentJobId}`;
+        }
+        
+        function downloadTrace() {
+            window.location.href = `/api/jobs/${currentJobId}/trace`;
         }
         
         function formatTime(seconds) {
@@ -956,6 +1984,15 @@ HTML_TEMPLATE = '''
 '''
 
 if __name__ == '__main__':
+    # Servidor de desarrollo. En producción: gunicorn -c gunicorn.conf.py app:app
+    port = int(os.getenv('PORT', '3000'))
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
+
+    # Con el reloader, sólo el proceso hijo (el que atiende peticiones) procesa trabajos
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        REGISTRY.clear_snapshots(METRICS_DIR)
+        start_background_services()
+
     print("🚀 Iniciando AI Shorts Creator...")
-    print("📍 Servidor disponible en: http://localhost:3000")
-    app.run(host='0.0.0.0', port=3000, debug=True)
+    print(f"📍 Servidor disponible en: http://localhost:{port}")
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
@@ -0,0 +1,345 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+from contextlib import contextmanager
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre escrituras y finalize
+    fcntl = None
+
+# Escritura posicional: os.pwrite no existe en Windows
+_HAS_PWRITE = hasattr(os, 'pwrite')
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+SUPPORTED_CHECKSUMS = {'sha256', 'sha1', 'md5'}
+
+
+class UploadSessionError(Exception):
+    """Error en una sesión de subida; status_code es el código HTTP a devolver"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUploadManager:
+    """
+    Subidas reanudables por rangos de bytes.
+
+    Protocolo:
+        1. create(): reserva el archivo completo (sparse) y devuelve un upload_id
+        2. write_range(): cada PUT escribe su rango con escrituras posicionales,
+           en cualquier orden y en paralelo
+        3. received_ranges(): rangos ya recibidos, para reanudar tras un corte
+        4. finalize(): verifica que no falten bytes (y el checksum opcional) y
+           mueve el archivo a la carpeta de uploads sin copiarlo
+
+    Cada rango completado se registra como un archivo marcador vacío
+    (ranges/<inicio>-<fin>) que se crea sólo después de escribir todos sus
+    bytes. Así el estado sobrevive a reinicios del servidor y varios
+    procesos pueden recibir rangos de la misma sesión sin bloquearse entre
+    sí: cada escritura toma el candado compartido de la sesión (session.lock)
+    y finalize() el exclusivo, así que ningún rango se escribe mientras se
+    verifica y mueve el archivo.
+    """
+
+    def __init__(self, upload_folder, session_max_age=7 * 24 * 3600, chunk_size=8 * 1024 * 1024):
+        self.upload_folder = upload_folder
+        self.sessions_folder = os.path.join(upload_folder, '.sessions')
+        self.session_max_age = session_max_age
+        self.chunk_size = chunk_size
+        os.makedirs(self.sessions_folder, exist_ok=True)
+
+    def _session_dir(self, upload_id):
+        # Evitar path traversal: el id siempre es un uuid generado por nosotros
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise UploadSessionError('Sesión de subida no encontrada', 404)
+        return os.path.join(self.sessions_folder, upload_id)
+
+    def _load_meta(self, upload_id):
+        session_dir = self._session_dir(upload_id)
+        meta_path = os.path.join(session_dir, 'meta.json')
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadSessionError('Sesión de subida no encontrada', 404)
+
+    @contextmanager
+    def _session_lock(self, session_dir, exclusive=False):
+        """Candado de la sesión: compartido para escribir rangos, exclusivo para finalizar"""
+        try:
+            lock_file = open(os.path.join(session_dir, 'session.lock'), 'a')
+        except FileNotFoundError:
+            raise UploadSessionError('Sesión de subida no encontrada', 404)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            lock_file.close()
+
+    def create(self, filename, size, checksum=None):
+        """
+        Crea una sesión de subida
+
+        Args:
+            filename: Nombre original del archivo
+            size: Tamaño total en bytes
+            checksum: Opcional, en formato '<algoritmo>:<hex>' (sha256, sha1 o md5)
+
+        Returns:
+            Diccionario con los datos de la sesión
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadSessionError('El tamaño del archivo debe ser un entero positivo')
+
+        if checksum:
+            algorithm, _, digest = checksum.partition(':')
+            if algorithm.lower() not in SUPPORTED_CHECKSUMS or not digest:
+                raise UploadSessionError(f'Checksum no soportado: {checksum}')
+            checksum = f"{algorithm.lower()}:{digest.lower()}"
+
+        self.cleanup_expired()
+
+        upload_id = str(uuid.uuid4())
+        session_dir = self._session_dir(upload_id)
+        os.makedirs(os.path.join(session_dir, 'ranges'))
+
+        # Reservar el archivo completo; en la mayoría de sistemas de archivos es sparse
+        with open(os.path.join(session_dir, 'data.part'), 'wb') as f:
+            f.truncate(size)
+
+        meta = {
+            'upload_id': upload_id,
+            'filename': secure_filename(filename) or f"video.{filename.rsplit('.', 1)[-1].lower()}",
+            'original_filename': filename,
+            'size': size,
+            'checksum': checksum,
+            'chunk_size': self.chunk_size,
+            'created_at': time.time()
+        }
+        with open(os.path.join(session_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        print(f"📦 Sesión de subida creada: {upload_id} ({size / 1024 / 1024:.1f} MB)")
+        return meta
+
+    def write_range(self, upload_id, content_range, stream):
+        """
+        Escribe un rango de bytes recibido en un PUT
+
+        Args:
+            upload_id: Id de la sesión
+            content_range: Cabecera Content-Range ('bytes <inicio>-<fin>/<total>', fin inclusivo)
+            stream: Objeto con read() del que leer el cuerpo
+
+        Returns:
+            Lista de rangos recibidos tras la escritura
+        """
+        meta = self._load_meta(upload_id)
+        start, end = self._parse_content_range(content_range, meta['size'])
+        session_dir = self._session_dir(upload_id)
+        data_path = os.path.join(session_dir, 'data.part')
+
+        with self._session_lock(session_dir):
+            # finalize.lock marca una sesión que se está finalizando: finalize()
+            # espera a las escrituras que ya empezaron y las nuevas se rechazan
+            if os.path.exists(os.path.join(session_dir, 'finalize.lock')):
+                raise UploadSessionError('La sesión se está finalizando', 409)
+            try:
+                fd = os.open(data_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+            except FileNotFoundError:
+                # finalize() terminó mientras se esperaba el candado
+                raise UploadSessionError('La sesión ya se finalizó', 409)
+            self._write_fd(fd, start, end, stream)
+
+            # El marcador sólo existe si el rango se escribió completo
+            open(os.path.join(session_dir, 'ranges', f'{start}-{end}'), 'w').close()
+
+        return self.received_ranges(upload_id)
+
+    def _write_fd(self, fd, start, end, stream):
+        """Escribe el cuerpo en [start, end) del archivo y cierra fd"""
+        expected = end - start
+        written = 0
+        try:
+            if not _HAS_PWRITE:
+                os.lseek(fd, start, os.SEEK_SET)
+            while written < expected:
+                chunk = stream.read(min(1024 * 1024, expected - written))
+                if not chunk:
+                    break
+                view = memoryview(chunk)
+                while view:
+                    if _HAS_PWRITE:
+                        n = os.pwrite(fd, view, start + written)
+                    else:
+                        n = os.write(fd, view)
+                    written += n
+                    view = view[n:]
+
+            if written != expected or stream.read(1):
+                # Rango incompleto (conexión cortada) o con bytes de más: no se marca
+                raise UploadSessionError(
+                    f'Se recibieron {written} bytes para un rango de {expected}'
+                )
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _parse_content_range(self, content_range, size):
+        match = CONTENT_RANGE_RE.match((content_range or '').strip())
+        if not match:
+            raise UploadSessionError('Cabecera Content-Range inválida (se espera "bytes inicio-fin/total")')
+
+        start, last = int(match.group(1)), int(match.group(2))
+        total = match.group(3)
+        if total != '*' and int(total) != size:
+            raise UploadSessionError(f'El total del Content-Range no coincide con el tamaño ({size})')
+        if start > last or last >= size:
+            raise UploadSessionError('Rango fuera del archivo', 416)
+        return start, last + 1
+
+    def received_ranges(self, upload_id):
+        """Devuelve los rangos recibidos, fusionados, como [[inicio, fin), ...]"""
+        ranges_dir = os.path.join(self._session_dir(upload_id), 'ranges')
+        if not os.path.isdir(ranges_dir):
+            raise UploadSessionError('Sesión de subida no encontrada', 404)
+
+        ranges = []
+        for name in os.listdir(ranges_dir):
+            try:
+                start, end = (int(x) for x in name.split('-'))
+            except ValueError:
+                continue
+            ranges.append((start, end))
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def status(self, upload_id):
+        """Estado de la sesión: rangos recibidos, bytes pendientes y si está completa"""
+        meta = self._load_meta(upload_id)
+        received = self.received_ranges(upload_id)
+        received_bytes = sum(end - start for start, end in received)
+        return {
+            'upload_id': upload_id,
+            'filename': meta['original_filename'],
+            'size': meta['size'],
+            'chunk_size': meta['chunk_size'],
+            'received': received,
+            'received_bytes': received_bytes,
+            'complete': received == [[0, meta['size']]]
+        }
+
+    def finalize(self, upload_id, job_id=None):
+        """
+        Verifica la sesión y mueve el archivo a la carpeta de uploads
+
+        Returns:
+            Tupla (filename, filepath) del video final
+        """
+        meta = self._load_meta(upload_id)
+        session_dir = self._session_dir(upload_id)
+
+        # Evitar que dos peticiones finalicen la misma sesión a la vez; las
+        # escrituras que lleguen desde ahora se rechazan
+        lock_path = os.path.join(session_dir, 'finalize.lock')
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise UploadSessionError('La sesión ya se está finalizando', 409)
+
+        try:
+            with self._session_lock(session_dir, exclusive=True):
+                filename, filepath = self._finalize_locked(upload_id, meta, session_dir, job_id)
+        except Exception:
+            os.remove(lock_path)
+            raise
+
+        shutil.rmtree(session_dir, ignore_errors=True)
+        print(f"✅ Subida {upload_id} completada: {filepath}")
+        return filename, filepath
+
+    def _finalize_locked(self, upload_id, meta, session_dir, job_id):
+        """Verifica y mueve el archivo con el candado exclusivo (sin escrituras en curso)"""
+        received = self.received_ranges(upload_id)
+        if received != [[0, meta['size']]]:
+            missing = self._missing_ranges(received, meta['size'])
+            raise UploadSessionError(
+                f'Faltan {sum(e - s for s, e in missing)} bytes en {len(missing)} rangos', 409
+            )
+
+        data_path = os.path.join(session_dir, 'data.part')
+        if meta.get('checksum'):
+            algorithm, _, expected_digest = meta['checksum'].partition(':')
+            print(f"🔐 Verificando checksum {algorithm}...")
+            digest = self._file_digest(data_path, algorithm)
+            if digest != expected_digest:
+                raise UploadSessionError(
+                    f'Checksum no coincide (esperado {expected_digest}, calculado {digest})', 422
+                )
+
+        job_id = job_id or upload_id
+        filename = secure_filename(f"{job_id}_{meta['filename']}")
+        filepath = os.path.join(self.upload_folder, filename)
+        # Mismo sistema de archivos: rename atómico, sin copiar los datos
+        os.replace(data_path, filepath)
+        return filename, filepath
+
+    def _missing_ranges(self, received, size):
+        missing = []
+        position = 0
+        for start, end in received:
+            if start > position:
+                missing.append([position, start])
+            position = max(position, end)
+        if position < size:
+            missing.append([position, size])
+        return missing
+
+    def _file_digest(self, path, algorithm):
+        hasher = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def abort(self, upload_id):
+        """Elimina una sesión y sus datos parciales"""
+        session_dir = self._session_dir(upload_id)
+        if not os.path.isdir(session_dir):
+            raise UploadSessionError('Sesión de subida no encontrada', 404)
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    def cleanup_expired(self):
+        """Elimina sesiones abandonadas más antiguas que session_max_age"""
+        now = time.time()
+        for upload_id in os.listdir(self.sessions_folder):
+            session_dir = os.path.join(self.sessions_folder, upload_id)
+            try:
+                # ranges/ cambia con cada rango recibido: indica la última actividad
+                last_activity = max(
+                    os.path.getmtime(session_dir),
+                    os.path.getmtime(os.path.join(session_dir, 'ranges'))
+                )
+                if now - last_activity > self.session_max_age:
+                    shutil.rmtree(session_dir, ignore_errors=True)
+                    print(f"🧹 Sesión de subida expirada eliminada: {upload_id}")
+            except OSError:
+                continue
@@ -0,0 +1,124 @@
+"""
+Plan de códecs de los renders: decide por pista si se copia, se remultiplexa
+o se recodifica.
+
+El video de un short siempre pasa por filtros (escala, marca de agua,
+subtítulos), así que se codifica. El audio en cambio suele venir ya en AAC
+a una frecuencia compatible: copiarlo evita decodificar, remuestrear y
+volver a codificar (CPU y pérdida de calidad de una segunda compresión).
+"""
+
+# Salida de los shorts (MP4 para TikTok / Reels / Shorts)
+OUTPUT_VIDEO_ARGS = ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+OUTPUT_AUDIO_CODEC = 'aac'
+OUTPUT_AUDIO_BITRATE = '192k'
+OUTPUT_AUDIO_SAMPLE_RATE = 44100
+# Frecuencias que las plataformas aceptan sin remuestrear
+COMPATIBLE_SAMPLE_RATES = (44100, 48000)
+MAX_AUDIO_CHANNELS = 2
+# Por encima de este bitrate se recodifica para no inflar el short
+MAX_COPY_AUDIO_BITRATE = 320000
+
+# Contenedores cuyo AAC viaja en ADTS y necesita aac_adtstoasc para ir en MP4
+ADTS_FORMATS = ('mpegts', 'aac')
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_probe(info):
+    """
+    Resumen de un ffprobe (-show_format -show_streams) con lo que necesita el plan
+
+    Returns:
+        {'width', 'height', 'format', 'video': {...} | None, 'audio': {...} | None}
+    """
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    return {
+        'width': video.get('width') if video else None,
+        'height': video.get('height') if video else None,
+        'format': info.get('format', {}).get('format_name', ''),
+        'video': {
+            'codec': video.get('codec_name'),
+            'pix_fmt': video.get('pix_fmt')
+        } if video else None,
+        'audio': {
+            'codec': audio.get('codec_name'),
+            'sample_rate': _int(audio.get('sample_rate')),
+            'channels': _int(audio.get('channels')),
+            'bit_rate': _int(audio.get('bit_rate'))
+        } if audio else None
+    }
+
+
+class CodecPlanner:
+    """Decide copy / remux / encode para cada pista de un render"""
+
+    def plan(self, source, video_filtered=True, output_size=None):
+        """
+        Args:
+            source: Resumen del original (summarize_probe); sin la clave 'audio'
+                    (resumen incompleto) el audio se recodifica
+            video_filtered: True si el video pasa por filtros (siempre en los shorts)
+            output_size: (ancho, alto) de salida, para decidir si el video se puede copiar
+
+        Returns:
+            {'video': decisión, 'audio': decisión, 'args': parámetros de FFmpeg,
+             'video_args' / 'audio_args': los parámetros de cada pista por separado}
+            donde cada decisión es {'action': 'copy'|'remux'|'encode'|'drop', 'reason'}
+        """
+        video = self._plan_video(source, video_filtered, output_size)
+        audio = self._plan_audio(source)
+        video_args = video.pop('args')
+        audio_args = audio.pop('args')
+        if audio['action'] in ('copy', 'remux'):
+            # Con -ss antes de -i el audio copiado arranca en el primer paquete
+            # tras el punto de corte; make_zero alinea ambas pistas en 0
+            audio_args += ['-avoid_negative_ts', 'make_zero']
+        return {'video': video, 'audio': audio, 'video_args': video_args, 'audio_args': audio_args,
+                'args': video_args + audio_args}
+
+    def _plan_video(self, source, video_filtered, output_size):
+        info = source.get('video')
+        if (not video_filtered and info and info.get('codec') == 'h264' and info.get('pix_fmt') == 'yuv420p'
+                and output_size == (source.get('width'), source.get('height'))):
+            return {'action': 'copy', 'reason': 'H.264 sin filtros', 'args': ['-c:v', 'copy']}
+        reason = 'filtros de video' if video_filtered else 'formato distinto a la salida'
+        return {'action': 'encode', 'reason': reason, 'args': list(OUTPUT_VIDEO_ARGS)}
+
+    def _plan_audio(self, source):
+        if 'audio' not in source:
+            return self._encode_audio(None, 'pistas del original desconocidas')
+
+        info = source['audio']
+        if info is None:
+            return {'action': 'drop', 'reason': 'el original no tiene audio', 'args': ['-an']}
+
+        if info.get('codec') != OUTPUT_AUDIO_CODEC:
+            return self._encode_audio(info, f"códec {info.get('codec')}")
+        if info.get('sample_rate') not in COMPATIBLE_SAMPLE_RATES:
+            return self._encode_audio(info, f"frecuencia {info.get('sample_rate')} Hz")
+        if not info.get('channels') or info['channels'] > MAX_AUDIO_CHANNELS:
+            return self._encode_audio(info, f"{info.get('channels')} canales")
+        if (info.get('bit_rate') or 0) > MAX_COPY_AUDIO_BITRATE:
+            return self._encode_audio(info, f"bitrate {info['bit_rate'] // 1000} kbps")
+
+        if any(name in source.get('format', '').split(',') for name in ADTS_FORMATS):
+            return {'action': 'remux', 'reason': 'AAC en ADTS', 'args': ['-c:a', 'copy', '-bsf:a', 'aac_adtstoasc']}
+        return {'action': 'copy', 'reason': 'AAC compatible', 'args': ['-c:a', 'copy']}
+
+    def _encode_audio(self, info, reason):
+        # Conservar la frecuencia si ya es compatible: se evita remuestrear
+        sample_rate = info.get('sample_rate') if info else None
+        if sample_rate not in COMPATIBLE_SAMPLE_RATES:
+            sample_rate = OUTPUT_AUDIO_SAMPLE_RATE
+        args = ['-c:a', OUTPUT_AUDIO_CODEC, '-b:a', OUTPUT_AUDIO_BITRATE, '-ar', str(sample_rate)]
+        if info and (info.get('channels') or 0) > MAX_AUDIO_CHANNELS:
+            args += ['-ac', str(MAX_AUDIO_CHANNELS)]
+        return {'action': 'encode', 'reason': reason, 'args': args}
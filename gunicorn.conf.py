@@ -0,0 +1,45 @@
+"""
+Configuración de gunicorn para producción.
+
+Uso:
+    gunicorn -c gunicorn.conf.py app:app
+
+Varios procesos atienden el mismo puerto. El estado de los trabajos vive en
+SQLite (data/jobs.db), así que cualquier proceso puede leer un trabajo que
+empezó otro. Cada proceso usa hilos (gthread): los streams SSE y las subidas
+largas ocupan un hilo y no bloquean las consultas de estado.
+"""
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+
+# Procesos worker y hilos por proceso
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count()))))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Segundos sin señal de vida de un worker antes de reiniciarlo. Con gthread
+# las peticiones largas (subidas, SSE, ZIP) no cuentan para este límite.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Cargar la aplicación una sola vez en el maestro y compartir memoria entre workers
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Descarta las métricas de procesos de una ejecución anterior"""
+    from metrics import REGISTRY
+    REGISTRY.clear_snapshots(os.getenv('METRICS_DIR', os.path.join('data', 'metrics')))
+
+
+def post_fork(server, worker):
+    """Los hilos de fondo no sobreviven al fork: cada worker arranca los suyos"""
+    from app import start_background_services
+    start_background_services()
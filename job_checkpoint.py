@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _fingerprint(params):
+    """Huella de los parámetros con los que se generó un artefacto"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, data):
+    """Escribe a un archivo temporal y lo renombra: nunca queda un archivo a medias"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JobCheckpoint:
+    """
+    Artefactos de cada etapa del pipeline de un trabajo (audio, transcripción,
+    momentos, subtítulos y cada short terminado) guardados en su carpeta con
+    un manifest.json.
+
+    Cada etapa se registra con los parámetros que la produjeron y con el
+    tamaño de los archivos que genera. Al reanudar, load() sólo devuelve las
+    etapas cuyo manifiesto coincide con los parámetros actuales y cuyos
+    archivos siguen presentes y completos; el resto se vuelve a calcular.
+    """
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.manifest_path = os.path.join(job_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(job_dir, exist_ok=True)
+        self._manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest.get('stages'), dict):
+                return manifest
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Manifiesto de checkpoints inválido, se ignora: {e}")
+        return {'stages': {}}
+
+    def path(self, name):
+        """Ruta de un archivo dentro de la carpeta del trabajo"""
+        return os.path.join(self.job_dir, name)
+
+    def _data_path(self, stage):
+        return self.path(f"{stage}.json")
+
+    def save(self, stage, data, params=None, files=()):
+        """
+        Guarda el resultado de una etapa
+
+        Args:
+            stage: Nombre de la etapa ('transcript', 'moments', 'short_1', ...)
+            data: Resultado serializable a JSON
+            params: Parámetros que determinan el resultado; si cambian, la etapa se rehace
+            files: Archivos generados por la etapa que deben seguir existiendo al reanudar
+        """
+        content = json.dumps(data, ensure_ascii=False)
+        _write_atomic(self._data_path(stage), content)
+
+        entry = {
+            'params': _fingerprint(params),
+            'sha256': hashlib.sha256(content.encode('utf-8')).hexdigest(),
+            'files': {os.path.abspath(f): os.path.getsize(f) for f in files},
+            'saved_at': time.time()
+        }
+        with self._lock:
+            self._manifest['stages'][stage] = entry
+            _write_atomic(self.manifest_path, json.dumps(self._manifest, ensure_ascii=False, indent=2))
+
+    def load(self, stage, params=None):
+        """
+        Resultado guardado de una etapa, o None si no existe o ya no es válido
+        (otros parámetros, datos corruptos o archivos borrados / incompletos)
+        """
+        with self._lock:
+            entry = self._manifest['stages'].get(stage)
+        if entry is None or entry.get('params') != _fingerprint(params):
+            return None
+
+        for file_path, size in entry.get('files', {}).items():
+            if not os.path.exists(file_path) or os.path.getsize(file_path) != size:
+                print(f"⚠️  Checkpoint '{stage}' descartado: falta o cambió {os.path.basename(file_path)}")
+                return None
+
+        try:
+            with open(self._data_path(stage), 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            return None
+        if hashlib.sha256(content.encode('utf-8')).hexdigest() != entry.get('sha256'):
+            print(f"⚠️  Checkpoint '{stage}' descartado: datos corruptos")
+            return None
+
+        return json.loads(content)
+
+    def stages(self):
+        """Nombres de las etapas registradas en el manifiesto"""
+        with self._lock:
+            return list(self._manifest['stages'])
+
+    def clear(self):
+        """Elimina la carpeta del trabajo con todos sus checkpoints"""
+        with self._lock:
+            self._manifest = {'stages': {}}
+            shutil.rmtree(self.job_dir, ignore_errors=True)
@@ -0,0 +1,100 @@
+import threading
+from resource_usage import JobUsage
+
+
+class JobCancelled(Exception):
+    """El trabajo fue cancelado mientras se procesaba"""
+
+
+class JobContext:
+    """
+    Estado de ejecución de un trabajo compartido por todas sus etapas.
+
+    Permite cancelar el trabajo desde otro hilo: marca la cancelación,
+    termina los procesos FFmpeg registrados y ejecuta los callbacks de
+    cancelación (por ejemplo cerrar el cliente HTTP de la IA). Las etapas
+    consultan check_cancelled() entre pasos y usan sleep() para esperas
+    que se interrumpen al cancelar.
+    """
+
+    def __init__(self, job_id, kill_grace_seconds=5):
+        self.job_id = job_id
+        self.kill_grace_seconds = kill_grace_seconds
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._cancel_callbacks = []
+        # Tracer del trabajo (tracing.Tracer) si se está trazando
+        self.tracer = None
+        # CPU, memoria, disco y API de IA consumidos por el trabajo
+        self.usage = JobUsage()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        """Lanza JobCancelled si el trabajo fue cancelado"""
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Trabajo {self.job_id} cancelado")
+
+    def sleep(self, seconds):
+        """Espera como time.sleep, pero se interrumpe si el trabajo se cancela"""
+        if self._cancelled.wait(seconds):
+            raise JobCancelled(f"Trabajo {self.job_id} cancelado")
+
+    def register_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+        # Cancelado justo antes de registrar: terminarlo igual
+        if self._cancelled.is_set():
+            self._terminate(process)
+
+    def unregister_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def on_cancel(self, callback):
+        """Registra una función a ejecutar cuando el trabajo se cancele"""
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+
+    def cancel(self):
+        """Cancela el trabajo: termina sus procesos y ejecuta los callbacks"""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+
+        with self._lock:
+            processes = list(self._processes)
+            callbacks = list(self._cancel_callbacks)
+
+        print(f"🛑 Cancelando trabajo {self.job_id}: {len(processes)} procesos activos")
+        for process in processes:
+            self._terminate(process)
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Error en callback de cancelación: {e}")
+
+    def _terminate(self, process):
+        """SIGTERM y, si no termina en kill_grace_seconds, SIGKILL"""
+        if process.poll() is not None:
+            return
+        try:
+            process.terminate()
+        except OSError:
+            return
+
+        def kill_if_alive():
+            if process.poll() is None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+        timer = threading.Timer(self.kill_grace_seconds, kill_if_alive)
+        timer.daemon = True
+        timer.start()
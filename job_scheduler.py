@@ -0,0 +1,230 @@
+import math
+import time
+import threading
+from datetime import datetime
+from job_context import JobContext
+
+# Rango de prioridades aceptado al encolar (mayor prioridad se procesa antes)
+MIN_PRIORITY = -10
+MAX_PRIORITY = 10
+
+
+class QueueFullError(Exception):
+    """La cola de trabajos está llena; retry_after son los segundos sugeridos para reintentar"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Cola de trabajos llena, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Planificador central de trabajos de procesamiento.
+
+    - Como máximo max_concurrent pipelines corren a la vez. El límite se
+      aplica sobre la base de datos de trabajos, así que es global aunque
+      haya varios procesos compartiendo el mismo JobStore.
+    - La cola es FIFO dentro de cada prioridad (mayor prioridad primero).
+    - Si hay max_queued trabajos esperando, submit() lanza QueueFullError.
+    - Un hilo de heartbeat actualiza los trabajos en curso; los que dejan de
+      recibirlo (su proceso murió) vuelven a la cola y se reanudan desde sus
+      checkpoints, hasta max_resume_attempts veces.
+    - Cada trabajo en curso tiene un JobContext; cancel() lo detiene aunque
+      corra en otro proceso (la marca se guarda en la base de datos y cada
+      proceso revisa la de sus propios trabajos).
+    """
+
+    def __init__(self, store, runner, max_concurrent=2, max_queued=20,
+                 poll_interval=1.0, heartbeat_interval=30, stale_after=300,
+                 default_run_seconds=600, cancel_poll_interval=1.0, max_resume_attempts=2):
+        """
+        Args:
+            store: JobStore donde viven los trabajos y la cola
+            runner: Función runner(job_id, options, context) que ejecuta el pipeline
+            max_concurrent: Pipelines simultáneos como máximo
+            max_queued: Trabajos en espera como máximo
+            poll_interval: Segundos entre consultas a la cola cuando está vacía
+            heartbeat_interval: Segundos entre heartbeats de los trabajos en curso
+            stale_after: Segundos sin heartbeat tras los que un trabajo se da por muerto
+            default_run_seconds: Duración estimada de un trabajo sin historial
+            cancel_poll_interval: Segundos entre revisiones de cancelaciones pendientes
+            max_resume_attempts: Reanudaciones automáticas de un trabajo interrumpido
+        """
+        self.store = store
+        self.runner = runner
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.default_run_seconds = default_run_seconds
+        self.cancel_poll_interval = cancel_poll_interval
+        self.max_resume_attempts = max_resume_attempts
+
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Lanza los hilos de trabajo y el de heartbeat"""
+        if self._threads:
+            return
+
+        for i in range(self.max_concurrent):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i+1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        for target, name in ((self._heartbeat_loop, "job-heartbeat"), (self._cancel_loop, "job-cancel")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        print(f"🗂️  Planificador iniciado: {self.max_concurrent} pipelines simultáneos, cola de {self.max_queued}")
+
+    def submit(self, job_id, options, priority=0):
+        """
+        Encola un trabajo
+
+        Returns:
+            Posición en la cola
+
+        Raises:
+            QueueFullError si no hay lugar en la cola
+        """
+        position = self.store.enqueue(
+            job_id,
+            self.max_queued,
+            priority=priority,
+            options=options,
+            progress=0,
+            message='En cola de procesamiento...'
+        )
+        if position is None:
+            raise QueueFullError(self.retry_after())
+
+        print(f"🗂️  Trabajo {job_id} en cola (posición {position})")
+        self._wakeup.set()
+        return position
+
+    def cancel(self, job_id):
+        """
+        Cancela un trabajo en cola o en proceso
+
+        Returns:
+            'cancelled' si estaba en cola (ya quedó cancelado), 'cancelling' si
+            estaba en proceso (se detendrá en breve) o None si no se puede cancelar
+        """
+        if self.store.cancel_queued(job_id):
+            print(f"🛑 Trabajo {job_id} cancelado antes de empezar")
+            return 'cancelled'
+
+        if not self.store.request_cancel(job_id):
+            return None
+
+        # Si corre en este proceso, cancelar sin esperar al hilo de revisión
+        with self._running_lock:
+            context = self._running.get(job_id)
+        if context is not None:
+            context.cancel()
+        return 'cancelling'
+
+    def running_context(self, job_id):
+        """JobContext de un trabajo que corre en este proceso (o None)"""
+        with self._running_lock:
+            return self._running.get(job_id)
+
+    def _average_run_seconds(self):
+        return self.store.average_run_seconds() or self.default_run_seconds
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere un lugar en la cola"""
+        return max(5, int(math.ceil(self._average_run_seconds() / self.max_concurrent)))
+
+    def queue_info(self, job_id):
+        """
+        Posición y hora estimada de inicio de un trabajo en cola
+
+        Returns:
+            Diccionario con queue_position y estimated_start_at, o None si no está en cola
+        """
+        position = self.store.queue_position(job_id)
+        if position is None:
+            return None
+
+        average = self._average_run_seconds()
+        running = self.store.count_by_status('processing')
+
+        # Trabajos que deben terminar antes de que éste empiece, repartidos
+        # entre los pipelines. Los que ya están corriendo cuentan por la mitad.
+        waves = (position - 1) // self.max_concurrent
+        wait = waves * average
+        if running >= self.max_concurrent:
+            wait += average / 2
+
+        return {
+            'queue_position': position,
+            'queue_length': self.store.count_by_status('queued'),
+            'estimated_start_at': datetime.fromtimestamp(time.time() + wait).isoformat(timespec='seconds')
+        }
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job = self.store.claim_next(self.max_concurrent)
+            except Exception as e:
+                print(f"⚠️  Error consultando la cola de trabajos: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            context = JobContext(job['id'])
+            with self._running_lock:
+                self._running[job['id']] = context
+            try:
+                self.runner(job['id'], job.get('options') or {}, context)
+            except Exception as e:
+                print(f"❌ Error no controlado en el trabajo {job['id']}: {e}")
+            finally:
+                with self._running_lock:
+                    self._running.pop(job['id'], None)
+                # Un lugar libre: que otro hilo tome el siguiente trabajo sin esperar
+                self._wakeup.set()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                with self._running_lock:
+                    running = list(self._running)
+                self.store.touch(running)
+
+                requeued, failed = self.store.requeue_stale(
+                    self.stale_after,
+                    self.max_resume_attempts,
+                    'Error: el procesamiento se interrumpió varias veces (el servidor se reinició)'
+                )
+                if requeued:
+                    print(f"♻️  {len(requeued)} trabajos interrumpidos vuelven a la cola para reanudarse")
+                    self._wakeup.set()
+                if failed:
+                    print(f"⚠️  {len(failed)} trabajos interrumpidos marcados como error")
+                    self._wakeup.set()
+            except Exception as e:
+                print(f"⚠️  Error en el heartbeat del planificador: {e}")
+
+    def _cancel_loop(self):
+        """Aplica las cancelaciones pedidas desde otros procesos a los trabajos de éste"""
+        while True:
+            time.sleep(self.cancel_poll_interval)
+            try:
+                with self._running_lock:
+                    running = dict(self._running)
+                for job_id in self.store.cancel_requested_ids(list(running)):
+                    running[job_id].cancel()
+            except Exception as e:
+                print(f"⚠️  Error revisando cancelaciones: {e}")
@@ -0,0 +1,737 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Estados en los que un trabajo ya no cambia y puede ser eliminado por retención
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+# Columnas propias de la tabla jobs; cualquier otro campo va al JSON 'extra'
+JOB_COLUMNS = (
+    'id', 'status', 'progress', 'message', 'filename', 'filepath', 'created_at', 'updated_at',
+    'priority', 'queued_at', 'started_at', 'finished_at', 'last_accessed_at'
+)
+
+# Columnas agregadas después de la primera versión del esquema: (nombre, definición)
+MIGRATED_COLUMNS = (
+    ('priority', 'INTEGER NOT NULL DEFAULT 0'),
+    ('queued_at', 'REAL'),
+    ('started_at', 'REAL'),
+    ('finished_at', 'REAL'),
+    ('last_accessed_at', 'REAL'),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    filename TEXT,
+    filepath TEXT,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_progress ON jobs(progress);
+-- Paginación por cursor (created_at, id), con y sin filtro de estado
+CREATE INDEX IF NOT EXISTS idx_jobs_created_id ON jobs(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created_id ON jobs(status, created_at, id);
+
+CREATE TABLE IF NOT EXISTS shorts (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    short_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, short_id)
+);
+
+-- Eventos de progreso para Server-Sent Events (el id es el Last-Event-ID)
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_job_id ON job_events(job_id, id);
+"""
+
+# Campos cuyo cambio se publica como evento 'progress'
+PROGRESS_FIELDS = ('status', 'progress', 'message')
+
+
+class JobStore:
+    """
+    Almacenamiento persistente de trabajos en SQLite (modo WAL).
+
+    - Cada hilo usa su propia conexión. En WAL las lecturas no bloquean ni
+      son bloqueadas por las escrituras de los hilos de procesamiento.
+    - Las escrituras son transacciones cortas (BEGIN IMMEDIATE); dentro del
+      proceso además se serializan con un lock para no esperar en SQLite.
+    - Los metadatos de cada short se guardan en su propia tabla, así que
+      consultar el estado de un trabajo no obliga a cargar sus shorts.
+    - Los campos que no tienen columna propia se guardan como JSON en 'extra'.
+    - Cada cambio de progreso, short terminado o estado final se registra en
+      job_events en la misma transacción, para enviarlo por SSE.
+    """
+
+    def __init__(self, db_path, retention_days=30, max_jobs=100000):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.max_jobs = max_jobs
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._events_changed = threading.Condition()
+        self._retention_thread = None
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+
+    def _migrate(self, conn):
+        """Agrega a bases de datos existentes las columnas nuevas del esquema"""
+        existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, definition in MIGRATED_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        # Cola de trabajos: siguiente por prioridad y orden de llegada
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, queued_at)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # Una conexión heredada por fork (gunicorn) no se puede usar en el proceso hijo
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: autocommit, las transacciones se abren explícitamente
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transacción de escritura: toma el lock de escritura de SQLite al empezar"""
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+        # Despertar a los streams SSE de este proceso que esperan eventos
+        with self._events_changed:
+            self._events_changed.notify_all()
+
+    def _row_to_job(self, row):
+        job = {key: row[key] for key in JOB_COLUMNS}
+        job.update(json.loads(row['extra']))
+        return job
+
+    def create(self, job_id, **fields):
+        """Crea un trabajo y lo devuelve como diccionario"""
+        fields.setdefault('status', 'uploaded')
+        fields.setdefault('progress', 0)
+        fields.setdefault('created_at', datetime.now().isoformat())
+        shorts = fields.pop('shorts', [])
+        columns, extra = self._split_fields(fields)
+
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, progress, message, filename, filepath, created_at, updated_at, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    columns['status'],
+                    columns['progress'],
+                    columns.get('message'),
+                    columns.get('filename'),
+                    columns.get('filepath'),
+                    columns['created_at'],
+                    time.time(),
+                    json.dumps(extra, ensure_ascii=False)
+                )
+            )
+            self._replace_shorts(conn, job_id, shorts)
+
+        return self.get(job_id)
+
+    def _split_fields(self, fields):
+        columns = {k: v for k, v in fields.items() if k in JOB_COLUMNS}
+        extra = {k: v for k, v in fields.items() if k not in JOB_COLUMNS}
+        return columns, extra
+
+    def exists(self, job_id):
+        row = self._conn().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None
+
+    def get(self, job_id, include_shorts=True):
+        """Devuelve el trabajo como diccionario (con sus shorts) o None si no existe"""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        if include_shorts:
+            job['shorts'] = self.get_shorts(job_id)
+        return job
+
+    def get_shorts(self, job_id):
+        rows = self._conn().execute(
+            "SELECT data FROM shorts WHERE job_id = ? ORDER BY short_id", (job_id,)
+        ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def update(self, job_id, **fields):
+        """
+        Actualiza campos de un trabajo. Los campos sin columna propia se
+        combinan con los existentes en 'extra'; 'shorts' reemplaza la lista.
+        """
+        shorts = fields.pop('shorts', None)
+        columns, extra = self._split_fields(fields)
+        columns.pop('id', None)
+        columns['updated_at'] = time.time()
+        if fields.get('status') in TERMINAL_STATUSES:
+            columns.setdefault('finished_at', columns['updated_at'])
+
+        with self._transaction() as conn:
+            if extra:
+                row = conn.execute("SELECT extra FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    raise KeyError(job_id)
+                merged = json.loads(row['extra'])
+                merged.update(extra)
+                columns['extra'] = json.dumps(merged, ensure_ascii=False)
+
+            assignments = ', '.join(f"{key} = ?" for key in columns)
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?",
+                (*columns.values(), job_id)
+            )
+            if cursor.rowcount == 0:
+                raise KeyError(job_id)
+
+            if shorts is not None:
+                self._replace_shorts(conn, job_id, shorts)
+                for short in shorts:
+                    self._insert_event(conn, job_id, 'short', short)
+
+            delta = {key: fields[key] for key in PROGRESS_FIELDS if key in fields}
+            if delta:
+                self._insert_event(conn, job_id, 'progress', delta)
+            if fields.get('status') in TERMINAL_STATUSES:
+                self._insert_event(conn, job_id, 'done', {
+                    'status': fields['status'],
+                    'message': fields.get('message')
+                })
+
+    def _replace_shorts(self, conn, job_id, shorts):
+        conn.execute("DELETE FROM shorts WHERE job_id = ?", (job_id,))
+        for short in shorts:
+            self._insert_short(conn, job_id, short)
+
+    def _insert_short(self, conn, job_id, short):
+        conn.execute(
+            "INSERT OR REPLACE INTO shorts (job_id, short_id, filename, data) VALUES (?, ?, ?, ?)",
+            (job_id, short['id'], short['filename'], json.dumps(short, ensure_ascii=False))
+        )
+
+    def add_short(self, job_id, short):
+        """Agrega (o reemplaza) un short de un trabajo"""
+        with self._transaction() as conn:
+            self._insert_short(conn, job_id, short)
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+            self._insert_event(conn, job_id, 'short', short)
+
+    def clear_shorts(self, job_id, keep=()):
+        """
+        Elimina los shorts de un trabajo salvo los de ids en keep (los que
+        una ejecución reanudada reutiliza de sus checkpoints)
+
+        Returns:
+            Cantidad de shorts eliminados
+        """
+        keep = list(keep)
+        condition = f" AND short_id NOT IN ({', '.join('?' for _ in keep)})" if keep else ""
+        with self._transaction() as conn:
+            cursor = conn.execute(f"DELETE FROM shorts WHERE job_id = ?{condition}", (job_id, *keep))
+        return cursor.rowcount
+
+    def delete_short(self, job_id, short_id):
+        """Elimina un short de un trabajo (por ejemplo de una ejecución anterior cuyo render falló)"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM shorts WHERE job_id = ? AND short_id = ?", (job_id, short_id))
+
+    def update_short(self, job_id, short_id, **fields):
+        """Actualiza campos de un short ya guardado"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT data FROM shorts WHERE job_id = ? AND short_id = ?", (job_id, short_id)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"{job_id}/{short_id}")
+            short = json.loads(row['data'])
+            short.update(fields)
+            self._insert_short(conn, job_id, short)
+
+    def _insert_event(self, conn, job_id, event_type, data):
+        conn.execute(
+            "INSERT INTO job_events (job_id, type, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, event_type, json.dumps(data, ensure_ascii=False), time.time())
+        )
+
+    def last_event_id(self, job_id):
+        row = self._conn().execute(
+            "SELECT MAX(id) FROM job_events WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    def get_events(self, job_id, after_id=0):
+        """Eventos de un trabajo con id mayor que after_id, en orden"""
+        rows = self._conn().execute(
+            "SELECT id, type, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after_id)
+        ).fetchall()
+        return [{'id': row['id'], 'type': row['type'], 'data': json.loads(row['data'])} for row in rows]
+
+    def wait_for_events(self, job_id, after_id, timeout):
+        """
+        Espera hasta timeout segundos a que haya eventos nuevos.
+
+        Las escrituras de este proceso despiertan la espera al instante; las
+        de otros procesos se detectan consultando la tabla cada segundo.
+        """
+        deadline = time.time() + timeout
+        while True:
+            events = self.get_events(job_id, after_id)
+            remaining = deadline - time.time()
+            if events or remaining <= 0:
+                return events
+            with self._events_changed:
+                self._events_changed.wait(min(remaining, 1.0))
+
+    def enqueue(self, job_id, max_queued, priority=0, **fields):
+        """
+        Pone un trabajo en la cola si hay lugar (admisión atómica).
+
+        Returns:
+            Posición en la cola (1 = el siguiente), o None si la cola está llena
+        """
+        now = time.time()
+        columns, extra = self._split_fields(fields)
+
+        with self._transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= max_queued:
+                return None
+
+            row = conn.execute("SELECT extra FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(job_id)
+            merged = json.loads(row['extra'])
+            merged.update(extra)
+            merged.pop('cancel_requested', None)
+            merged.pop('resume_attempts', None)
+
+            columns.update({
+                'status': 'queued',
+                'priority': priority,
+                'queued_at': now,
+                'started_at': None,
+                'finished_at': None,
+                'updated_at': now,
+                'extra': json.dumps(merged, ensure_ascii=False)
+            })
+            assignments = ', '.join(f"{key} = ?" for key in columns)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+            delta = {key: columns[key] for key in PROGRESS_FIELDS if key in columns}
+            self._insert_event(conn, job_id, 'progress', delta)
+
+        return self.queue_position(job_id)
+
+    def claim_next(self, max_running):
+        """
+        Toma el siguiente trabajo de la cola si hay menos de max_running en
+        proceso (contando todos los procesos que comparten la base de datos).
+
+        Returns:
+            El trabajo reclamado (ya en estado 'processing') o None
+        """
+        with self._transaction() as conn:
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'processing'").fetchone()[0]
+            if running >= max_running:
+                return None
+
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority DESC, queued_at ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', started_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, row['id'])
+            )
+            self._insert_event(conn, row['id'], 'progress', {'status': 'processing'})
+
+        job = self._row_to_job(row)
+        job.update({'status': 'processing', 'started_at': now})
+        return job
+
+    def queue_position(self, job_id):
+        """Posición de un trabajo en la cola (1 = el siguiente) o None si no está en cola"""
+        row = self._conn().execute(
+            "SELECT priority, queued_at FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority > ? OR (priority = ? AND queued_at < ?))",
+            (row['priority'], row['priority'], row['queued_at'])
+        ).fetchone()[0]
+        return ahead + 1
+
+    def count_by_status(self, status):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+        ).fetchone()[0]
+
+    def average_run_seconds(self, sample_size=20):
+        """Duración media de los últimos trabajos completados (None si no hay datos)"""
+        row = self._conn().execute(
+            "SELECT AVG(finished_at - started_at) FROM ("
+            "  SELECT started_at, finished_at FROM jobs"
+            "  WHERE status = 'completed' AND started_at IS NOT NULL AND finished_at IS NOT NULL"
+            "  ORDER BY finished_at DESC LIMIT ?"
+            ")",
+            (sample_size,)
+        ).fetchone()
+        return row[0]
+
+    def touch(self, job_ids):
+        """Actualiza updated_at (heartbeat de los trabajos en proceso)"""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany("UPDATE jobs SET updated_at = ? WHERE id = ?", [(now, job_id) for job_id in job_ids])
+
+    def requeue_stale(self, stale_seconds, max_attempts, message):
+        """
+        Vuelve a encolar los trabajos 'processing' sin heartbeat reciente (su
+        proceso murió) para que se reanuden desde sus checkpoints. Conservan
+        su lugar original en la cola. Tras max_attempts reanudaciones se
+        marcan como error para no repetir un trabajo que tumba al servidor.
+
+        Returns:
+            Tupla (ids reencolados, ids marcados como error)
+        """
+        cutoff = time.time() - stale_seconds
+        requeued, failed = [], []
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, extra FROM jobs WHERE status = 'processing' AND updated_at < ?", (cutoff,)
+            ).fetchall()
+            now = time.time()
+            for row in rows:
+                job_id = row['id']
+                extra = json.loads(row['extra'])
+                attempts = extra.get('resume_attempts', 0)
+
+                if attempts >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'error', message = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                        (message, now, now, job_id)
+                    )
+                    self._insert_event(conn, job_id, 'progress', {'status': 'error', 'message': message})
+                    self._insert_event(conn, job_id, 'done', {'status': 'error', 'message': message})
+                    failed.append(job_id)
+                    continue
+
+                extra['resume_attempts'] = attempts + 1
+                extra.pop('cancel_requested', None)
+                resume_message = 'Reanudando tras un reinicio del servidor...'
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', message = ?, started_at = NULL, "
+                    "updated_at = ?, extra = ? WHERE id = ?",
+                    (resume_message, now, json.dumps(extra, ensure_ascii=False), job_id)
+                )
+                self._insert_event(conn, job_id, 'progress', {'status': 'queued', 'message': resume_message})
+                requeued.append(job_id)
+        return requeued, failed
+
+    def cancel_queued(self, job_id, message='Cancelado'):
+        """
+        Cancela un trabajo que todavía está en cola (atómico frente a claim_next).
+
+        Returns:
+            True si estaba en cola y quedó cancelado
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', message = ?, updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (message, now, now, job_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._insert_event(conn, job_id, 'progress', {'status': 'cancelled', 'message': message})
+            self._insert_event(conn, job_id, 'done', {'status': 'cancelled', 'message': message})
+        return True
+
+    def request_cancel(self, job_id):
+        """
+        Marca un trabajo en proceso para cancelar. El proceso que lo ejecuta
+        ve la marca (cancel_requested_ids) y detiene el pipeline.
+
+        Returns:
+            True si el trabajo estaba en proceso
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET extra = json_set(extra, '$.cancel_requested', 1), "
+                "message = 'Cancelando...', updated_at = ? WHERE id = ? AND status = 'processing'",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._insert_event(conn, job_id, 'progress', {'message': 'Cancelando...'})
+        return True
+
+    def cancel_requested_ids(self, job_ids):
+        """De los ids dados, los que tienen una cancelación pendiente"""
+        if not job_ids:
+            return []
+        placeholders = ', '.join('?' for _ in job_ids)
+        rows = self._conn().execute(
+            f"SELECT id FROM jobs WHERE id IN ({placeholders}) "
+            "AND json_extract(extra, '$.cancel_requested') = 1",
+            tuple(job_ids)
+        ).fetchall()
+        return [row['id'] for row in rows]
+
+    def list_jobs(self, statuses=None, created_from=None, created_to=None, cursor=None, limit=50, fields=None):
+        """
+        Lista trabajos paginando por cursor, del más reciente al más antiguo.
+
+        La paginación es por clave (created_at, id) en lugar de OFFSET, así que
+        el costo de cada página no crece con el historial y los trabajos nuevos
+        no desplazan las páginas siguientes.
+
+        Args:
+            statuses: Lista de estados a incluir (None = todos)
+            created_from: Fecha ISO mínima de creación (inclusive)
+            created_to: Fecha ISO máxima de creación (exclusiva)
+            cursor: Cursor opaco devuelto por la página anterior
+            limit: Máximo de trabajos por página
+            fields: Campos a devolver (None = todos salvo 'shorts'); los shorts
+                    sólo se cargan si se piden explícitamente
+
+        Returns:
+            Tupla (jobs, next_cursor); next_cursor es None en la última página
+        """
+        conditions = []
+        params = []
+
+        if statuses:
+            conditions.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if created_from:
+            conditions.append("created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            conditions.append("created_at < ?")
+            params.append(created_to)
+        if cursor:
+            cursor_created_at, cursor_id = self._decode_cursor(cursor)
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([cursor_created_at, cursor_created_at, cursor_id])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._conn().execute(
+            f"SELECT * FROM jobs {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+        jobs = [self._row_to_job(row) for row in rows]
+
+        if fields and 'shorts' in fields and jobs:
+            shorts_by_job = self._get_shorts_for_jobs([job['id'] for job in jobs])
+            for job in jobs:
+                job['shorts'] = shorts_by_job.get(job['id'], [])
+
+        if fields:
+            jobs = [{key: job[key] for key in fields if key in job} for job in jobs]
+
+        return jobs, next_cursor
+
+    def _get_shorts_for_jobs(self, job_ids):
+        rows = self._conn().execute(
+            f"SELECT job_id, data FROM shorts WHERE job_id IN ({', '.join('?' for _ in job_ids)}) "
+            f"ORDER BY job_id, short_id",
+            job_ids
+        ).fetchall()
+        shorts_by_job = {}
+        for row in rows:
+            shorts_by_job.setdefault(row['job_id'], []).append(json.loads(row['data']))
+        return shorts_by_job
+
+    def _encode_cursor(self, created_at, job_id):
+        raw = json.dumps([created_at, job_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def _decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, job_id = json.loads(base64.urlsafe_b64decode(padded))
+            return str(created_at), str(job_id)
+        except (ValueError, TypeError):
+            raise ValueError(f"Cursor inválido: {cursor}")
+
+    def touch_access(self, job_id):
+        """Registra una descarga de los archivos del trabajo (orden LRU del gestor de disco)"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET last_accessed_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def eviction_candidates(self, statuses, idle_before=None, limit=100):
+        """
+        Trabajos cuyos archivos pueden liberarse, del menos al más recientemente
+        usado (última descarga, o fin del trabajo si nunca se descargó)
+
+        Args:
+            statuses: Estados considerados (nunca los que están en cola o en proceso)
+            idle_before: Si se indica, sólo los que no se usan desde antes de este timestamp
+            limit: Cantidad máxima de trabajos
+        """
+        last_used = "COALESCE(last_accessed_at, finished_at, updated_at)"
+        params = list(statuses)
+        condition = ""
+        if idle_before is not None:
+            condition = f"AND {last_used} < ?"
+            params.append(idle_before)
+        rows = self._conn().execute(
+            f"SELECT * FROM jobs WHERE status IN ({', '.join('?' for _ in statuses)}) "
+            f"AND json_extract(extra, '$.files_evicted_at') IS NULL {condition} "
+            f"ORDER BY {last_used} ASC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def usage_records(self, created_from=None, created_to=None):
+        """
+        Uso de recursos registrado por cada trabajo (para sumar costos)
+
+        Returns:
+            Lista de diccionarios con id, status, filename, created_at, options y usage
+        """
+        conditions = ["json_extract(extra, '$.usage') IS NOT NULL"]
+        params = []
+        if created_from:
+            conditions.append("created_at >= ?")
+            params.append(created_from)
+        if created_to:
+            conditions.append("created_at < ?")
+            params.append(created_to)
+        rows = self._conn().execute(
+            "SELECT id, status, filename, created_at, json_extract(extra, '$.options') AS options, "
+            "json_extract(extra, '$.usage') AS usage "
+            f"FROM jobs WHERE {' AND '.join(conditions)}",
+            params
+        ).fetchall()
+        return [{
+            'id': row['id'],
+            'status': row['status'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'options': json.loads(row['options']) if row['options'] else {},
+            'usage': json.loads(row['usage'])
+        } for row in rows]
+
+    def all_ids(self):
+        return {row['id'] for row in self._conn().execute("SELECT id FROM jobs")}
+
+    def delete(self, job_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def purge(self):
+        """
+        Aplica la política de retención a los trabajos terminados:
+        - elimina los más antiguos que retention_days
+        - si hay más de max_jobs trabajos, elimina los terminados más antiguos
+
+        Returns:
+            Lista de ids eliminados
+        """
+        placeholders = ', '.join('?' for _ in TERMINAL_STATUSES)
+        deleted = []
+
+        with self._transaction() as conn:
+            if self.retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+                rows = conn.execute(
+                    f"SELECT id FROM jobs WHERE status IN ({placeholders}) AND created_at < ?",
+                    (*TERMINAL_STATUSES, cutoff)
+                ).fetchall()
+                deleted.extend(row['id'] for row in rows)
+
+            if self.max_jobs:
+                total = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - len(deleted)
+                excess = total - self.max_jobs
+                if excess > 0:
+                    rows = conn.execute(
+                        f"SELECT id FROM jobs WHERE status IN ({placeholders}) "
+                        f"ORDER BY created_at ASC LIMIT ? OFFSET ?",
+                        (*TERMINAL_STATUSES, excess, len(deleted))
+                    ).fetchall()
+                    deleted.extend(row['id'] for row in rows)
+
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in deleted])
+
+        if deleted:
+            print(f"🧹 Retención de trabajos: {len(deleted)} trabajos eliminados")
+        return deleted
+
+    def start_retention(self, interval=3600):
+        """Ejecuta purge() periódicamente en un hilo en segundo plano"""
+        if self._retention_thread is not None:
+            return
+
+        def retention_loop():
+            while True:
+                try:
+                    self.purge()
+                except Exception as e:
+                    print(f"⚠️  Error aplicando retención de trabajos: {e}")
+                time.sleep(interval)
+
+        self._retention_thread = threading.Thread(target=retention_loop, daemon=True)
+        self._retention_thread.start()
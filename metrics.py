@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import glob
+import socket
+import threading
+from contextlib import contextmanager
+
+# Buckets por defecto de los histogramas de duración (segundos)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Serie con etiquetas; cada combinación de valores de etiquetas es una muestra"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}, no {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            samples = [[list(key), self._copy(value)] for key, value in self._samples.items()]
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+            'samples': samples
+        }
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    """Valor que sólo aumenta (peticiones, bytes, segundos acumulados)"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (procesos activos, profundidad de la cola)"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribución de valores en buckets acumulables (duraciones)"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            # Se guarda por bucket (no acumulado) y se acumula al exponer
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+                    break
+            sample['sum'] += value
+            sample['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque (también si termina con una excepción)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _copy(self, value):
+        return {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+
+    def snapshot(self):
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso con exposición en formato de texto de
+    Prometheus.
+
+    Actualizar una métrica es una operación en memoria protegida por un lock
+    por métrica. Con varios procesos (gunicorn, workers de render) cada uno
+    escribe periódicamente una instantánea JSON en snapshot_dir, y render()
+    combina todas: contadores e histogramas se suman; los gauges sólo se
+    suman de instantáneas recientes (procesos vivos).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.snapshot_dir = None
+        self.snapshot_interval = 5
+        self._snapshot_thread = None
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    # --- Varios procesos ---
+
+    def enable_snapshots(self, snapshot_dir, interval=5):
+        """Escribe la instantánea de este proceso en snapshot_dir cada interval segundos"""
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = interval
+        os.makedirs(snapshot_dir, exist_ok=True)
+        if self._snapshot_thread is not None:
+            return
+
+        def snapshot_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    print(f"⚠️  Error guardando métricas: {e}")
+
+        self._snapshot_thread = threading.Thread(target=snapshot_loop, name="metrics-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def _snapshot_path(self):
+        # El nombre se calcula en el proceso que escribe (después del fork)
+        return os.path.join(self.snapshot_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+
+    def write_snapshot(self):
+        if not self.snapshot_dir:
+            return
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'written_at': time.time(), 'metrics': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def clear_snapshots(self, snapshot_dir=None):
+        """Borra las instantáneas de ejecuciones anteriores (al arrancar el servidor)"""
+        snapshot_dir = snapshot_dir or self.snapshot_dir
+        if not snapshot_dir:
+            return
+        for path in glob.glob(os.path.join(snapshot_dir, '*.json')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _collect(self):
+        """Instantáneas de todos los procesos (o sólo la propia si no hay snapshot_dir)"""
+        if not self.snapshot_dir:
+            return [(True, self.snapshot())]
+
+        self.write_snapshot()
+        fresh_after = time.time() - self.snapshot_interval * 3
+        snapshots = []
+        for path in glob.glob(os.path.join(self.snapshot_dir, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((data['written_at'] >= fresh_after, data['metrics']))
+        return snapshots
+
+    def render(self, local_metrics=()):
+        """
+        Texto en formato de exposición de Prometheus (versión 0.0.4)
+
+        Args:
+            local_metrics: Métricas no registradas que se exponen sólo desde este
+                           proceso (valores globales, como la cola en la base de datos)
+        """
+        merged = {}
+        snapshots = self._collect()
+        snapshots.append((True, {metric.name: metric.snapshot() for metric in local_metrics}))
+        for fresh, metrics in snapshots:
+            for name, data in metrics.items():
+                if data['type'] == 'gauge' and not fresh:
+                    continue
+                target = merged.setdefault(name, {**data, 'samples': {}})
+                for key, value in data['samples']:
+                    key = tuple(key)
+                    if data['type'] == 'histogram':
+                        current = target['samples'].setdefault(
+                            key, {'buckets': [0] * len(data['buckets']), 'sum': 0.0, 'count': 0}
+                        )
+                        current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                        current['sum'] += value['sum']
+                        current['count'] += value['count']
+                    else:
+                        target['samples'][key] = target['samples'].get(key, 0) + value
+
+        lines = []
+        for name in sorted(merged):
+            data = merged[name]
+            labelnames = data['labelnames']
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for key, value in sorted(data['samples'].items()):
+                if data['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(data['buckets'], value['buckets']):
+                        cumulative += count
+                        labels = _format_labels(labelnames, key, f'le="{_format_value(bound)}"')
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(labelnames, key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{labels} {value['count']}")
+                    labels = _format_labels(labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{labels} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Duración de cada etapa del pipeline
+STAGE_DURATION = REGISTRY.histogram(
+    'shorts_stage_duration_seconds',
+    'Duración de cada etapa del pipeline',
+    ('stage',)
+)
+
+# Cola de trabajos: es global (sale de la base de datos compartida), así que no se
+# registra para no sumarla una vez por proceso; /metrics la pasa en local_metrics
+JOBS_BY_STATUS = Gauge(
+    'shorts_jobs',
+    'Trabajos en cola o en proceso',
+    ('status',)
+)
+
+FFMPEG_ACTIVE = REGISTRY.gauge(
+    'shorts_ffmpeg_processes_active',
+    'Procesos FFmpeg / FFprobe en ejecución'
+)
+
+AI_REQUEST_DURATION = REGISTRY.histogram(
+    'shorts_ai_request_duration_seconds',
+    'Latencia de las peticiones a la API de IA',
+    ('provider', 'operation')
+)
+
+AI_RATE_LIMITED = REGISTRY.counter(
+    'shorts_ai_rate_limited_total',
+    'Respuestas 429 (rate limit) de la API de IA',
+    ('provider',)
+)
+
+UPLOAD_BYTES = REGISTRY.counter(
+    'shorts_upload_bytes_total',
+    'Bytes de video recibidos',
+    ('mode',)
+)
+
+# Procesos colgados ('stall') o que superaron su tiempo máximo ('timeout')
+WATCHDOG_KILLS = REGISTRY.counter(
+    'shorts_process_watchdog_kills_total',
+    'Procesos FFmpeg / FFprobe terminados por el watchdog',
+    ('reason',)
+)
+
+# Factor de tiempo real del render = rate(media) / rate(wall)
+RENDER_MEDIA_SECONDS = REGISTRY.counter(
+    'shorts_render_media_seconds_total',
+    'Segundos de video renderizados'
+)
+
+RENDER_WALL_SECONDS = REGISTRY.counter(
+    'shorts_render_wall_seconds_total',
+    'Segundos de reloj empleados en renders'
+)
+
+
+def is_rate_limit_error(error):
+    """True si la excepción de la API de IA es un 429"""
+    if getattr(error, 'status_code', None) == 429:
+        return True
+    text = str(error).lower()
+    return 'rate_limit' in text or '429' in text
+
+
+@contextmanager
+def ai_request(provider, operation):
+    """Mide una petición a la API de IA y cuenta los 429"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if is_rate_limit_error(e):
+            AI_RATE_LIMITED.inc(provider=provider)
+        raise
+    finally:
+        AI_REQUEST_DURATION.observe(time.perf_counter() - start, provider=provider, operation=operation)
@@ -0,0 +1,166 @@
+import re
+from process_runner import run_command
+from video_processor import LOUDNESS_SAMPLE_RATE as PCM_SAMPLE_RATE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Ventanas candidatas: duración, paso entre ventanas y cuántas se envían a la IA
+WINDOW_SECONDS = 60
+STEP_SECONDS = 10
+TOP_K = 10
+
+# Videos más cortos se analizan completos (la transcripción entra en un solo prompt)
+MIN_DURATION_FOR_RANKING = 15 * 60
+
+# Palabras que suelen acompañar a los momentos virales (español e inglés)
+KEYWORDS = (
+    'increíble', 'increible', 'brutal', 'locura', 'no puedo creer', 'no me lo creo', 'mira', 'miren',
+    'secreto', 'nunca', 'jamás', 'jamas', 'importante', 'atención', 'atencion', 'cuidado', 'error',
+    'dinero', 'gratis', 'verdad', 'mentira', 'problema', 'polémica', 'polemica', 'qué fuerte',
+    'dios mío', 'dios mio', 'madre mía', 'madre mia', 'wow', 'guau', 'omg',
+    'insane', 'crazy', 'unbelievable', 'amazing', 'secret', 'never', 'always', 'mistake', 'money',
+    'free', 'truth', 'look at', 'oh my god', 'what the', 'no way', 'holy'
+)
+KEYWORD_RE = re.compile(r'\b(?:' + '|'.join(re.escape(word) for word in KEYWORDS) + r')\b', re.IGNORECASE)
+# Exclamaciones, preguntas y risas
+EXCLAMATION_RE = re.compile(r'[!¡?¿]|\b(?:ja){2,}|\b(?:ha){2,}|\b(?:je){2,}', re.IGNORECASE)
+
+# Peso de cada señal (normalizada) en el puntaje de la ventana
+WEIGHTS = {
+    'speech_rate': 1.0,
+    'keywords': 1.0,
+    'exclamations': 0.8,
+    'loudness_peak': 1.2,
+    'dynamics': 0.8
+}
+
+
+class MomentRanker:
+    """
+    Preselección local de momentos antes del análisis con IA.
+
+    Desliza una ventana sobre la transcripción y el audio y calcula señales
+    baratas: velocidad del habla, densidad de palabras clave y de
+    exclamaciones / risas, picos de volumen y dinámica (variación del
+    volumen). Las señales se normalizan entre ventanas y se combinan en un
+    puntaje; sólo las TOP_K mejores ventanas (sin solaparse) llegan a
+    find_viral_moments. En un stream de varias horas la mayor parte es
+    relleno, así que el prompt se reduce en un orden de magnitud.
+    """
+
+    def __init__(self, context=None, window=WINDOW_SECONDS, step=STEP_SECONDS, top_k=TOP_K):
+        """
+        Args:
+            context: JobContext del trabajo (opcional)
+            window: Duración de cada ventana en segundos
+            step: Segundos entre el inicio de ventanas consecutivas
+            top_k: Cantidad de ventanas candidatas a devolver
+        """
+        self.context = context
+        self.window = window
+        self.step = step
+        self.top_k = top_k
+
+    def load_loudness(self, pcm_path=None, audio_path=None):
+        """
+        Volumen por segundo en dBFS
+
+        Args:
+            pcm_path: PCM s16le mono a PCM_SAMPLE_RATE de la ingesta
+            audio_path: Audio a decodificar si no hay PCM (ingestas anteriores)
+        """
+        if pcm_path:
+            samples = np.fromfile(pcm_path, dtype=np.int16)
+        elif audio_path:
+            cmd = ['ffmpeg', '-v', 'error', '-i', audio_path, '-ac', '1', '-ar', str(PCM_SAMPLE_RATE),
+                   '-f', 's16le', '-']
+            samples = np.frombuffer(run_command(cmd, self.context, check=True, text=False).stdout, dtype=np.int16)
+        else:
+            return None
+
+        seconds = len(samples) // PCM_SAMPLE_RATE
+        if seconds == 0:
+            return None
+        blocks = samples[:seconds * PCM_SAMPLE_RATE].reshape(seconds, PCM_SAMPLE_RATE).astype(np.float32) / 32768
+        rms = np.sqrt(np.mean(blocks ** 2, axis=1))
+        return 20 * np.log10(np.maximum(rms, 1e-5))
+
+    def _transcript_series(self, transcript, seconds):
+        """Palabras, palabras clave y exclamaciones por segundo (en el punto medio de cada segmento)"""
+        words = np.zeros(seconds, dtype=np.float32)
+        keywords = np.zeros(seconds, dtype=np.float32)
+        exclamations = np.zeros(seconds, dtype=np.float32)
+        for seg in transcript['segments']:
+            second = min(int((seg['start'] + seg['end']) / 2), seconds - 1)
+            text = seg.get('text', '')
+            words[second] += len(text.split())
+            keywords[second] += len(KEYWORD_RE.findall(text))
+            exclamations[second] += len(EXCLAMATION_RE.findall(text))
+        return words, keywords, exclamations
+
+    def rank(self, transcript, video_duration, pcm_path=None, audio_path=None):
+        """
+        Returns:
+            Ventanas candidatas ordenadas por tiempo: [{'start', 'end', 'score', 'signals'}]
+        """
+        if np is None:
+            print("⚠️  NumPy no está instalado: se analiza la transcripción completa")
+            return None
+
+        seconds = int(video_duration) + 1
+        if seconds <= self.window or not transcript.get('segments'):
+            return None
+
+        words, keywords, exclamations = self._transcript_series(transcript, seconds)
+        starts = np.arange(0, seconds - self.window + 1, self.step)
+
+        def window_sums(series):
+            cumulative = np.concatenate([[0], np.cumsum(series)])
+            return cumulative[starts + self.window] - cumulative[starts]
+
+        window_words = window_sums(words)
+        signals = {
+            'speech_rate': window_words / self.window,
+            'keywords': window_sums(keywords) / np.maximum(window_words, 1),
+            'exclamations': window_sums(exclamations) / np.maximum(window_words, 1)
+        }
+
+        loudness = self.load_loudness(pcm_path, audio_path)
+        if loudness is not None and len(loudness) >= self.window:
+            loudness = np.pad(loudness, (0, max(0, seconds - len(loudness))), constant_values=loudness.min())
+            windows = np.lib.stride_tricks.sliding_window_view(loudness, self.window)[starts]
+            # Picos respecto del volumen típico del video y variación dentro de la ventana
+            signals['loudness_peak'] = np.percentile(windows, 95, axis=1) - np.median(loudness)
+            signals['dynamics'] = windows.std(axis=1)
+
+        score = np.zeros(len(starts), dtype=np.float32)
+        for name, values in signals.items():
+            std = values.std()
+            if std > 0:
+                score += WEIGHTS[name] * (values - values.mean()) / std
+        # Las ventanas sin habla no pueden ser un short
+        score[window_words == 0] = -np.inf
+
+        selected = []
+        for index in np.argsort(score)[::-1]:
+            if len(selected) >= self.top_k or score[index] == -np.inf:
+                break
+            start = int(starts[index])
+            if all(abs(start - int(starts[other])) >= self.window for other in selected):
+                selected.append(index)
+
+        candidates = [{
+            'start': int(starts[index]),
+            'end': int(min(starts[index] + self.window, video_duration)),
+            'score': round(float(score[index]), 3),
+            'signals': {name: round(float(values[index]), 3) for name, values in signals.items()}
+        } for index in selected]
+        candidates.sort(key=lambda candidate: candidate['start'])
+
+        covered = sum(candidate['end'] - candidate['start'] for candidate in candidates)
+        print(f"🏁 Preselección local: {len(candidates)} ventanas candidatas "
+              f"({covered / 60:.0f} de {video_duration / 60:.0f} minutos)")
+        return candidates
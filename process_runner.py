@@ -0,0 +1,217 @@
+import os
+import time
+import tempfile
+import threading
+import subprocess
+from job_context import JobCancelled
+from metrics import FFMPEG_ACTIVE, WATCHDOG_KILLS
+from tracing import span
+
+# Watchdog: FFmpeg sin avanzar durante FFMPEG_STALL_TIMEOUT segundos se
+# considera colgado; el tiempo máximo es FFMPEG_TIMEOUT_FACTOR veces la
+# duración del medio (con un mínimo), y FFprobe tiene un tiempo fijo
+FFMPEG_STALL_TIMEOUT = float(os.getenv('FFMPEG_STALL_TIMEOUT', '120'))
+FFMPEG_TIMEOUT_FACTOR = float(os.getenv('FFMPEG_TIMEOUT_FACTOR', '10'))
+FFMPEG_MIN_TIMEOUT = float(os.getenv('FFMPEG_MIN_TIMEOUT', '300'))
+FFPROBE_TIMEOUT = float(os.getenv('FFPROBE_TIMEOUT', '120'))
+WATCHDOG_INTERVAL = 1
+
+# Reintento tras un cuelgue: ignorar errores de decodificación y descartar
+# paquetes corruptos (la causa típica de un FFmpeg colgado en un original dañado)
+SAFE_DECODE_ARGS = ['-err_detect', 'ignore_err', '-fflags', '+discardcorrupt+genpts']
+
+
+class ProcessStalled(subprocess.SubprocessError):
+    """El watchdog terminó un proceso colgado (sin progreso) o que superó su tiempo máximo"""
+
+    def __init__(self, cmd, reason, elapsed, stderr=None):
+        self.cmd = cmd
+        self.reason = reason
+        self.elapsed = elapsed
+        self.stderr = stderr
+
+    def __str__(self):
+        what = 'sin progreso' if self.reason == 'stall' else 'superó el tiempo máximo'
+        return f"{os.path.basename(self.cmd[0])} {what} ({self.elapsed:.0f}s), proceso terminado"
+
+
+class _AccountedPopen(subprocess.Popen):
+    """Popen que guarda el rusage del proceso (CPU, memoria máxima) al esperarlo"""
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        # Igual que Popen._try_wait pero con os.wait4, que además devuelve el rusage
+        try:
+            pid, status, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+        if pid == self.pid:
+            self.rusage = rusage
+        return pid, status
+
+
+# os.wait4 sólo existe en Unix
+_Popen = _AccountedPopen if hasattr(os, 'wait4') else subprocess.Popen
+
+
+def command_timeout(media_duration):
+    """Tiempo máximo de un FFmpeg que procesa media_duration segundos de medio"""
+    if not media_duration:
+        return None
+    return max(FFMPEG_MIN_TIMEOUT, media_duration * FFMPEG_TIMEOUT_FACTOR)
+
+
+def _with_safe_decode(cmd):
+    """Agrega SAFE_DECODE_ARGS antes de cada entrada (-i) del comando"""
+    safe_cmd = []
+    for i, arg in enumerate(cmd):
+        if arg == '-i' and i > 0:
+            safe_cmd += SAFE_DECODE_ARGS
+        safe_cmd.append(arg)
+    return safe_cmd
+
+
+def _read_progress(progress_path):
+    """
+    Último bloque de -progress de FFmpeg (frame, out_time_us, total_size):
+    si no cambia entre lecturas, FFmpeg no avanza
+    """
+    try:
+        with open(progress_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            tail = f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return None
+    values = {}
+    for line in tail.splitlines():
+        key, _, value = line.partition('=')
+        if key in ('frame', 'out_time_us', 'total_size'):
+            values[key] = value
+    return tuple(sorted(values.items())) or None
+
+
+def run_command(cmd, context=None, check=False, text=True, media_duration=None, timeout=None,
+                stall_timeout=None, retry_safe=True):
+    """
+    Ejecuta un comando externo (FFmpeg / FFprobe) como subprocess.run con
+    capture_output=True y text=True, pero registrado en el JobContext para
+    que cancelar el trabajo termine el proceso en curso. El CPU y la memoria
+    del proceso se suman al uso de recursos del trabajo (context.usage).
+
+    Un watchdog supervisa el proceso: FFmpeg informa su avance con -progress
+    y se termina si no avanza en stall_timeout segundos o si supera timeout.
+    Un FFmpeg colgado (sin progreso) se reintenta una vez con
+    SAFE_DECODE_ARGS, dentro de lo que queda de timeout; uno que superó el
+    tiempo máximo no se reintenta.
+
+    Args:
+        cmd: Lista con el comando y sus argumentos
+        context: JobContext del trabajo (opcional)
+        check: Si es True lanza CalledProcessError cuando el código de salida no es 0
+        text: False para leer la salida como bytes (por ejemplo fotogramas en bruto)
+        media_duration: Segundos de medio que procesa el comando (define el tiempo máximo)
+        timeout: Tiempo máximo en segundos (por defecto según media_duration; FFPROBE_TIMEOUT en FFprobe)
+        stall_timeout: Segundos sin progreso de FFmpeg (por defecto FFMPEG_STALL_TIMEOUT)
+        retry_safe: Reintentar una vez con decodificación tolerante tras un cuelgue
+
+    Returns:
+        subprocess.CompletedProcess
+
+    Raises:
+        JobCancelled si el trabajo se canceló mientras corría el proceso
+        ProcessStalled si el proceso se colgó (también en el reintento)
+    """
+    tool = os.path.basename(cmd[0])
+    if timeout is None:
+        timeout = FFPROBE_TIMEOUT if tool == 'ffprobe' else command_timeout(media_duration)
+    if stall_timeout is None and tool == 'ffmpeg':
+        stall_timeout = FFMPEG_STALL_TIMEOUT
+
+    try:
+        return _run_supervised(cmd, context, check, text, timeout, stall_timeout)
+    except ProcessStalled as e:
+        if not (retry_safe and tool == 'ffmpeg' and '-i' in cmd and e.reason == 'stall'):
+            raise
+        # El reintento comparte el presupuesto del comando: no duplica el tiempo total
+        remaining = timeout - e.elapsed if timeout else None
+        if remaining is not None and remaining <= 0:
+            raise
+        print(f"⚠️  {e}; se reintenta con decodificación tolerante a errores")
+        return _run_supervised(_with_safe_decode(cmd), context, check, text, remaining, stall_timeout)
+
+
+def _run_supervised(cmd, context, check, text, timeout, stall_timeout):
+    if context is not None:
+        context.check_cancelled()
+
+    # Sólo los FFmpeg que leen una entrada informan su avance
+    progress_path = None
+    if os.path.basename(cmd[0]) == 'ffmpeg' and '-i' in cmd and stall_timeout:
+        fd, progress_path = tempfile.mkstemp(prefix='ffmpeg-progress-', suffix='.txt')
+        os.close(fd)
+        cmd = [cmd[0], '-progress', progress_path] + cmd[1:]
+
+    process = _Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **({'text': True, 'errors': 'replace'} if text else {})
+    )
+
+    stalled = {}
+    finished = threading.Event()
+
+    def watchdog_loop():
+        started = last_progress = time.monotonic()
+        last_marker = None
+        while not finished.wait(WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            if progress_path:
+                marker = _read_progress(progress_path)
+                if marker != last_marker:
+                    last_marker, last_progress = marker, now
+            if timeout and now - started > timeout:
+                reason = 'timeout'
+            elif progress_path and now - last_progress > stall_timeout:
+                reason = 'stall'
+            else:
+                continue
+            stalled.update(reason=reason, elapsed=now - started)
+            WATCHDOG_KILLS.inc(reason=reason)
+            process.kill()
+            return
+
+    if timeout or progress_path:
+        threading.Thread(target=watchdog_loop, name="process-watchdog", daemon=True).start()
+
+    FFMPEG_ACTIVE.inc()
+    if context is not None:
+        context.register_process(process)
+    try:
+        with span(context, os.path.basename(cmd[0]), 'process', command=' '.join(cmd)[:500]):
+            stdout, stderr = process.communicate()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        finished.set()
+        FFMPEG_ACTIVE.dec()
+        if progress_path and os.path.exists(progress_path):
+            os.remove(progress_path)
+        if context is not None:
+            context.unregister_process(process)
+            if getattr(process, 'rusage', None) is not None:
+                context.usage.add_process(process.rusage)
+
+    if context is not None and context.cancelled:
+        raise JobCancelled(f"Trabajo {context.job_id} cancelado")
+    if stalled:
+        raise ProcessStalled(cmd, stalled['reason'], stalled['elapsed'], stderr)
+
+    result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return result
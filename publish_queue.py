@@ -0,0 +1,489 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado entre procesos
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publish_tasks (
+    id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    short_id INTEGER NOT NULL,
+    platform TEXT NOT NULL,
+    account TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    error TEXT,
+    worker_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    UNIQUE (job_id, short_id, platform, account)
+);
+CREATE INDEX IF NOT EXISTS idx_publish_tasks_pending ON publish_tasks(status, not_before);
+CREATE INDEX IF NOT EXISTS idx_publish_tasks_account ON publish_tasks(account, started_at);
+"""
+
+# Estados en los que una publicación ya no cambia
+FINISHED_STATUSES = ('published', 'failed', 'cancelled')
+
+# Ritmo por cuenta: segundos mínimos entre publicaciones y máximo en 24 horas
+MIN_INTERVAL_SECONDS = 30
+MAX_PER_DAY = 20
+# Reintentos con espera exponencial (base, 2x base, 4x base, ...)
+MAX_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 60
+
+
+def parse_publish_windows(value):
+    """
+    Ventanas horarias de publicación ('09:00-13:00,18:00-23:30', hora local)
+
+    Returns:
+        Lista de (minuto_inicio, minuto_fin) del día; vacía = sin restricción.
+        Una ventana que cruza la medianoche ('22:00-02:00') es válida.
+    """
+    windows = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start, end = part.split('-')
+            windows.append(tuple(int(h) * 60 + int(m) for h, m in (t.strip().split(':') for t in (start, end))))
+        except ValueError:
+            raise ValueError(f"Ventana de publicación inválida: '{part}' (formato HH:MM-HH:MM)")
+    return windows
+
+
+def _process_alive(claim_id):
+    """Si sigue vivo en este host el proceso de un claim '<host>-<pid>'"""
+    try:
+        pid = int(claim_id.rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Existe, pero es de otro usuario
+        return True
+    return True
+
+
+def in_publish_window(windows, now=None):
+    if not windows:
+        return True
+    moment = now or datetime.now()
+    minute = moment.hour * 60 + moment.minute
+    for start, end in windows:
+        if start <= end and start <= minute < end:
+            return True
+        if start > end and (minute >= start or minute < end):
+            return True
+    return False
+
+
+class PublishQueue:
+    """
+    Cola de publicaciones en redes sociales, separada del procesamiento.
+
+    El pipeline encola una publicación por short y termina el trabajo sin
+    esperar; un Publisher en segundo plano vacía la cola respetando el
+    ritmo de cada cuenta (intervalo mínimo y máximo diario), las ventanas
+    horarias y reintentando con espera exponencial. El estado de cada
+    publicación queda en la tarea y en el short del trabajo.
+
+    Igual que render_queue.py es un archivo SQLite con el journal clásico;
+    el control de ritmo se hace dentro de la transacción de claim(), así
+    que varios procesos pueden compartir la cola sin pasarse del límite.
+    """
+
+    def __init__(self, db_path, journal_mode='DELETE', min_interval=MIN_INTERVAL_SECONDS, max_per_day=MAX_PER_DAY,
+                 max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE_SECONDS):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite de la cola
+            journal_mode: Modo de journal de SQLite
+            min_interval: Segundos mínimos entre publicaciones de una misma cuenta
+            max_per_day: Publicaciones máximas por cuenta en 24 horas (0 = sin límite)
+            max_attempts: Intentos por publicación antes de darla por fallida
+            retry_base: Espera antes del primer reintento (se duplica en cada intento)
+        """
+        self.db_path = db_path
+        self.min_interval = min_interval
+        self.max_per_day = max_per_day
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # Una conexión heredada por fork (gunicorn) no se puede usar en el proceso hijo
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    def _row_to_task(self, row):
+        task = dict(row)
+        task['payload'] = json.loads(row['payload'])
+        return task
+
+    def enqueue(self, job_id, short_id, account, payload, platform='tiktok', not_before=None):
+        """
+        Encola la publicación de un short. Si ya estaba encolada (trabajo
+        reanudado) se conserva; si había fallado o se canceló, vuelve a la cola.
+
+        Args:
+            payload: {'video_path', 'caption', 'hashtags'}
+            not_before: Momento (epoch) a partir del cual publicar (programación)
+
+        Returns:
+            Id de la tarea
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, status FROM publish_tasks WHERE job_id = ? AND short_id = ? AND platform = ? AND account = ?",
+                (job_id, short_id, platform, account)
+            ).fetchone()
+            if row is None:
+                task_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO publish_tasks (id, job_id, short_id, platform, account, status, payload, not_before, "
+                    "created_at) VALUES (?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+                    (task_id, job_id, short_id, platform, account, json.dumps(payload, ensure_ascii=False),
+                     not_before or now, now)
+                )
+                return task_id
+            if row['status'] in ('failed', 'cancelled'):
+                conn.execute(
+                    "UPDATE publish_tasks SET status = 'pending', payload = ?, attempts = 0, error = NULL, "
+                    "not_before = ?, finished_at = NULL WHERE id = ?",
+                    (json.dumps(payload, ensure_ascii=False), not_before or now, row['id'])
+                )
+            return row['id']
+
+    def get(self, task_id):
+        row = self._conn().execute("SELECT * FROM publish_tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def tasks_for_job(self, job_id):
+        rows = self._conn().execute(
+            "SELECT * FROM publish_tasks WHERE job_id = ? ORDER BY created_at, short_id", (job_id,)
+        ).fetchall()
+        return [self._row_to_task(row) for row in rows]
+
+    def cancel_job(self, job_id):
+        """Cancela las publicaciones pendientes de un trabajo (las que están subiendo terminan)"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE publish_tasks SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'pending'",
+                (time.time(), job_id)
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        """Cantidad de publicaciones por estado"""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS count FROM publish_tasks GROUP BY status"
+        ).fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def purge(self, older_than_seconds=30 * 24 * 3600):
+        """Elimina publicaciones terminadas antiguas"""
+        cutoff = time.time() - older_than_seconds
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM publish_tasks WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*FINISHED_STATUSES, cutoff)
+            )
+        return cursor.rowcount
+
+    # --- Lado del publicador ---
+
+    def _account_available(self, conn, account, now):
+        """Ritmo de la cuenta: una subida a la vez, intervalo mínimo y máximo diario"""
+        row = conn.execute(
+            "SELECT MAX(started_at) AS last_started, "
+            "SUM(CASE WHEN status = 'running' THEN 1 ELSE 0 END) AS running, "
+            "SUM(CASE WHEN started_at >= ? AND status IN ('running', 'published') THEN 1 ELSE 0 END) AS last_day "
+            "FROM publish_tasks WHERE account = ? AND started_at IS NOT NULL",
+            (now - 86400, account)
+        ).fetchone()
+        if row['running']:
+            return False
+        if row['last_started'] and now - row['last_started'] < self.min_interval:
+            return False
+        if self.max_per_day and (row['last_day'] or 0) >= self.max_per_day:
+            return False
+        return True
+
+    def claim(self, worker_id):
+        """
+        Toma la publicación pendiente más antigua cuya cuenta puede publicar ahora
+
+        Returns:
+            La tarea (ya en estado 'running') o None
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT * FROM publish_tasks WHERE status = 'pending' AND not_before <= ? "
+                "ORDER BY not_before, created_at LIMIT 100",
+                (now,)
+            ).fetchall()
+            checked = {}
+            for row in rows:
+                account = row['account']
+                if account not in checked:
+                    checked[account] = self._account_available(conn, account, now)
+                if not checked[account]:
+                    continue
+                conn.execute(
+                    "UPDATE publish_tasks SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                    "started_at = ? WHERE id = ?",
+                    (worker_id, now, row['id'])
+                )
+                task = self._row_to_task(row)
+                task.update({'status': 'running', 'worker_id': worker_id, 'attempts': row['attempts'] + 1,
+                             'started_at': now})
+                return task
+        return None
+
+    def complete(self, task_id):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE publish_tasks SET status = 'published', error = NULL, finished_at = ? WHERE id = ?",
+                (time.time(), task_id)
+            )
+
+    def fail(self, task_id, error):
+        """
+        Reporta un error. Si quedan intentos la publicación vuelve a la cola
+        tras retry_base * 2^(intento - 1) segundos.
+
+        Returns:
+            Momento (epoch) del próximo intento, o None si quedó fallida
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM publish_tasks WHERE id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            if row['attempts'] < self.max_attempts:
+                retry_at = now + self.retry_base * 2 ** (row['attempts'] - 1)
+                conn.execute(
+                    "UPDATE publish_tasks SET status = 'pending', worker_id = NULL, error = ?, not_before = ? WHERE id = ?",
+                    (error, retry_at, task_id)
+                )
+                return retry_at
+            conn.execute(
+                "UPDATE publish_tasks SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, now, task_id)
+            )
+            return None
+
+    def running_claims(self, worker_prefix):
+        """Claims ('<host>-<pid>') con publicaciones en curso que empiezan por worker_prefix"""
+        rows = self._conn().execute(
+            "SELECT DISTINCT worker_id FROM publish_tasks WHERE status = 'running' AND worker_id LIKE ?",
+            (f"{worker_prefix}%",)
+        ).fetchall()
+        return [row['worker_id'] for row in rows]
+
+    def fail_interrupted(self, claim_ids):
+        """
+        Marca como fallidas las publicaciones que quedaron 'running' de los
+        claims indicados (procesos publicadores que murieron a mitad de una
+        subida). No se reintentan solas: la subida pudo haberse completado y
+        reintentarla publicaría el short dos veces.
+        """
+        if not claim_ids:
+            return 0
+        placeholders = ', '.join('?' for _ in claim_ids)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE publish_tasks SET status = 'failed', finished_at = ?, "
+                "error = 'Publicación interrumpida (reinicio del publicador)' "
+                f"WHERE status = 'running' AND worker_id IN ({placeholders})",
+                (time.time(), *claim_ids)
+            )
+        return cursor.rowcount
+
+
+class Publisher:
+    """
+    Vacía la cola de publicaciones en un hilo de fondo.
+
+    Cada tarea se publica con una sesión prestada por el pool de TikTok
+    (tiktok_session_pool.py) y su estado se refleja en el short del trabajo:
+    'publish_status' (queued, publishing, retrying, published, failed),
+    'publish_error', 'published_at' y 'tiktok_published'.
+
+    Sólo un publicador corre por host: start() toma un candado de archivo
+    junto a la cola (<cola>.publisher.lock), porque los perfiles de Chrome
+    del pool no se pueden abrir desde dos procesos. Normalmente corre en
+    su propio proceso (publish_worker.py).
+    """
+
+    def __init__(self, queue, job_store, session_pool, credentials, worker_id, windows=None, poll_interval=5):
+        """
+        Args:
+            queue: PublishQueue
+            job_store: JobStore donde se actualiza el estado de cada short
+            session_pool: TikTokSessionPool
+            credentials: Función que devuelve la contraseña de una cuenta
+            worker_id: Identificador del publicador (host); las tareas se toman como
+                       <worker_id>-<pid> y al arrancar las que quedaron 'running' de un
+                       proceso del mismo host que ya no existe se marcan interrumpidas
+            windows: Ventanas horarias de publicación (parse_publish_windows)
+            poll_interval: Segundos entre consultas a la cola
+        """
+        self.queue = queue
+        self.job_store = job_store
+        self.session_pool = session_pool
+        self.credentials = credentials
+        self.worker_id = worker_id
+        # Se fija en start(): con gunicorn el objeto se crea en el maestro antes del fork
+        self.claim_id = None
+        self.windows = windows or []
+        self.poll_interval = poll_interval
+        self.lock_path = f"{queue.db_path}.publisher.lock"
+        self._lock_file = None
+        self._thread = None
+
+    def _update_short(self, task, **fields):
+        try:
+            self.job_store.update_short(task['job_id'], task['short_id'], **fields)
+        except KeyError:
+            # El trabajo o el short se eliminaron (retención)
+            pass
+
+    def publish(self, task):
+        """Publica una tarea ya tomada de la cola y reporta el resultado"""
+        payload = task['payload']
+        print(f"📤 Publicando short {task['short_id']} del trabajo {task['job_id']} en {task['platform']} "
+              f"como {task['account']} (intento {task['attempts']})")
+        self._update_short(task, publish_status='publishing')
+        try:
+            with self.session_pool.lease(task['account'], self.credentials(task['account'])) as uploader:
+                success = uploader.upload_video(payload['video_path'], payload['caption'], payload.get('hashtags'))
+            error = None if success else 'La subida no se completó'
+        except Exception as e:
+            success = False
+            error = str(e)[-2000:]
+
+        if success:
+            self.queue.complete(task['id'])
+            self._update_short(task, publish_status='published', tiktok_published=True, publish_error=None,
+                               published_at=datetime.now().isoformat())
+            print(f"✅ Short {task['short_id']} publicado")
+            return True
+
+        retry_at = self.queue.fail(task['id'], error)
+        if retry_at:
+            print(f"⚠️  Error publicando el short {task['short_id']}: {error} "
+                  f"(reintento en {retry_at - time.time():.0f}s)")
+            self._update_short(task, publish_status='retrying', publish_error=error)
+        else:
+            print(f"❌ Publicación del short {task['short_id']} fallida: {error}")
+            self._update_short(task, publish_status='failed', tiktok_published=False, publish_error=error)
+        return False
+
+    def run_once(self):
+        """Publica la siguiente tarea disponible; False si no había ninguna"""
+        if not in_publish_window(self.windows):
+            return False
+        task = self.queue.claim(self.claim_id)
+        if task is None:
+            return False
+        self.publish(task)
+        return True
+
+    def _acquire_lock(self):
+        """Candado exclusivo del publicador; False si otro proceso ya lo tiene"""
+        if fcntl is None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Se mantiene abierto mientras viva el proceso
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """
+        Arranca el hilo del publicador
+
+        Returns:
+            False si ya hay otro publicador corriendo en este host
+        """
+        if self._thread is not None:
+            return True
+        if not self._acquire_lock():
+            print(f"ℹ️  Ya hay un publicador en ejecución ({self.lock_path}), no se inicia otro")
+            return False
+
+        self.claim_id = f"{self.worker_id}-{os.getpid()}"
+        dead = [claim for claim in self.queue.running_claims(f"{self.worker_id}-")
+                if claim != self.claim_id and not _process_alive(claim)]
+        interrupted = self.queue.fail_interrupted(dead)
+        if interrupted:
+            print(f"⚠️  {interrupted} publicaciones interrumpidas por un reinicio marcadas como fallidas")
+
+        def publish_loop():
+            while True:
+                try:
+                    published = self.run_once()
+                except Exception as e:
+                    print(f"⚠️  Error en el publicador: {e}")
+                    published = False
+                if not published:
+                    time.sleep(self.poll_interval)
+
+        self._thread = threading.Thread(target=publish_loop, name="publisher", daemon=True)
+        self._thread.start()
+        print(f"📤 Publicador {self.claim_id} iniciado")
+        return True
@@ -0,0 +1,75 @@
+"""
+Publicador de shorts en redes sociales.
+
+Vacía la cola de publicaciones (publish_queue.py) con las sesiones de
+TikTok del pool (tiktok_session_pool.py). Debe correr un solo publicador
+por host: los perfiles de Chrome con login no se pueden abrir desde dos
+procesos, así que los procesos web no publican (PUBLISHER_ENABLED=false)
+y este proceso toma el candado del publicador al arrancar.
+
+Uso:
+    python publish_worker.py
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+from dotenv import load_dotenv
+from job_store import JobStore
+from publish_queue import PublishQueue, Publisher, parse_publish_windows
+from tiktok_session_pool import TikTokSessionPool, tiktok_credentials, tiktok_password
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Publicador de shorts de AI Shorts Creator')
+    parser.add_argument('--poll-interval', type=float, default=5,
+                        help='Segundos entre consultas a la cola de publicaciones')
+    args = parser.parse_args()
+
+    data_folder = 'data'
+    queue = PublishQueue(
+        os.getenv('PUBLISH_QUEUE_PATH', os.path.join(data_folder, 'publish_queue.db')),
+        min_interval=int(os.getenv('PUBLISH_MIN_INTERVAL', '30')),
+        max_per_day=int(os.getenv('PUBLISH_MAX_PER_DAY', '20')),
+        max_attempts=int(os.getenv('PUBLISH_MAX_ATTEMPTS', '4')),
+        retry_base=int(os.getenv('PUBLISH_RETRY_BASE', '60'))
+    )
+    # El estado de publicación de cada short se guarda en el trabajo
+    job_store = JobStore(os.getenv('JOB_DB_PATH', os.path.join(data_folder, 'jobs.db')))
+    session_pool = TikTokSessionPool(
+        os.getenv('TIKTOK_PROFILES_DIR', os.path.join(data_folder, 'tiktok_profiles')),
+        sessions_per_account=int(os.getenv('TIKTOK_SESSIONS_PER_ACCOUNT', '1')),
+        idle_timeout=int(os.getenv('TIKTOK_SESSION_IDLE_TIMEOUT', '1800')),
+        profile_max_age_days=float(os.getenv('TIKTOK_PROFILE_MAX_AGE_DAYS', '30'))
+    )
+    publisher = Publisher(
+        queue,
+        job_store,
+        session_pool,
+        tiktok_password,
+        socket.gethostname(),
+        windows=parse_publish_windows(os.getenv('PUBLISH_WINDOWS', '')),
+        poll_interval=args.poll_interval
+    )
+
+    if not publisher.start():
+        sys.exit(1)
+    session_pool.start()
+    # Abrir el navegador e iniciar sesión antes de la primera publicación
+    if os.getenv('TIKTOK_USERNAME'):
+        session_pool.warm(*tiktok_credentials())
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        # Una subida en curso queda 'running' y se marca interrumpida al volver a arrancar
+        session_pool.close()
+        print("👋 Publicador detenido")
+
+
+if __name__ == '__main__':
+    main()
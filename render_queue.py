@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS render_tasks (
+    id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    short_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_render_tasks_pending ON render_tasks(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_render_tasks_job ON render_tasks(job_id);
+"""
+
+# Estados en los que una tarea ya no cambia
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+
+class RenderError(Exception):
+    """Un render distribuido falló (después de agotar los reintentos)"""
+
+
+class RenderQueue:
+    """
+    Cola de renders compartida entre el servidor web y los workers de render.
+
+    El servidor encola una tarea por short (video de entrada, rango de
+    tiempo, modo de pantalla dividida, subtítulos y texto viral) y espera
+    el resultado; cada worker (render_worker.py) toma tareas, ejecuta
+    VideoProcessor.create_short y reporta el resultado y heartbeats.
+
+    Es un archivo SQLite pensado para vivir en almacenamiento compartido
+    (NFS, SMB, volumen de Docker). Por eso usa el journal clásico en lugar
+    de WAL, que requiere memoria compartida entre procesos de la misma
+    máquina. Las rutas de los videos se guardan tal cual: todos los nodos
+    deben ver uploads/ y outputs/ en la misma ruta.
+    """
+
+    def __init__(self, db_path, journal_mode='DELETE', stale_after=120, max_attempts=3):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite de la cola
+            journal_mode: Modo de journal de SQLite ('DELETE' funciona en disco compartido)
+            stale_after: Segundos sin heartbeat tras los que una tarea se reasigna
+            max_attempts: Intentos por tarea antes de darla por fallida
+        """
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # Una conexión heredada por fork (gunicorn) no se puede usar en el proceso hijo
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    def _row_to_task(self, row):
+        task = dict(row)
+        task['payload'] = json.loads(row['payload'])
+        task['result'] = json.loads(row['result']) if row['result'] else None
+        return task
+
+    # --- Lado del servidor ---
+
+    def submit(self, job_id, short_id, payload):
+        """
+        Encola el render de un short
+
+        Args:
+            job_id: Trabajo al que pertenece
+            short_id: Número del short dentro del trabajo
+            payload: Argumentos de VideoProcessor.create_short (serializables a JSON)
+
+        Returns:
+            Id de la tarea
+        """
+        task_id = str(uuid.uuid4())
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO render_tasks (id, job_id, short_id, status, payload, created_at) "
+                "VALUES (?, ?, ?, 'pending', ?, ?)",
+                (task_id, job_id, short_id, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        return task_id
+
+    def get(self, task_id):
+        row = self._conn().execute("SELECT * FROM render_tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._row_to_task(row) if row else None
+
+    def wait(self, task_id, context=None, poll_interval=1.0, timeout=None):
+        """
+        Espera a que una tarea termine
+
+        Returns:
+            Resultado reportado por el worker
+
+        Raises:
+            RenderError si la tarea falló, JobCancelled si el trabajo se canceló
+        """
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            task = self.get(task_id)
+            if task is None:
+                raise RenderError(f"Tarea de render {task_id} no encontrada")
+            if task['status'] == 'done':
+                return task['result']
+            if task['status'] == 'failed':
+                raise RenderError(task['error'] or 'Error en el worker de render')
+            if task['status'] == 'cancelled':
+                if context is not None:
+                    context.check_cancelled()
+                raise RenderError('Render cancelado')
+
+            if deadline and time.time() > deadline:
+                raise RenderError(f"Tiempo de espera agotado para el render {task_id}")
+            if context is not None:
+                context.sleep(poll_interval)
+            else:
+                time.sleep(poll_interval)
+
+    def cancel_job(self, job_id):
+        """Cancela las tareas pendientes de un trabajo y pide detener las que están corriendo"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE render_tasks SET status = 'cancelled', finished_at = ? "
+                "WHERE job_id = ? AND status = 'pending'",
+                (now, job_id)
+            )
+            conn.execute(
+                "UPDATE render_tasks SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'",
+                (job_id,)
+            )
+
+    def stats(self):
+        """Cantidad de tareas por estado"""
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS count FROM render_tasks GROUP BY status"
+        ).fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def purge(self, older_than_seconds=7 * 24 * 3600):
+        """Elimina tareas terminadas antiguas"""
+        cutoff = time.time() - older_than_seconds
+        placeholders = ', '.join('?' for _ in FINISHED_STATUSES)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM render_tasks WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*FINISHED_STATUSES, cutoff)
+            )
+        return cursor.rowcount
+
+    # --- Lado del worker ---
+
+    def claim(self, worker_id):
+        """
+        Toma la tarea pendiente más antigua. Antes reasigna las tareas cuyo
+        worker dejó de enviar heartbeats (murió o perdió la conexión).
+
+        Returns:
+            La tarea (ya en estado 'running') o None si no hay pendientes
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            self._requeue_stale(conn, now)
+
+            row = conn.execute(
+                "SELECT * FROM render_tasks WHERE status = 'pending' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE render_tasks SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+                "claimed_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker_id, now, now, row['id'])
+            )
+
+        task = self._row_to_task(row)
+        task.update({'status': 'running', 'worker_id': worker_id, 'attempts': row['attempts'] + 1})
+        return task
+
+    def _requeue_stale(self, conn, now):
+        cutoff = now - self.stale_after
+        conn.execute(
+            "UPDATE render_tasks SET status = 'failed', finished_at = ?, "
+            "error = 'El worker de render dejó de responder' "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (now, cutoff, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE render_tasks SET status = 'pending', worker_id = NULL "
+            "WHERE status = 'running' AND heartbeat_at < ?",
+            (cutoff,)
+        )
+
+    def heartbeat(self, task_id, worker_id):
+        """
+        Marca la tarea como viva
+
+        Returns:
+            True si el servidor pidió cancelarla
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE render_tasks SET heartbeat_at = ? WHERE id = ? AND worker_id = ?",
+                (time.time(), task_id, worker_id)
+            )
+            row = conn.execute(
+                "SELECT cancel_requested FROM render_tasks WHERE id = ?", (task_id,)
+            ).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def complete(self, task_id, worker_id, result):
+        """Reporta el resultado de una tarea terminada"""
+        self._finish(task_id, worker_id, 'done', result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, task_id, worker_id, error):
+        """
+        Reporta un error. Si quedan intentos la tarea vuelve a la cola para
+        otro worker; si no, queda fallida.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM render_tasks WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (task_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return
+            if row['attempts'] < self.max_attempts:
+                conn.execute(
+                    "UPDATE render_tasks SET status = 'pending', worker_id = NULL, error = ? WHERE id = ?",
+                    (error, task_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE render_tasks SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (error, time.time(), task_id)
+                )
+
+    def mark_cancelled(self, task_id, worker_id):
+        self._finish(task_id, worker_id, 'cancelled')
+
+    def _finish(self, task_id, worker_id, status, result=None):
+        with self._transaction() as conn:
+            # Sólo el worker que tiene la tarea puede cerrarla (pudo haberse reasignado)
+            conn.execute(
+                "UPDATE render_tasks SET status = ?, result = ?, finished_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, result, time.time(), task_id, worker_id)
+            )
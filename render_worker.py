@@ -0,0 +1,134 @@
+"""
+Worker de render distribuido.
+
+Toma tareas de la cola de renders compartida (render_queue.py), genera cada
+short con VideoProcessor.create_short y reporta el resultado al servidor.
+Se pueden lanzar tantos workers como se quiera, en una o varias máquinas,
+siempre que todas vean la cola y las carpetas uploads/ y outputs/ en la
+misma ruta.
+
+Uso:
+    python render_worker.py [--concurrency 2]
+"""
+import os
+import time
+import socket
+import argparse
+import threading
+from dotenv import load_dotenv
+from video_processor import VideoProcessor
+from render_queue import RenderQueue
+from job_context import JobContext, JobCancelled
+from metrics import REGISTRY
+
+
+class RenderWorker:
+    """Ejecuta las tareas de la cola de renders, una por hilo"""
+
+    def __init__(self, queue, temp_folder, worker_id, poll_interval=2.0, heartbeat_interval=10):
+        """
+        Args:
+            queue: RenderQueue compartida
+            temp_folder: Carpeta local para archivos temporales (subtítulos ASS)
+            worker_id: Identificador del worker (host y pid)
+            poll_interval: Segundos entre consultas a la cola cuando está vacía
+            heartbeat_interval: Segundos entre heartbeats de la tarea en curso
+        """
+        self.queue = queue
+        self.temp_folder = temp_folder
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+    def run_forever(self, concurrency=1):
+        threads = []
+        for i in range(concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"{self.worker_id}/{i+1}",), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        print(f"🎬 Worker de render {self.worker_id} iniciado ({concurrency} renders simultáneos)")
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            # Las tareas en curso quedan sin heartbeat y otro worker las retoma
+            print("👋 Worker de render detenido")
+
+    def _loop(self, slot_id):
+        while True:
+            try:
+                task = self.queue.claim(slot_id)
+            except Exception as e:
+                print(f"⚠️  Error consultando la cola de renders: {e}")
+                task = None
+
+            if task is None:
+                time.sleep(self.poll_interval)
+                continue
+
+            self.run_task(task, slot_id)
+
+    def run_task(self, task, slot_id):
+        """Renderiza un short y reporta el resultado"""
+        context = JobContext(task['job_id'])
+        stop_heartbeat = threading.Event()
+
+        def heartbeat_loop():
+            while not stop_heartbeat.wait(self.heartbeat_interval):
+                try:
+                    if self.queue.heartbeat(task['id'], slot_id):
+                        context.cancel()
+                except Exception as e:
+                    print(f"⚠️  Error enviando heartbeat: {e}")
+
+        heartbeat = threading.Thread(target=heartbeat_loop, daemon=True)
+        heartbeat.start()
+
+        print(f"🎬 [{slot_id}] Render del short {task['short_id']} del trabajo {task['job_id']} (intento {task['attempts']})")
+        started = time.time()
+        try:
+            payload = task['payload']
+            VideoProcessor(self.temp_folder, context).create_short(**payload)
+            self.queue.complete(task['id'], slot_id, {
+                'output_path': payload['output_path'],
+                'size': os.path.getsize(payload['output_path']),
+                'render_seconds': round(time.time() - started, 2),
+                'worker_id': slot_id,
+                'usage': context.usage.to_dict()
+            })
+            print(f"✅ [{slot_id}] Short {task['short_id']} listo en {time.time() - started:.1f}s")
+        except JobCancelled:
+            self.queue.mark_cancelled(task['id'], slot_id)
+        except Exception as e:
+            print(f"❌ [{slot_id}] Error en el render: {e}")
+            self.queue.fail(task['id'], slot_id, str(e)[-2000:])
+        finally:
+            stop_heartbeat.set()
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Worker de render distribuido de AI Shorts Creator')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('RENDER_WORKER_CONCURRENCY', '1')),
+                        help='Renders simultáneos en este worker')
+    args = parser.parse_args()
+
+    queue = RenderQueue(
+        os.getenv('RENDER_QUEUE_PATH', os.path.join('data', 'render_queue.db')),
+        journal_mode=os.getenv('RENDER_QUEUE_JOURNAL', 'DELETE')
+    )
+    # Las métricas de los renders se suman en el /metrics del servidor
+    REGISTRY.enable_snapshots(os.getenv('METRICS_DIR', os.path.join('data', 'metrics')))
+
+    worker = RenderWorker(
+        queue,
+        os.getenv('RENDER_TEMP_FOLDER', 'temp'),
+        f"{socket.gethostname()}-{os.getpid()}"
+    )
+    worker.run_forever(args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import threading
+
+# Precios estimados en USD: tokens por millón y audio por minuto. Se pueden
+# reemplazar o ampliar con AI_MODEL_PRICES (JSON con la misma forma).
+MODEL_PRICES = {
+    'whisper-1': {'audio_minute': 0.006},
+    'gpt-3.5-turbo': {'prompt': 0.5, 'completion': 1.5},
+    'gpt-3.5-turbo-1106': {'prompt': 1.0, 'completion': 2.0},
+    'claude-3-haiku-20240307': {'prompt': 0.25, 'completion': 1.25},
+}
+MODEL_PRICES.update(json.loads(os.getenv('AI_MODEL_PRICES', '{}')))
+
+# ru_maxrss está en KB en Linux y en bytes en macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def directory_bytes(path):
+    """Bytes ocupados por los archivos de una carpeta (0 si no existe)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def model_cost(model, usage):
+    """Costo estimado en USD del uso de un modelo (None si no tiene precio)"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    cost = (usage.get('prompt_tokens', 0) * prices.get('prompt', 0) +
+            usage.get('completion_tokens', 0) * prices.get('completion', 0)) / 1e6
+    cost += usage.get('audio_seconds', 0) / 60 * prices.get('audio_minute', 0)
+    return round(cost, 6)
+
+
+class JobUsage:
+    """
+    Recursos consumidos por un trabajo: CPU y memoria de sus procesos FFmpeg,
+    pico de disco temporal y uso de la API de IA (minutos de audio y tokens
+    por modelo, con costo estimado).
+
+    Se acumula en memoria durante el pipeline (desde varios hilos) y se
+    guarda en el trabajo como 'usage'. Al reanudar un trabajo se parte del
+    uso ya registrado: los intentos fallidos también cuestan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processes = 0
+        self.cpu_user_seconds = 0.0
+        self.cpu_system_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.peak_temp_disk_bytes = 0
+        self.ai = {}
+        self._disk_stop = None
+
+    def add_process(self, rusage):
+        """Suma el rusage de un proceso hijo terminado (os.wait4)"""
+        with self._lock:
+            self.processes += 1
+            self.cpu_user_seconds += rusage.ru_utime
+            self.cpu_system_seconds += rusage.ru_stime
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rusage.ru_maxrss * _MAXRSS_UNIT)
+
+    def _model(self, model):
+        return self.ai.setdefault(model, {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'audio_seconds': 0.0})
+
+    def add_tokens(self, model, prompt_tokens, completion_tokens):
+        with self._lock:
+            usage = self._model(model)
+            usage['requests'] += 1
+            usage['prompt_tokens'] += prompt_tokens or 0
+            usage['completion_tokens'] += completion_tokens or 0
+
+    def add_audio(self, model, seconds):
+        with self._lock:
+            usage = self._model(model)
+            usage['requests'] += 1
+            usage['audio_seconds'] += seconds or 0
+
+    def add_response(self, model, response):
+        """Registra los tokens de una respuesta de OpenAI o Anthropic"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return
+        if hasattr(usage, 'prompt_tokens'):
+            self.add_tokens(model, usage.prompt_tokens, usage.completion_tokens)
+        else:
+            self.add_tokens(model, getattr(usage, 'input_tokens', 0), getattr(usage, 'output_tokens', 0))
+
+    def sample_disk(self, path):
+        size = directory_bytes(path)
+        with self._lock:
+            self.peak_temp_disk_bytes = max(self.peak_temp_disk_bytes, size)
+        return size
+
+    def watch_disk(self, path, interval=5):
+        """Mide el tamaño de la carpeta temporal cada interval segundos hasta stop_watching()"""
+        if self._disk_stop is not None:
+            return
+        stop = self._disk_stop = threading.Event()
+
+        def disk_loop():
+            while True:
+                self.sample_disk(path)
+                if stop.wait(interval):
+                    break
+
+        threading.Thread(target=disk_loop, name="job-disk-usage", daemon=True).start()
+
+    def stop_watching(self):
+        if self._disk_stop is not None:
+            self._disk_stop.set()
+            self._disk_stop = None
+
+    def merge(self, data):
+        """Suma un uso guardado con to_dict() (ejecución anterior, worker de render)"""
+        if not data:
+            return
+        with self._lock:
+            self.processes += data.get('processes', 0)
+            self.cpu_user_seconds += data.get('cpu_user_seconds', 0)
+            self.cpu_system_seconds += data.get('cpu_system_seconds', 0)
+            self.peak_rss_bytes = max(self.peak_rss_bytes, data.get('peak_rss_bytes', 0))
+            self.peak_temp_disk_bytes = max(self.peak_temp_disk_bytes, data.get('peak_temp_disk_bytes', 0))
+            for model, usage in data.get('ai', {}).items():
+                current = self._model(model)
+                for key in ('requests', 'prompt_tokens', 'completion_tokens', 'audio_seconds'):
+                    current[key] += usage.get(key, 0)
+
+    def to_dict(self):
+        with self._lock:
+            ai = {model: dict(usage) for model, usage in self.ai.items()}
+            data = {
+                'processes': self.processes,
+                'cpu_user_seconds': round(self.cpu_user_seconds, 3),
+                'cpu_system_seconds': round(self.cpu_system_seconds, 3),
+                'peak_rss_bytes': self.peak_rss_bytes,
+                'peak_temp_disk_bytes': self.peak_temp_disk_bytes
+            }
+        return _with_totals(data, ai)
+
+
+def _with_totals(data, ai):
+    """Agrega costos por modelo y totales de CPU, audio, tokens y costo"""
+    total_cost = 0.0
+    for model, usage in ai.items():
+        usage['audio_seconds'] = round(usage['audio_seconds'], 3)
+        usage['cost_usd'] = model_cost(model, usage)
+        total_cost += usage['cost_usd'] or 0
+    data.update({
+        'cpu_seconds': round(data['cpu_user_seconds'] + data['cpu_system_seconds'], 3),
+        'ai': ai,
+        'audio_minutes': round(sum(usage['audio_seconds'] for usage in ai.values()) / 60, 3),
+        'prompt_tokens': sum(usage['prompt_tokens'] for usage in ai.values()),
+        'completion_tokens': sum(usage['completion_tokens'] for usage in ai.values()),
+        'estimated_cost_usd': round(total_cost, 6)
+    })
+    return data
+
+
+def sum_usage(usages):
+    """
+    Suma el uso de varios trabajos: CPU, tokens, audio y costo se suman; los
+    picos (memoria, disco) quedan como el máximo entre trabajos
+    """
+    total = JobUsage()
+    for usage in usages:
+        total.merge(usage)
+    return total.to_dict()
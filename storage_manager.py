@@ -0,0 +1,317 @@
+import os
+import re
+import glob
+import time
+import shutil
+import threading
+from job_store import TERMINAL_STATUSES
+
+# Los archivos de cada trabajo llevan su id (uuid) en el nombre
+JOB_ID_PATTERN = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+UPLOAD_NAME_RE = re.compile(rf'^({JOB_ID_PATTERN})_')
+OUTPUT_NAME_RE = re.compile(rf'^short_({JOB_ID_PATTERN})_')
+
+GB = 1024 ** 3
+
+
+def _path_size(path):
+    """Tamaño de un archivo o de una carpeta completa (0 si ya no existe)"""
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+    except OSError:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _remove_path(path):
+    """Elimina un archivo o carpeta; otro proceso pudo haberlo borrado antes"""
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class StorageManager:
+    """
+    Ciclo de vida del disco: carpeta temporal por trabajo, cuotas de tamaño
+    y antigüedad para uploads/, outputs/ y temp/, y presión de disco.
+
+    - Cada trabajo trabaja en temp/jobs/<job_id>/; nada se comparte entre
+      trabajos, así que limpiar uno nunca afecta a otro.
+    - Sólo se liberan archivos de trabajos terminados (o subidos y nunca
+      procesados, por antigüedad). Los que están en cola o en proceso no se
+      tocan.
+    - Si un área supera su cuota se liberan los trabajos menos usados
+      recientemente (LRU por última descarga). El trabajo se conserva en el
+      historial marcado con files_evicted_at.
+    - Los archivos huérfanos (de trabajos que ya no existen o sin trabajo)
+      se eliminan pasado un período de gracia, para no tocar subidas en curso.
+    """
+
+    def __init__(self, store, upload_folder, output_folder, temp_folder, quotas=None,
+                 max_age_days=None, min_free_bytes=0, orphan_grace_seconds=6 * 3600):
+        """
+        Args:
+            store: JobStore de los trabajos
+            upload_folder / output_folder / temp_folder: Carpetas administradas
+            quotas: Diccionario {'uploads'|'outputs'|'temp': bytes máximos} (0 o ausente = sin límite)
+            max_age_days: Días sin uso tras los que se liberan los archivos de un trabajo
+            min_free_bytes: Espacio libre mínimo en disco; por debajo la presión es crítica
+            orphan_grace_seconds: Antigüedad mínima de un archivo huérfano para eliminarlo
+        """
+        self.store = store
+        self.folders = {
+            'uploads': upload_folder,
+            'outputs': output_folder,
+            'temp': temp_folder
+        }
+        self.quotas = quotas or {}
+        self.max_age_days = max_age_days
+        self.min_free_bytes = min_free_bytes
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.jobs_folder = os.path.join(temp_folder, 'jobs')
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        for folder in self.folders.values():
+            os.makedirs(folder, exist_ok=True)
+
+    def job_dir(self, job_id):
+        """Carpeta temporal exclusiva de un trabajo"""
+        path = os.path.join(self.jobs_folder, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def remove_job_dir(self, job_id):
+        _remove_path(os.path.join(self.jobs_folder, job_id))
+
+    def _job_paths(self, job):
+        """Archivos en disco de un trabajo: video subido, shorts y carpeta temporal"""
+        paths = []
+        if job.get('filepath'):
+            paths.append(job['filepath'])
+        if job.get('audio_path'):
+            paths.append(job['audio_path'])
+        paths.extend(glob.glob(os.path.join(glob.escape(self.folders['outputs']), f"short_{job['id']}_*")))
+        paths.append(os.path.join(self.jobs_folder, job['id']))
+        return paths
+
+    def _entry_job_id(self, area, name):
+        if area == 'uploads':
+            match = UPLOAD_NAME_RE.match(name)
+        elif area == 'outputs':
+            match = OUTPUT_NAME_RE.match(name)
+        else:
+            match = None
+        return match.group(1) if match else None
+
+    def scan(self):
+        """
+        Recorre las carpetas administradas
+
+        Returns:
+            {área: {'bytes', 'files', 'by_job': {job_id: bytes}, 'entries': [(ruta, job_id, bytes, mtime)]}}
+        """
+        usage = {}
+        for area, folder in self.folders.items():
+            info = {'bytes': 0, 'files': 0, 'by_job': {}, 'entries': []}
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                # Sesiones de subida (uploads/.sessions): las administra ChunkedUploadManager
+                if name.startswith('.'):
+                    info['bytes'] += _path_size(path)
+                    continue
+
+                if area == 'temp' and name == 'jobs':
+                    for job_id in os.listdir(path):
+                        job_path = os.path.join(path, job_id)
+                        self._add_entry(info, job_path, job_id)
+                    continue
+
+                self._add_entry(info, path, self._entry_job_id(area, name))
+            usage[area] = info
+        return usage
+
+    def _add_entry(self, info, path, job_id):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        size = _path_size(path)
+        info['bytes'] += size
+        info['files'] += 1
+        info['entries'].append((path, job_id, size, mtime))
+        if job_id:
+            info['by_job'][job_id] = info['by_job'].get(job_id, 0) + size
+
+    def disk_usage(self):
+        usage = shutil.disk_usage(self.folders['outputs'])
+        return {'total': usage.total, 'used': usage.used, 'free': usage.free}
+
+    def disk_critical(self):
+        """Consulta barata (sin recorrer carpetas) para rechazar subidas nuevas"""
+        return bool(self.min_free_bytes) and self.disk_usage()['free'] < self.min_free_bytes
+
+    def pressure(self, usage=None):
+        """
+        Nivel de presión de disco
+
+        Returns:
+            'critical' si queda menos espacio libre que min_free_bytes,
+            'warning' si un área está al 90% de su cuota o queda poco espacio libre,
+            'ok' en otro caso
+        """
+        if self.disk_critical():
+            return 'critical'
+        free = self.disk_usage()['free']
+        if self.min_free_bytes and free < self.min_free_bytes * 2:
+            return 'warning'
+
+        usage = usage or self.scan()
+        for area, info in usage.items():
+            quota = self.quotas.get(area)
+            if quota and info['bytes'] >= quota * 0.9:
+                return 'warning'
+        return 'ok'
+
+    def evict_job(self, job):
+        """
+        Elimina los archivos de un trabajo terminado y lo marca en el historial
+
+        Returns:
+            Bytes liberados
+        """
+        freed = 0
+        for path in self._job_paths(job):
+            if os.path.exists(path):
+                freed += _path_size(path)
+                _remove_path(path)
+        self.store.update(job['id'], files_evicted_at=time.time())
+        print(f"🧹 Archivos del trabajo {job['id']} liberados ({freed / (1024 * 1024):.1f} MB)")
+        return freed
+
+    def _evictable(self, job_id):
+        """Relee el estado: el trabajo pudo volver a la cola desde que se listó"""
+        job = self.store.get(job_id, include_shorts=False)
+        return job is not None and (job['status'] in TERMINAL_STATUSES or job['status'] == 'uploaded')
+
+    def enforce(self):
+        """
+        Aplica la política de disco: huérfanos, antigüedad, cuotas y espacio libre
+
+        Returns:
+            Resumen con trabajos liberados, huérfanos eliminados y bytes liberados
+        """
+        with self._lock:
+            now = time.time()
+            summary = {'evicted_jobs': 0, 'orphans_removed': 0, 'freed_bytes': 0, 'at': now}
+            usage = self.scan()
+
+            # 1. Huérfanos: archivos sin trabajo en la base de datos
+            known_ids = self.store.all_ids()
+            for area, info in usage.items():
+                for path, job_id, size, mtime in info['entries']:
+                    if job_id in known_ids or now - mtime < self.orphan_grace_seconds:
+                        continue
+                    _remove_path(path)
+                    summary['orphans_removed'] += 1
+                    summary['freed_bytes'] += size
+                    info['bytes'] -= size
+                    if job_id:
+                        info['by_job'].pop(job_id, None)
+
+            def evict(job):
+                if not self._evictable(job['id']):
+                    return
+                summary['freed_bytes'] += self.evict_job(job)
+                summary['evicted_jobs'] += 1
+                for info in usage.values():
+                    info['bytes'] -= info['by_job'].pop(job['id'], 0)
+
+            # 2. Antigüedad: trabajos sin uso desde hace max_age_days
+            if self.max_age_days:
+                idle_before = now - self.max_age_days * 86400
+                statuses = TERMINAL_STATUSES + ('uploaded',)
+                while True:
+                    candidates = self.store.eviction_candidates(statuses, idle_before=idle_before)
+                    if not candidates:
+                        break
+                    for job in candidates:
+                        evict(job)
+                    if len(candidates) < 100:
+                        break
+
+            # 3. Cuotas por área y espacio libre mínimo: LRU de trabajos terminados
+            def over_limits():
+                over = {area for area, info in usage.items()
+                        if self.quotas.get(area) and info['bytes'] > self.quotas[area]}
+                low_disk = self.disk_critical()
+                return over, low_disk
+
+            over, low_disk = over_limits()
+            if over or low_disk:
+                for job in self.store.eviction_candidates(TERMINAL_STATUSES, limit=100000):
+                    if not low_disk and not any(usage[area]['by_job'].get(job['id']) for area in over):
+                        continue
+                    evict(job)
+                    over, low_disk = over_limits()
+                    if not over and not low_disk:
+                        break
+                if over or low_disk:
+                    print(f"⚠️  Disco: no hay más trabajos terminados para liberar (áreas sobre cuota: {sorted(over)})")
+
+            summary['pressure'] = self.pressure(usage)
+            self.last_run = summary
+            if summary['evicted_jobs'] or summary['orphans_removed']:
+                print(f"🧹 Gestor de disco: {summary['evicted_jobs']} trabajos liberados, "
+                      f"{summary['orphans_removed']} huérfanos, {summary['freed_bytes'] / GB:.2f} GB")
+            return summary
+
+    def report(self):
+        """Uso por área, cuotas, espacio en disco y presión (para /api/storage)"""
+        usage = self.scan()
+        areas = {}
+        for area, info in usage.items():
+            quota = self.quotas.get(area) or None
+            areas[area] = {
+                'bytes': info['bytes'],
+                'files': info['files'],
+                'quota_bytes': quota,
+                'usage_ratio': round(info['bytes'] / quota, 3) if quota else None
+            }
+        return {
+            'areas': areas,
+            'disk': self.disk_usage(),
+            'min_free_bytes': self.min_free_bytes,
+            'max_age_days': self.max_age_days,
+            'pressure': self.pressure(usage),
+            'last_run': self.last_run
+        }
+
+    def start(self, interval=300):
+        """Aplica la política de disco periódicamente en un hilo de fondo"""
+        if self._thread is not None:
+            return
+
+        def storage_loop():
+            while True:
+                try:
+                    self.enforce()
+                except Exception as e:
+                    print(f"⚠️  Error en el gestor de disco: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=storage_loop, name="storage-manager", daemon=True)
+        self._thread.start()
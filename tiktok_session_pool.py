@@ -0,0 +1,263 @@
+import os
+import re
+import glob
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Segundos sin uso tras los que se cierra el navegador de una sesión (el perfil se conserva)
+SESSION_IDLE_TIMEOUT = 30 * 60
+# Cada cuánto se revisa que los navegadores sigan vivos y se limpian perfiles viejos
+HEALTH_CHECK_INTERVAL = 60
+# Una sesión comprobada hace menos de esto no se vuelve a verificar al prestarla
+LOGIN_CHECK_INTERVAL = 10 * 60
+# Perfiles sin usar durante más días se eliminan
+PROFILE_MAX_AGE_DAYS = 30
+
+# Perfiles temporales que creaba cada subida antes del pool (nunca se borraban)
+LEGACY_PROFILE_PATTERN = os.path.join(tempfile.gettempdir(), 'tiktok-profile-*')
+
+
+class SessionUnavailable(Exception):
+    """No se pudo obtener una sesión de TikTok con login (navegador o credenciales)"""
+
+
+def tiktok_credentials():
+    """Credenciales de TikTok desde variables de entorno"""
+    return os.getenv('TIKTOK_USERNAME', 'stiffclipss'), os.getenv('TIKTOK_PASSWORD', 'password')
+
+
+def tiktok_password(account):
+    """Contraseña de una cuenta de TikTok encolada (por ahora sólo la configurada)"""
+    username, password = tiktok_credentials()
+    if account != username:
+        raise KeyError(f"Sin credenciales para la cuenta de TikTok {account}")
+    return password
+
+
+def _account_slug(username):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', username) or 'account'
+
+
+class TikTokSessionPool:
+    """
+    Sesiones de navegador de TikTok de larga duración, con login, para
+    publicar sin arrancar Chrome ni iniciar sesión en cada trabajo.
+
+    Cada sesión usa un perfil de Chrome persistente en profiles_dir
+    (<cuenta>-<n>): aunque el navegador se cierre por inactividad o se
+    reinicie el servidor, las cookies siguen ahí y normalmente no hace falta
+    volver a iniciar sesión. Las publicaciones piden una sesión con lease()
+    y la devuelven al terminar; warm() abre y autentica una sesión en
+    segundo plano para que la primera no espere al navegador. El pool sólo
+    se usa en el proceso publicador: un perfil abierto por Chrome queda
+    bloqueado para los demás procesos.
+
+    Un hilo de fondo cierra los navegadores muertos o inactivos y elimina
+    los perfiles viejos (incluidos los temporales de antes del pool).
+    """
+
+    def __init__(self, profiles_dir, sessions_per_account=1, idle_timeout=SESSION_IDLE_TIMEOUT,
+                 profile_max_age_days=PROFILE_MAX_AGE_DAYS, headless=False):
+        """
+        Args:
+            profiles_dir: Carpeta de los perfiles persistentes de Chrome
+            sessions_per_account: Navegadores simultáneos por cuenta
+            idle_timeout: Segundos sin uso tras los que se cierra un navegador
+            profile_max_age_days: Días sin uso tras los que se elimina un perfil
+            headless: Ejecutar los navegadores sin ventana
+        """
+        self.profiles_dir = profiles_dir
+        self.sessions_per_account = sessions_per_account
+        self.idle_timeout = idle_timeout
+        self.profile_max_age_days = profile_max_age_days
+        self.headless = headless
+        self._changed = threading.Condition()
+        # (cuenta, n) -> {'uploader', 'profile_dir', 'in_use', 'last_used', 'login_checked_at'}
+        self._sessions = {}
+        self._thread = None
+        os.makedirs(profiles_dir, exist_ok=True)
+
+    def _profile_dir(self, username, index):
+        return os.path.join(self.profiles_dir, f"{_account_slug(username)}-{index}")
+
+    def _open(self, username, password, session):
+        """Abre el navegador de la sesión (si está cerrado) y asegura el login"""
+        from tiktok_uploader import TikTokUploader
+
+        uploader = session['uploader']
+        if uploader is None or not uploader.is_alive():
+            if uploader is not None:
+                uploader.close()
+            print(f"🌐 Abriendo sesión de TikTok ({os.path.basename(session['profile_dir'])})...")
+            uploader = session['uploader'] = TikTokUploader(
+                username, password, headless=self.headless, profile_dir=session['profile_dir']
+            ).start()
+            session['login_checked_at'] = 0
+
+        if time.time() - session['login_checked_at'] > LOGIN_CHECK_INTERVAL:
+            if not uploader.is_logged_in() and not uploader.login():
+                uploader.close()
+                session['uploader'] = None
+                raise SessionUnavailable(f"No se pudo iniciar sesión en TikTok como {username}")
+            session['login_checked_at'] = time.time()
+        return uploader
+
+    def _acquire(self, username, timeout):
+        """Reserva una sesión libre de la cuenta (o un lugar para crearla)"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                accounts = [(key, session) for key, session in self._sessions.items() if key[0] == username]
+                # Preferir una sesión con el navegador abierto
+                free = sorted((item for item in accounts if not item[1]['in_use']),
+                              key=lambda item: item[1]['uploader'] is None)
+                if free:
+                    key, session = free[0]
+                    session['in_use'] = True
+                    return key, session
+                if len(accounts) < self.sessions_per_account:
+                    used = {key[1] for key, _ in accounts}
+                    index = next(n for n in range(1, self.sessions_per_account + 1) if n not in used)
+                    key = (username, index)
+                    session = self._sessions[key] = {
+                        'uploader': None,
+                        'profile_dir': self._profile_dir(username, index),
+                        'in_use': True,
+                        'last_used': time.time(),
+                        'login_checked_at': 0
+                    }
+                    return key, session
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SessionUnavailable(f"Todas las sesiones de TikTok de {username} están ocupadas")
+                self._changed.wait(remaining)
+
+    def _release(self, key, session):
+        # La fecha del perfil marca su último uso (collect_garbage)
+        if os.path.isdir(session['profile_dir']):
+            os.utime(session['profile_dir'])
+        with self._changed:
+            session['in_use'] = False
+            session['last_used'] = time.time()
+            self._changed.notify_all()
+
+    @contextmanager
+    def lease(self, username, password, timeout=600):
+        """
+        Presta una sesión con login de la cuenta durante el bloque
+
+        Yields:
+            TikTokUploader listo para upload_video()
+
+        Raises:
+            SessionUnavailable: Sin sesión libre en timeout segundos o login fallido
+        """
+        key, session = self._acquire(username, timeout)
+        try:
+            uploader = self._open(username, password, session)
+            yield uploader
+        except BaseException:
+            # Un error a mitad de una subida puede dejar el navegador en
+            # cualquier página: la próxima vez se verifica la sesión
+            session['login_checked_at'] = 0
+            raise
+        finally:
+            self._release(key, session)
+
+    def warm(self, username, password):
+        """Abre y autentica una sesión de la cuenta en segundo plano"""
+        def warm_session():
+            try:
+                with self.lease(username, password, timeout=0):
+                    pass
+                print(f"✅ Sesión de TikTok lista para {username}")
+            except Exception as e:
+                print(f"⚠️  No se pudo preparar la sesión de TikTok: {e}")
+
+        threading.Thread(target=warm_session, name="tiktok-session-warm", daemon=True).start()
+
+    def check_sessions(self):
+        """Cierra los navegadores libres que no responden o llevan demasiado tiempo sin uso"""
+        with self._changed:
+            idle = [session for session in self._sessions.values()
+                    if not session['in_use'] and session['uploader'] is not None]
+            for session in idle:
+                session['in_use'] = True
+
+        for session in idle:
+            uploader = session['uploader']
+            if not uploader.is_alive():
+                print(f"⚠️  Navegador de TikTok sin respuesta ({os.path.basename(session['profile_dir'])}), se cierra")
+                uploader.close()
+                session['uploader'] = None
+            elif time.time() - session['last_used'] > self.idle_timeout:
+                print(f"💤 Cerrando navegador de TikTok inactivo ({os.path.basename(session['profile_dir'])})")
+                uploader.close()
+                session['uploader'] = None
+            with self._changed:
+                session['in_use'] = False
+                self._changed.notify_all()
+
+    def collect_garbage(self):
+        """
+        Elimina los perfiles sin usar hace más de profile_max_age_days y los
+        perfiles temporales de las subidas anteriores al pool
+
+        Returns:
+            Cantidad de perfiles eliminados
+        """
+        cutoff = time.time() - self.profile_max_age_days * 86400
+        with self._changed:
+            in_use = {session['profile_dir'] for session in self._sessions.values()
+                      if session['in_use'] or session['uploader'] is not None}
+
+        candidates = glob.glob(os.path.join(self.profiles_dir, '*')) + glob.glob(LEGACY_PROFILE_PATTERN)
+        removed = 0
+        for path in candidates:
+            if path in in_use or not os.path.isdir(path):
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                shutil.rmtree(path)
+                removed += 1
+            except OSError as e:
+                print(f"⚠️  No se pudo eliminar el perfil {path}: {e}")
+
+        if removed:
+            # Las sesiones sin navegador cuyo perfil se eliminó se crean de nuevo al pedirlas
+            with self._changed:
+                for key in [key for key, session in self._sessions.items()
+                            if not session['in_use'] and not os.path.exists(session['profile_dir'])]:
+                    del self._sessions[key]
+            print(f"🧹 {removed} perfiles de TikTok viejos eliminados")
+        return removed
+
+    def start(self, interval=HEALTH_CHECK_INTERVAL):
+        """Revisa las sesiones y limpia perfiles periódicamente en un hilo de fondo"""
+        if self._thread is not None:
+            return
+
+        def health_loop():
+            while True:
+                try:
+                    self.check_sessions()
+                    self.collect_garbage()
+                except Exception as e:
+                    print(f"⚠️  Error revisando las sesiones de TikTok: {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=health_loop, name="tiktok-session-pool", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Cierra todos los navegadores libres (los perfiles se conservan)"""
+        with self._changed:
+            sessions = [session for session in self._sessions.values() if not session['in_use']]
+        for session in sessions:
+            if session['uploader'] is not None:
+                session['uploader'].close()
+                session['uploader'] = None
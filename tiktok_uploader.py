@@ -8,7 +8,7 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
 
 class TikTokUploader:
-    def __init__(self, username, password, headless=False):
+    def __init__(self, username, password, headless=False, profile_dir=None):
         """
         Inicializa el uploader de TikTok
 
@@ -16,10 +16,13 @@ class TikTokUploader:
             username: Usuario de TikTok
             password: Contraseña de TikTok
             headless: Ejecutar navegador en modo headless (sin ventana visible)
+            profile_dir: Perfil de Chrome persistente (cookies y sesión entre trabajos,
+                         ver tiktok_session_pool.py); None usa un perfil temporal nuevo
         """
         self.username = username
         self.password = password
         self.headless = headless
+        self.profile_dir = profile_dir
         self.driver = None
 
     def _setup_driver(self):
@@ -40,17 +43,22 @@ class TikTokUploader:
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
 
-        # Directorio único para guardar cookies y sesiones (evita conflictos)
-        unique_id = str(uuid.uuid4())[:8]
-
-        # Usar directorio temporal del sistema según el OS
-        if platform.system() == 'Windows':
-            temp_dir = os.path.join(tempfile.gettempdir(), f'tiktok-profile-{unique_id}')
+        if self.profile_dir:
+            # Perfil persistente: la sesión de TikTok sobrevive entre trabajos
+            temp_dir = os.path.abspath(self.profile_dir)
+            os.makedirs(temp_dir, exist_ok=True)
         else:
-            temp_dir = f'/tmp/tiktok-profile-{unique_id}'
+            # Directorio único para guardar cookies y sesiones (evita conflictos)
+            unique_id = str(uuid.uuid4())[:8]
+
+            # Usar directorio temporal del sistema según el OS
+            if platform.system() == 'Windows':
+                temp_dir = os.path.join(tempfile.gettempdir(), f'tiktok-profile-{unique_id}')
+            else:
+                temp_dir = f'/tmp/tiktok-profile-{unique_id}'
 
         chrome_options.add_argument(f'--user-data-dir={temp_dir}')
-        print(f"📁 Usando directorio temporal: {temp_dir}")
+        print(f"📁 Usando directorio de perfil: {temp_dir}")
 
         # User agent para parecer un navegador real
         chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
@@ -74,6 +82,26 @@ class TikTokUploader:
 
         print("✅ Driver de Chrome configurado (modo visible para TikTok)")
 
+    def is_alive(self):
+        """True si el navegador sigue abierto y responde"""
+        if self.driver is None:
+            return False
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def is_logged_in(self):
+        """Comprueba la sesión abriendo TikTok Studio (sin login redirige a la página de login)"""
+        try:
+            self.driver.get("https://www.tiktok.com/tiktokstudio/upload?from=creator_center")
+            time.sleep(3)
+            return "login" not in self.driver.current_url.lower()
+        except Exception as e:
+            print(f"⚠️  No se pudo comprobar la sesión de TikTok: {e}")
+            return False
+
     def login(self):
         """Inicia sesión en TikTok"""
         try:
@@ -298,14 +326,22 @@ class TikTokUploader:
     def close(self):
         """Cierra el navegador"""
         if self.driver:
-            self.driver.quit()
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"⚠️  Error cerrando el navegador: {e}")
+            self.driver = None
             print("🔒 Navegador cerrado")
 
-    def __enter__(self):
-        """Context manager entry"""
+    def start(self):
+        """Abre el navegador (sin iniciar sesión)"""
         self._setup_driver()
         return self
 
+    def __enter__(self):
+        """Context manager entry"""
+        return self.start()
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit"""
         self.close()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class Span:
+    """Span abierto con begin(); se cierra con end()"""
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_us = time.time() * 1e6
+        self._start = time.perf_counter()
+        self.tid = tracer._thread_id()
+
+    def end(self, **args):
+        self.args.update(args)
+        duration_us = (time.perf_counter() - self._start) * 1e6
+        self.tracer._record(self, duration_us)
+
+
+class Tracer:
+    """
+    Línea de tiempo de un trabajo en formato Chrome trace (chrome://tracing,
+    Perfetto).
+
+    Cada span es un evento completo ('X') con inicio y duración; los spans
+    del mismo hilo se anidan por tiempo, así que un span abierto dentro de
+    otro aparece debajo. Cada ejecución del trabajo (la original y cada
+    reanudación) es un proceso distinto de la traza, y cada hilo una fila.
+    """
+
+    def __init__(self, job_id, trace_path=None):
+        """
+        Args:
+            job_id: Trabajo trazado
+            trace_path: Archivo JSON de la traza; si ya existe (trabajo reanudado)
+                        la ejecución actual se agrega a las anteriores
+        """
+        self.job_id = job_id
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self._previous = self._load_previous()
+        self.run = 1 + max((event.get('pid', 0) for event in self._previous), default=0)
+
+    def _load_previous(self):
+        if not self.trace_path or not os.path.exists(self.trace_path):
+            return []
+        try:
+            with open(self.trace_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('traceEvents', [])
+        except (OSError, ValueError):
+            return []
+
+    def _thread_id(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self._threads:
+                self._threads[ident] = (len(self._threads) + 1, threading.current_thread().name)
+            return self._threads[ident][0]
+
+    def begin(self, name, category='pipeline', **args):
+        """Abre un span que se cierra explícitamente con end()"""
+        return Span(self, name, category, args)
+
+    @contextmanager
+    def span(self, name, category='pipeline', **args):
+        """Span alrededor de un bloque; si el bloque falla el error queda en los args"""
+        span = self.begin(name, category, **args)
+        try:
+            yield span
+        except BaseException as e:
+            span.args['error'] = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            span.end()
+
+    def _record(self, span, duration_us):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round(span.start_us),
+            'dur': round(duration_us),
+            'pid': self.run,
+            'tid': span.tid,
+            'args': {key: value for key, value in span.args.items() if value is not None}
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def export(self):
+        """Traza completa (ejecuciones anteriores + actual) como diccionario JSON"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+
+        metadata = [{
+            'name': 'process_name', 'ph': 'M', 'pid': self.run, 'tid': 0,
+            'args': {'name': f"Ejecución {self.run}"}
+        }]
+        for tid, thread_name in threads.values():
+            metadata.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.run, 'tid': tid,
+                'args': {'name': thread_name}
+            })
+
+        return {
+            'traceEvents': self._previous + metadata + events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'job_id': self.job_id}
+        }
+
+    def save(self):
+        """Escribe la traza en trace_path (de forma atómica)"""
+        if not self.trace_path:
+            return
+        os.makedirs(os.path.dirname(self.trace_path) or '.', exist_ok=True)
+        tmp_path = f"{self.trace_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.export(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.trace_path)
+
+
+def span(context, name, category='pipeline', **args):
+    """
+    Span en la traza del trabajo del context; no hace nada si el trabajo no
+    se está trazando (sin context o sin tracer)
+    """
+    tracer = getattr(context, 'tracer', None)
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, category, **args)
@@ -1,10 +1,203 @@
 import os
 import subprocess
 import json
+import queue
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from job_context import JobCancelled
+from process_runner import run_command
+from metrics import STAGE_DURATION, FFMPEG_ACTIVE, RENDER_MEDIA_SECONDS, RENDER_WALL_SECONDS
+from tracing import span
+from codec_planner import CodecPlanner, summarize_probe
+
+# Perfiles de audio para Whisper: extensión, bitrate (bits/s) y códec. Whisper
+# acepta hasta 25 MB por petición, así que el bitrate decide cuánto audio
+# entra en una sola petición (ver AIAnalyzer.transcribe_audio).
+AUDIO_PROFILES = {
+    # MP3 a 128 kbps: ~25 minutos por petición
+    'mp3_128k': {'extension': 'mp3', 'bitrate': 128000, 'args': ['-acodec', 'libmp3lame', '-b:a', '128k']},
+    # Voz en MP3 a 32 kbps: ~1.6 horas por petición
+    'speech_mp3': {'extension': 'mp3', 'bitrate': 32000, 'args': ['-acodec', 'libmp3lame', '-b:a', '32k']},
+    # Voz en Opus a 24 kbps: ~2.2 horas por petición
+    'speech_opus': {'extension': 'ogg', 'bitrate': 24000,
+                    'args': ['-acodec', 'libopus', '-b:a', '24k', '-application', 'voip']},
+}
+AUDIO_PROFILE = os.getenv('TRANSCRIPTION_AUDIO_PROFILE', 'speech_opus')
+if AUDIO_PROFILE not in AUDIO_PROFILES:
+    raise ValueError(f"TRANSCRIPTION_AUDIO_PROFILE debe ser uno de: {', '.join(AUDIO_PROFILES)}")
+
+
+def whisper_audio_args(profile=AUDIO_PROFILE):
+    """Parámetros de FFmpeg del audio para Whisper (compartidos por la extracción normal y la streaming)"""
+    return [
+        '-vn',  # Sin video
+        '-ar', '16000',  # 16kHz para Whisper
+        '-ac', '1',  # Mono
+    ] + AUDIO_PROFILES[profile]['args']
+
+# Fotogramas de muestra para detectar la cámara (split screen automático); el
+# detector los analiza a 192 px de ancho, así que no hace falta más resolución
+POSTER_COUNT = 16
+POSTER_HEIGHT = 360
+# PCM mono para medir el volumen (moment_ranker.py)
+LOUDNESS_SAMPLE_RATE = 2000
+
+# Render por segmentos: un short largo se parte en hasta RENDER_PARALLEL_SEGMENTS
+# tramos (alineados a keyframes del original) que se codifican en paralelo y
+# se unen sin recodificar. 1 desactiva el render por segmentos.
+RENDER_PARALLEL_SEGMENTS = int(os.getenv('RENDER_PARALLEL_SEGMENTS', '1'))
+# Duración mínima de cada tramo: por debajo el arranque de FFmpeg no compensa
+RENDER_SEGMENT_MIN_SECONDS = float(os.getenv('RENDER_SEGMENT_MIN_SECONDS', '15'))
+
+
+class StreamingAudioExtractor:
+    """
+    Extrae el audio mientras el video todavía se está subiendo.
+
+    Los bytes recibidos se envían por stdin a un proceso FFmpeg. La escritura
+    a FFmpeg ocurre en un hilo aparte con una cola acotada: si FFmpeg no puede
+    seguir el ritmo (o falla, por ejemplo con un MP4 cuyo 'moov' está al final
+    y no se puede leer desde un pipe) se abandona la extracción y la subida
+    continúa sin esperar más. En ese caso finish() devuelve None y el
+    procesamiento extrae el audio en la ingesta (ingest()) sobre el archivo completo.
+    """
+
+    def __init__(self, audio_path, max_buffered_chunks=64, stall_timeout=5):
+        self.audio_path = audio_path
+        self.stall_timeout = stall_timeout
+        self.failed = False
+        self._queue = queue.Queue(maxsize=max_buffered_chunks)
+        self._process = None
+        self._writer = None
+        self._log_path = audio_path + '.log'
+        self._counted = False
+
+    def start(self):
+        """Lanza FFmpeg leyendo el video desde stdin"""
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-i', 'pipe:0'] + whisper_audio_args() + [self.audio_path]
+        try:
+            self._log = open(self._log_path, 'wb')
+            self._process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=self._log
+            )
+        except (OSError, FileNotFoundError) as e:
+            print(f"⚠️  No se pudo iniciar la extracción de audio en streaming: {e}")
+            self.failed = True
+            return self
+
+        FFMPEG_ACTIVE.inc()
+        self._counted = True
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        print(f"🎧 Extracción de audio en streaming iniciada: {self.audio_path}")
+        return self
+
+    def feed(self, chunk):
+        """
+        Encola un bloque de bytes del video. Si la cola sigue llena después de
+        stall_timeout segundos se abandona la extracción para no frenar la subida.
+        """
+        if self.failed or not chunk:
+            return
+        try:
+            self._queue.put(bytes(chunk), timeout=self.stall_timeout)
+        except queue.Full:
+            print("⚠️  FFmpeg no sigue el ritmo de la subida, se abandona la extracción en streaming")
+            self.abort()
+
+    def _write_loop(self):
+        stdin = self._process.stdin
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            try:
+                stdin.write(chunk)
+            except (BrokenPipeError, OSError, ValueError):
+                # FFmpeg terminó antes de tiempo (formato no apto para pipe, error, abort)
+                self.failed = True
+                break
+        try:
+            stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def finish(self, timeout=300):
+        """
+        Cierra la entrada y espera a que FFmpeg termine.
+
+        Returns:
+            Ruta del audio si la extracción terminó correctamente, None si no
+        """
+        if self._process is None:
+            return None
+
+        if not self.failed:
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+        try:
+            returncode = self._process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            returncode = -1
+        finally:
+            self._log.close()
+            self._release()
+
+        ok = (not self.failed and returncode == 0 and
+              os.path.exists(self.audio_path) and os.path.getsize(self.audio_path) > 0)
+
+        if ok:
+            print(f"✅ Audio extraído durante la subida: {self.audio_path}")
+            os.remove(self._log_path)
+            return self.audio_path
+
+        with open(self._log_path, 'r', errors='replace') as f:
+            stderr = f.read().strip()
+        print(f"⚠️  La extracción en streaming no terminó correctamente (código {returncode})")
+        if stderr:
+            print(f"   STDERR: {stderr[-500:]}")
+        self._cleanup()
+        return None
+
+    def abort(self):
+        """Detiene FFmpeg y descarta el audio parcial"""
+        self.failed = True
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+        self._release()
+        # Desbloquear el hilo escritor si está esperando datos
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _release(self):
+        """Descuenta el proceso del gauge de FFmpeg activos (una sola vez)"""
+        if self._counted:
+            self._counted = False
+            FFMPEG_ACTIVE.dec()
+
+    def _cleanup(self):
+        for path in (self.audio_path, self._log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
 
 class VideoProcessor:
-    def __init__(self, temp_folder):
+    def __init__(self, temp_folder, context=None):
+        """
+        Args:
+            temp_folder: Carpeta para archivos temporales
+            context: JobContext del trabajo (opcional); permite cancelar los FFmpeg en curso
+        """
         self.temp_folder = temp_folder
+        self.context = context
         os.makedirs(temp_folder, exist_ok=True)
     
     def get_video_duration(self, video_path):
@@ -17,78 +210,150 @@ class VideoProcessor:
                 '-of', 'default=noprint_wrappers=1:nokey=1',
                 video_path
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = run_command(cmd, self.context, check=True)
             return float(result.stdout.strip())
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Error obteniendo duración: {e}")
             return 0
     
-    def extract_audio(self, video_path):
-        """Extrae el audio del video usando FFmpeg"""
-        # Usar un nombre de archivo más corto para evitar problemas con rutas largas
-        import hashlib
-        video_hash = hashlib.md5(video_path.encode()).hexdigest()[:8]
-        audio_path = os.path.join(self.temp_folder, f"audio_{video_hash}.mp3")
-
-        try:
-            print(f"📂 Ruta del video: {video_path}")
-            print(f"📂 Ruta del audio: {audio_path}")
-
-            # Verificar que el video existe y sus permisos
-            if not os.path.exists(video_path):
-                raise FileNotFoundError(f"El video no existe: {video_path}")
+    def ingest(self, video_path, extract_audio=True):
+        """
+        Lee el video original una sola vez y genera en la carpeta temporal
+        el audio para Whisper y un PCM de baja frecuencia de muestreo para
+        medir el volumen.
 
-            video_size = os.path.getsize(video_path)
-            print(f"📊 Tamaño del video: {video_size / 1024 / 1024:.2f} MB")
+        Un solo FFmpeg con varias salidas que sólo decodifica la pista de
+        audio: el video original (que puede ser 4K) nunca se decodifica
+        entero para el análisis. El único análisis visual (la detección de
+        la cámara) lee unos pocos keyframes con extract_posters().
 
-            # Verificar que ffmpeg está disponible
-            try:
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, check=True)
-                print(f"✅ FFmpeg disponible")
-            except FileNotFoundError:
-                raise Exception("FFmpeg no está instalado o no está en el PATH")
+        Args:
+            video_path: Ruta del video original
+            extract_audio: False si el audio ya se extrajo (por ejemplo durante la subida)
 
-            # Asegurar que la carpeta temp existe
-            os.makedirs(self.temp_folder, exist_ok=True)
+        Returns:
+            Diccionario con audio_path, audio_bitrate, pcm_path, width, height, duration
+            y source (resumen de pistas del original; las rutas son None si el
+            video no tiene esa pista)
+        """
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"El video no existe: {video_path}")
+
+        info = self.get_video_info(video_path)
+        if info is None:
+            raise Exception(f"No se pudo leer el video: {video_path}")
+        streams = info.get('streams', [])
+        video_stream = next((st for st in streams if st.get('codec_type') == 'video'), None)
+        has_audio = any(st.get('codec_type') == 'audio' for st in streams)
+        duration = float(info.get('format', {}).get('duration') or 0)
+
+        result = {
+            'audio_path': None,
+            'audio_bitrate': AUDIO_PROFILES[AUDIO_PROFILE]['bitrate'],
+            'pcm_path': None,
+            'width': video_stream['width'] if video_stream else None,
+            'height': video_stream['height'] if video_stream else None,
+            'duration': duration,
+            # Pistas del original para el plan de códecs de los renders
+            'source': summarize_probe(info)
+        }
 
-            cmd = [
-                'ffmpeg',
-                '-y',
-                '-i', video_path,
-                '-vn',  # Sin video
-                '-acodec', 'libmp3lame',
-                '-ar', '16000',  # 16kHz para Whisper
-                '-ac', '1',  # Mono
-                '-b:a', '128k',
-                audio_path
-            ]
+        cmd = ['ffmpeg', '-y', '-v', 'error', '-i', video_path]
+        outputs = []
 
-            print(f"🔧 Ejecutando comando FFmpeg para extraer audio...")
-            print(f"   Comando: {' '.join(cmd)}")
+        if extract_audio and has_audio:
+            result['audio_path'] = os.path.join(self.temp_folder, f"audio.{AUDIO_PROFILES[AUDIO_PROFILE]['extension']}")
+            cmd += ['-map', '0:a:0'] + whisper_audio_args() + [result['audio_path']]
+            outputs.append('audio')
 
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        if has_audio:
+            # PCM de baja frecuencia para medir el volumen (preselección de momentos)
+            result['pcm_path'] = os.path.join(self.temp_folder, 'loudness.pcm')
+            cmd += ['-map', '0:a:0', '-vn', '-ac', '1', '-ar', str(LOUDNESS_SAMPLE_RATE), '-f', 's16le',
+                    result['pcm_path']]
+            outputs.append('PCM de volumen')
 
-            if os.path.exists(audio_path):
-                audio_size = os.path.getsize(audio_path)
-                print(f"✅ Audio extraído: {audio_path} ({audio_size / 1024:.2f} KB)")
-            else:
-                raise Exception("El archivo de audio no se creó")
+        if not outputs:
+            return result
 
-            return audio_path
+        # La ingesta reemplaza a la antigua extracción de audio: se mide con la
+        # misma etiqueta para no cortar la serie en los paneles
+        print(f"📥 Ingesta en una pasada ({', '.join(outputs)}): {video_path}")
+        try:
+            with STAGE_DURATION.time(stage='extract_audio'), span(self.context, 'ingest', 'ffmpeg', outputs=outputs):
+                run_command(cmd, self.context, check=True, media_duration=duration)
         except subprocess.CalledProcessError as e:
-            print(f"❌ Error extrayendo audio:")
-            print(f"   Código de salida: {e.returncode}")
-            print(f"   Comando: {' '.join(cmd)}")
-            print(f"   STDOUT: {e.stdout}")
-            print(f"   STDERR: {e.stderr}")
+            print(f"❌ Error en la ingesta: {e.stderr}")
             raise
-        except Exception as e:
-            print(f"❌ Error inesperado: {e}")
-            import traceback
-            traceback.print_exc()
+        except JobCancelled:
+            # No dejar salidas a medio escribir
+            self._remove_ingest_outputs(result)
             raise
-    
-    def create_short(self, input_video, output_path, start_time, end_time, subtitles, split_screen_mode=None, viral_text=None):
+
+        print(f"✅ Ingesta lista: audio {result['audio_path']}, volumen {result['pcm_path']}")
+        return result
+
+    def extract_posters(self, video_path, duration, count=POSTER_COUNT):
+        """
+        Fotogramas de muestra espaciados uniformemente, decodificando sólo un
+        keyframe por fotograma: cada entrada busca su momento en el demuxer
+        (-ss antes de -i, sin búsqueda exacta) y el decodificador descarta
+        los fotogramas que no son clave. Un VOD 4K de horas cuesta lo mismo
+        que uno corto.
+
+        Args:
+            video_path: Ruta del video original
+            duration: Duración del video en segundos
+            count: Cantidad de fotogramas
+
+        Returns:
+            Rutas de los fotogramas extraídos (JPEG), en orden
+        """
+        if not duration or duration <= 0 or count <= 0:
+            return []
+
+        # Fotogramas de una extracción anterior interrumpida
+        for name in os.listdir(self.temp_folder):
+            if name.startswith('poster_') and name.endswith('.jpg'):
+                os.remove(os.path.join(self.temp_folder, name))
+
+        interval = duration / count
+        paths = [os.path.join(self.temp_folder, f'poster_{i + 1:02d}.jpg') for i in range(count)]
+        cmd = ['ffmpeg', '-y', '-v', 'error']
+        for i in range(count):
+            cmd += ['-noaccurate_seek', '-ss', f'{(i + 0.5) * interval:.3f}', '-skip_frame', 'nokey',
+                    '-i', video_path]
+        for i, path in enumerate(paths):
+            cmd += ['-map', f'{i}:v:0', '-frames:v', '1',
+                    '-vf', f"scale=-2:'min({POSTER_HEIGHT},ih)':flags=fast_bilinear", '-q:v', '3', path]
+
+        with span(self.context, 'extract_posters', 'ffmpeg', count=count):
+            result = run_command(cmd, self.context)
+        if result.returncode != 0:
+            print(f"⚠️  No se pudieron extraer todos los fotogramas de muestra: {result.stderr[-500:]}")
+        return [path for path in paths if os.path.exists(path) and os.path.getsize(path) > 0]
+
+    def _remove_ingest_outputs(self, result):
+        for path in (result['audio_path'], result['pcm_path']):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def start_streaming_audio_extraction(self, name):
+        """
+        Inicia una extracción de audio que recibe el video por bloques
+        mientras se sube (ver StreamingAudioExtractor)
+
+        Args:
+            name: Identificador para el archivo de audio (por ejemplo el job_id)
+        """
+        os.makedirs(self.temp_folder, exist_ok=True)
+        audio_path = os.path.join(self.temp_folder, f"audio_{name}.{AUDIO_PROFILES[AUDIO_PROFILE]['extension']}")
+        return StreamingAudioExtractor(audio_path).start()
+
+    def create_short(self, input_video, output_path, start_time, end_time, subtitles, split_screen_mode=None, viral_text=None,
+                     video_info=None, webcam_region=None, parallel_segments=None):
         """
         Crea un short en formato vertical 9:16 con subtítulos usando solo FFmpeg
 
@@ -101,22 +366,22 @@ class VideoProcessor:
             split_screen_mode: None, 'webcam_corner', 'auto'
                 - None: Modo normal (escala completo)
                 - 'webcam_corner': Divide pantalla - webcam arriba, contenido abajo
-                - 'auto': Intenta detectar automáticamente (por ahora usa webcam_corner)
+                - 'auto': Usa la región de la cámara detectada (webcam_region) o, si no
+                  se detectó, la misma región que webcam_corner
             viral_text: Texto viral para mostrar entre marca de agua y video (opcional)
+            video_info: Resumen de pistas del original (codec_planner.summarize_probe) si ya
+                        se conoce (ingesta); si no, se usa ffprobe
+            webcam_region: {'x', 'y', 'width', 'height'} de la cámara detectada (WebcamDetector)
+            parallel_segments: Tramos a codificar en paralelo (por defecto RENDER_PARALLEL_SEGMENTS);
+                               se reduce para que cada tramo dure al menos RENDER_SEGMENT_MIN_SECONDS
         """
+        ass_path = None
         try:
             print(f"🎬 Creando short: {start_time}s - {end_time}s")
             duration = end_time - start_time
 
-            # Crear archivo ASS para subtítulos
-            ass_path = None
-            if subtitles and len(subtitles) > 0:
-                print(f"💬 Generando {len(subtitles)} subtítulos...")
-                ass_path = os.path.join(self.temp_folder, f"subs_{os.path.basename(output_path)}.ass")
-                self._create_ass_file(subtitles, ass_path)
-
             # Obtener información del video original
-            video_info = self._get_video_info(input_video)
+            video_info = video_info or self._get_video_info(input_video)
             original_width = video_info['width']
             original_height = video_info['height']
 
@@ -137,7 +402,8 @@ class VideoProcessor:
                 video_filter = self._create_split_screen_filter(
                     original_width,
                     original_height,
-                    split_screen_mode
+                    split_screen_mode,
+                    webcam_region if split_screen_mode == 'auto' else None
                 )
             elif is_already_9_16:
                 # El video ya es 9:16, solo escalarlo a 1080x1920 sin cortar
@@ -153,75 +419,229 @@ class VideoProcessor:
                 base_filter = "scale=1080:-2:flags=lanczos"
                 video_filter = self._create_normal_filter_with_watermark(base_filter, viral_text)
 
-            # Agregar subtítulos si existen (solo para modo NO split screen)
-            # En modo split screen, los subtítulos se agregan después del filtro complejo
-            if ass_path and os.path.exists(ass_path) and split_screen_mode not in ['webcam_corner', 'auto']:
-                # Escapar la ruta para FFmpeg
-                ass_path_escaped = ass_path.replace('\\', '/').replace(':', '\\:')
-                video_filter += f",ass='{ass_path_escaped}'"
-            elif ass_path and os.path.exists(ass_path) and split_screen_mode in ['webcam_corner', 'auto']:
-                # Para split screen, agregar subtítulos al final del filtro complejo
-                ass_path_escaped = ass_path.replace('\\', '/').replace(':', '\\:')
-                video_filter += f",ass='{ass_path_escaped}'"
-
-            # Comando FFmpeg completo
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-y',  # Sobrescribir sin preguntar
-                '-ss', str(start_time),  # Tiempo de inicio
-                '-t', str(duration),  # Duración
-                '-i', input_video,  # Video de entrada
-                '-vf', video_filter,  # Filtros de video
-                '-c:v', 'libx264',  # Codec de video
-                '-preset', 'medium',  # Preset de velocidad/calidad
-                '-crf', '23',  # Calidad (18-28, menor = mejor calidad)
-                '-c:a', 'aac',  # Codec de audio
-                '-b:a', '192k',  # Bitrate de audio
-                '-ar', '44100',  # Sample rate
-                '-movflags', '+faststart',  # Optimizar para streaming
-                output_path
-            ]
-            
-            print(f"🔧 Ejecutando FFmpeg...")
-            result = subprocess.run(
-                ffmpeg_cmd,
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                print(f"❌ Error de FFmpeg: {result.stderr}")
-                raise Exception(f"FFmpeg falló: {result.stderr}")
-            
-            # Limpiar archivo de subtítulos temporal
-            if ass_path and os.path.exists(ass_path):
-                os.remove(ass_path)
+            # Audio AAC compatible: se copia en lugar de recodificarlo
+            codec_plan = CodecPlanner().plan(video_info, video_filtered=True)
+            print(f"🎛️  Video: {codec_plan['video']['action']} ({codec_plan['video']['reason']}), "
+                  f"audio: {codec_plan['audio']['action']} ({codec_plan['audio']['reason']})")
+
+            segments = parallel_segments or RENDER_PARALLEL_SEGMENTS
+            segments = min(segments, int(duration // RENDER_SEGMENT_MIN_SECONDS))
+            render_start = time.perf_counter()
+            if segments > 1:
+                # Cada tramo genera su propio ASS con los tiempos desplazados
+                self._render_segmented(input_video, output_path, start_time, end_time, video_filter,
+                                       subtitles, codec_plan, segments, split_screen_mode)
+            else:
+                # Crear archivo ASS y agregar los subtítulos al final del filtro (en todos los modos)
+                if subtitles:
+                    print(f"💬 Generando {len(subtitles)} subtítulos...")
+                    ass_path = os.path.join(self.temp_folder, f"subs_{os.path.basename(output_path)}.ass")
+                    self._create_ass_file(subtitles, ass_path)
+                    video_filter = self._with_subtitles(video_filter, ass_path)
+
+                # Comando FFmpeg completo
+                ffmpeg_cmd = [
+                    'ffmpeg',
+                    '-y',  # Sobrescribir sin preguntar
+                    '-ss', str(start_time),  # Tiempo de inicio
+                    '-t', str(duration),  # Duración
+                    '-i', input_video,  # Video de entrada
+                    '-vf', video_filter,  # Filtros de video
+                ] + codec_plan['args'] + [  # Códecs de video y audio (codec_planner.py)
+                    '-movflags', '+faststart',  # Optimizar para streaming
+                    output_path
+                ]
+
+                print(f"🔧 Ejecutando FFmpeg...")
+                with span(self.context, 'create_short', 'ffmpeg', start_time=start_time, end_time=end_time,
+                          split_screen_mode=split_screen_mode):
+                    result = run_command(ffmpeg_cmd, self.context, media_duration=duration)
+
+                if result.returncode != 0:
+                    print(f"❌ Error de FFmpeg: {result.stderr}")
+                    raise Exception(f"FFmpeg falló: {result.stderr}")
+
+            elapsed = time.perf_counter() - render_start
+            STAGE_DURATION.observe(elapsed, stage='create_short')
+            RENDER_MEDIA_SECONDS.inc(duration)
+            RENDER_WALL_SECONDS.inc(elapsed)
             
-            print(f"✅ Short creado exitosamente: {output_path}")
+            print(f"✅ Short creado exitosamente: {output_path} ({duration / elapsed:.2f}x tiempo real)")
             return True
             
+        except JobCancelled:
+            # Eliminar el short a medio renderizar
+            print(f"🛑 Render cancelado: {output_path}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
         except Exception as e:
             print(f"❌ Error creando short: {e}")
             import traceback
             traceback.print_exc()
             raise
+        finally:
+            # Limpiar archivo de subtítulos temporal
+            if ass_path and os.path.exists(ass_path):
+                os.remove(ass_path)
     
-    def _get_video_info(self, video_path):
-        """Obtiene información del video usando ffprobe"""
+    def _with_subtitles(self, video_filter, ass_path):
+        """Agrega los subtítulos ASS al final del filtro de video"""
+        # Escapar la ruta para FFmpeg
+        ass_path_escaped = ass_path.replace('\\', '/').replace(':', '\\:')
+        return video_filter + f",ass='{ass_path_escaped}'"
+
+    def _keyframe_times(self, video_path, start_time, end_time):
+        """
+        Tiempos de los keyframes del video entre start_time y end_time
+
+        Lee sólo los paquetes del intervalo (sin decodificar): los flags 'K'
+        marcan los keyframes.
+        """
         cmd = [
             'ffprobe',
             '-v', 'error',
             '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
+            '-read_intervals', f"{start_time}%{end_time}",
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ]
+        result = run_command(cmd, self.context)
+        if result.returncode != 0:
+            return []
+        times = []
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            try:
+                t = float(pts_time)
+            except ValueError:
+                continue
+            if 'K' in flags and start_time < t < end_time:
+                times.append(t)
+        return sorted(times)
+
+    def _segment_bounds(self, start_time, end_time, count, keyframes):
+        """
+        Divide [start_time, end_time] en count tramos de duración parecida
+
+        Cada corte se mueve al keyframe más cercano (si hay uno a menos de
+        medio tramo): así cada tramo empieza a decodificar justo en un
+        keyframe en lugar de decodificar y descartar los cuadros previos.
+        """
+        length = (end_time - start_time) / count
+        cuts = []
+        for i in range(1, count):
+            target = start_time + i * length
+            nearest = min(keyframes, key=lambda t: abs(t - target), default=None)
+            if nearest is not None and abs(nearest - target) <= length / 2:
+                target = nearest
+            # Tramos de al menos un segundo y en orden
+            if target - (cuts[-1] if cuts else start_time) >= 1 and end_time - target >= 1:
+                cuts.append(target)
+        edges = [start_time] + cuts + [end_time]
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _render_segmented(self, input_video, output_path, start_time, end_time, video_filter, subtitles,
+                          codec_plan, count, split_screen_mode=None):
+        """
+        Renderiza un short en tramos paralelos y los une sin recodificar
+
+        Cada tramo es un FFmpeg independiente con el mismo filtro y los mismos
+        parámetros de x264 (sólo video; cada tramo arranca con un keyframe), y
+        sus subtítulos desplazados al inicio del tramo. La marca de agua y el
+        texto viral son estáticos, así que no dependen del tramo. Los tramos se
+        concatenan con el demuxer concat (-c copy) y el audio se procesa en una
+        sola pasada sobre todo el rango, para que no haya cortes en las uniones.
+        """
+        bounds = self._segment_bounds(start_time, end_time, count,
+                                      self._keyframe_times(input_video, start_time, end_time))
+        # Repartir los núcleos entre los tramos para no sobrecargar la máquina
+        threads = max(1, (os.cpu_count() or 1) // len(bounds))
+        base = os.path.join(self.temp_folder, os.path.basename(output_path))
+        segment_paths = [f"{base}.seg{i}.mp4" for i in range(len(bounds))]
+        ass_paths = []
+        list_path = f"{base}.segments.txt"
+        print(f"🧩 Render en {len(bounds)} tramos paralelos ({threads} hilos cada uno)...")
+
+        def render_segment(index):
+            seg_start, seg_end = bounds[index]
+            seg_duration = seg_end - seg_start
+            seg_filter = video_filter
+            seg_subtitles = [
+                {**sub, 'start': max(0, sub['start'] - (seg_start - start_time)),
+                 'end': sub['end'] - (seg_start - start_time)}
+                for sub in subtitles or []
+                if sub['end'] > seg_start - start_time and sub['start'] < seg_end - start_time
+            ]
+            if seg_subtitles:
+                ass_path = f"{base}.seg{index}.ass"
+                ass_paths.append(ass_path)
+                self._create_ass_file(seg_subtitles, ass_path)
+                seg_filter = self._with_subtitles(video_filter, ass_path)
+
+            cmd = [
+                'ffmpeg', '-y',
+                '-ss', str(seg_start),
+                '-t', str(seg_duration),
+                '-i', input_video,
+                '-vf', seg_filter,
+                '-an',
+            ] + codec_plan['video_args'] + ['-threads', str(threads), segment_paths[index]]
+            with span(self.context, 'render_segment', 'ffmpeg', index=index, start_time=seg_start,
+                      end_time=seg_end):
+                result = run_command(cmd, self.context, media_duration=seg_duration)
+            if result.returncode != 0:
+                print(f"❌ Error de FFmpeg en el tramo {index + 1}: {result.stderr}")
+                raise Exception(f"FFmpeg falló en el tramo {index + 1}: {result.stderr}")
+
+        try:
+            with span(self.context, 'create_short', 'ffmpeg', start_time=start_time, end_time=end_time,
+                      split_screen_mode=split_screen_mode, segments=len(bounds)):
+                with ThreadPoolExecutor(max_workers=len(bounds), thread_name_prefix='render-segment') as executor:
+                    for future in [executor.submit(render_segment, i) for i in range(len(bounds))]:
+                        future.result()
+
+                with open(list_path, 'w', encoding='utf-8') as f:
+                    for path in segment_paths:
+                        escaped = os.path.abspath(path).replace("'", "'\\''")
+                        f.write(f"file '{escaped}'\n")
+
+                # Unir los tramos (copia) y agregar el audio del rango completo
+                cmd = [
+                    'ffmpeg', '-y',
+                    '-f', 'concat', '-safe', '0', '-i', list_path,
+                    '-ss', str(start_time),
+                    '-t', str(end_time - start_time),
+                    '-i', input_video,
+                    '-map', '0:v:0', '-map', '1:a:0?',
+                    '-c:v', 'copy',
+                ] + codec_plan['audio_args'] + [
+                    '-movflags', '+faststart',
+                    output_path
+                ]
+                with span(self.context, 'concat_segments', 'ffmpeg', segments=len(bounds)):
+                    result = run_command(cmd, self.context, media_duration=end_time - start_time)
+                if result.returncode != 0:
+                    print(f"❌ Error de FFmpeg uniendo los tramos: {result.stderr}")
+                    raise Exception(f"FFmpeg falló uniendo los tramos: {result.stderr}")
+        finally:
+            for path in segment_paths + ass_paths + [list_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _get_video_info(self, video_path):
+        """Obtiene dimensiones y pistas del video usando ffprobe (ver codec_planner.summarize_probe)"""
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-show_format',
+            '-show_streams',
             '-of', 'json',
             video_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)
-        return {
-            'width': info['streams'][0]['width'],
-            'height': info['streams'][0]['height']
-        }
+        result = run_command(cmd, self.context, check=True)
+        return summarize_probe(json.loads(result.stdout))
     
     def _create_ass_file(self, subtitles, ass_path):
         """Crea un archivo ASS con subtítulos estilizados"""
@@ -361,7 +781,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 
             return filter_complex
 
-    def _create_split_screen_filter(self, original_width, original_height, mode):
+    def _create_split_screen_filter(self, original_width, original_height, mode, webcam_region=None):
         """
         Crea un filtro FFmpeg para dividir la pantalla en dos secciones verticales
 
@@ -373,6 +793,7 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
             original_width: Ancho del video original
             original_height: Alto del video original
             mode: 'webcam_corner' o 'auto'
+            webcam_region: Recuadro de la cámara detectado (modo 'auto'); None usa la región fija
 
         Returns:
             String con el filtro FFmpeg completo
@@ -395,14 +816,33 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         # - Contenido principal es toda la pantalla
 
         if mode == 'webcam_corner' or mode == 'auto':
-            # SECCIÓN SUPERIOR: Enfoque en webcam (parte superior/central del video)
-            # Crop de la región superior donde típicamente está la cámara
-            webcam_crop_width = int(original_width * 0.50)  # 50% del ancho (zona central-superior)
-            webcam_crop_height = int(original_height * 0.35)  # 35% del alto (parte superior)
+            if webcam_region:
+                # SECCIÓN SUPERIOR: la cámara detectada, ampliada a la proporción de la sección
+                # (sin deformarla) y sin salirse del cuadro
+                section_ratio = output_width / section_height
+                webcam_crop_width = webcam_region['width']
+                webcam_crop_height = webcam_region['height']
+                if webcam_crop_width / webcam_crop_height < section_ratio:
+                    webcam_crop_width = webcam_crop_height * section_ratio
+                else:
+                    webcam_crop_height = webcam_crop_width / section_ratio
+                webcam_crop_width = int(min(webcam_crop_width, original_width))
+                webcam_crop_height = int(min(webcam_crop_height, original_height))
+
+                center_x = webcam_region['x'] + webcam_region['width'] / 2
+                center_y = webcam_region['y'] + webcam_region['height'] / 2
+                webcam_x = int(min(max(center_x - webcam_crop_width / 2, 0), original_width - webcam_crop_width))
+                webcam_y = int(min(max(center_y - webcam_crop_height / 2, 0), original_height - webcam_crop_height))
+                print(f"   🎯 Cámara detectada automáticamente")
+            else:
+                # SECCIÓN SUPERIOR: Enfoque en webcam (parte superior/central del video)
+                # Crop de la región superior donde típicamente está la cámara
+                webcam_crop_width = int(original_width * 0.50)  # 50% del ancho (zona central-superior)
+                webcam_crop_height = int(original_height * 0.35)  # 35% del alto (parte superior)
 
-            # Posición: parte superior central del video
-            webcam_x = (original_width - webcam_crop_width) // 2  # Centrado horizontalmente
-            webcam_y = 0  # Desde arriba
+                # Posición: parte superior central del video
+                webcam_x = (original_width - webcam_crop_width) // 2  # Centrado horizontalmente
+                webcam_y = 0  # Desde arriba
 
             # SECCIÓN INFERIOR: Contenido completo (toda la pantalla escalada)
             # Usamos el video completo para mostrar el contenido
@@ -486,10 +926,12 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
                 video_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = run_command(cmd, self.context, check=True)
             info = json.loads(result.stdout)
             
             return info
+        except JobCancelled:
+            raise
         except Exception as e:
             print(f"Error obteniendo información del video: {e}")
             return None
\ No newline at end of file
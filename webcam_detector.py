@@ -0,0 +1,203 @@
+from process_runner import run_command
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Ancho de los fotogramas analizados (el alto sigue la proporción del video)
+ANALYSIS_WIDTH = 192
+
+# Filas / columnas candidatas a borde de la cámara
+MAX_EDGE_CANDIDATES = 14
+
+# Un píxel es borde en un fotograma si su gradiente está en el 10% más alto
+EDGE_QUANTILE = 0.90
+# Un borde es persistente si aparece en al menos esta fracción de los fotogramas
+EDGE_PERSISTENCE = 0.6
+
+# Límites del rectángulo de la cámara (fracción del cuadro y proporción ancho / alto)
+MIN_AREA = 0.02
+MAX_AREA = 0.35
+MIN_SIDE = 0.08
+MIN_ASPECT = 0.6
+MAX_ASPECT = 2.6
+
+# Fracción mínima de cada lado (que no sea un límite del cuadro) cubierta por borde
+MIN_SIDE_COVERAGE = 0.7
+# Puntaje mínimo para aceptar la detección
+MIN_SCORE = 0.45
+
+
+class WebcamDetector:
+    """
+    Detecta el recuadro de la cámara (facecam) de un stream a partir de unos
+    pocos fotogramas reducidos (los de muestra de la ingesta), sin volver a
+    decodificar el video.
+
+    Señales, vectorizadas con NumPy sobre todos los fotogramas a la vez:
+    - Bordes persistentes: el marco de la cámara es una discontinuidad en la
+      misma posición en casi todos los fotogramas, mientras que los bordes
+      del juego cambian de lugar.
+    - Varianza temporal: el interior de la cámara cambia entre fotogramas;
+      los recuadros estáticos (HUD, logos, chat) no.
+
+    Se prueban todos los rectángulos formados por las filas y columnas con
+    más borde persistente (más los límites del cuadro, para cámaras pegadas
+    a una esquina) y se elige el de mejor puntaje.
+    """
+
+    def __init__(self, context=None):
+        """
+        Args:
+            context: JobContext del trabajo (opcional)
+        """
+        self.context = context
+
+    def load_frames(self, frame_paths, width, height):
+        """
+        Decodifica los fotogramas a escala de grises y tamaño de análisis con un solo FFmpeg
+
+        Returns:
+            Array (fotogramas, alto, ancho) con valores entre 0 y 1
+        """
+        analysis_height = max(2, round(ANALYSIS_WIDTH * height / width))
+        cmd = ['ffmpeg', '-v', 'error']
+        for path in frame_paths:
+            cmd += ['-i', path]
+        cmd += [
+            '-filter_complex',
+            ''.join(f'[{i}:v]' for i in range(len(frame_paths))) + f'concat=n={len(frame_paths)}:v=1,'
+            f'scale={ANALYSIS_WIDTH}:{analysis_height},format=gray',
+            '-f', 'rawvideo', '-pix_fmt', 'gray', '-'
+        ]
+        result = run_command(cmd, self.context, check=True, text=False)
+        frames = np.frombuffer(result.stdout, dtype=np.uint8)
+        return frames.reshape(-1, analysis_height, ANALYSIS_WIDTH).astype(np.float32) / 255
+
+    def detect(self, frame_paths, width, height):
+        """
+        Args:
+            frame_paths: Fotogramas de muestra del video (VideoProcessor.extract_posters)
+            width / height: Dimensiones del video original
+
+        Returns:
+            {'x', 'y', 'width', 'height', 'score'} en píxeles del original, o None
+            si no se encontró un recuadro con suficiente confianza
+        """
+        if np is None:
+            print("⚠️  NumPy no está instalado: no se puede detectar la cámara")
+            return None
+        if len(frame_paths) < 3 or not width or not height:
+            return None
+
+        frames = self.load_frames(frame_paths, width, height)
+        region = self.detect_in_frames(frames)
+        if region is None:
+            return None
+
+        scale_x = width / frames.shape[2]
+        scale_y = height / frames.shape[1]
+        x1, y1, x2, y2, score = region
+        return {
+            'x': int(x1 * scale_x),
+            'y': int(y1 * scale_y),
+            'width': int((x2 - x1) * scale_x),
+            'height': int((y2 - y1) * scale_y),
+            'score': round(score, 3)
+        }
+
+    def detect_in_frames(self, frames):
+        """
+        Busca el recuadro de la cámara en fotogramas ya cargados
+
+        Args:
+            frames: Array (fotogramas, alto, ancho) en escala de grises
+
+        Returns:
+            Tupla (x1, y1, x2, y2, puntaje) en píxeles de análisis, o None
+        """
+        n, h, w = frames.shape
+
+        # Bordes horizontales (entre filas) y verticales (entre columnas) de cada fotograma
+        grad_y = np.abs(np.diff(frames, axis=1))
+        grad_x = np.abs(np.diff(frames, axis=2))
+        threshold_y = np.quantile(grad_y.reshape(n, -1), EDGE_QUANTILE, axis=1)[:, None, None]
+        threshold_x = np.quantile(grad_x.reshape(n, -1), EDGE_QUANTILE, axis=1)[:, None, None]
+        # Fracción de fotogramas en los que cada píxel es borde
+        persistent_y = ((grad_y > threshold_y).mean(axis=0) >= EDGE_PERSISTENCE).astype(np.float32)
+        persistent_x = ((grad_x > threshold_x).mean(axis=0) >= EDGE_PERSISTENCE).astype(np.float32)
+
+        # Sumas acumuladas para medir cualquier segmento de borde en O(1)
+        cum_y = np.pad(np.cumsum(persistent_y, axis=1), ((0, 0), (1, 0)))
+        cum_x = np.pad(np.cumsum(persistent_x, axis=0), ((1, 0), (0, 0)))
+
+        # Imagen integral de la varianza temporal
+        variance = frames.var(axis=0)
+        integral = np.pad(variance.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        global_std = np.sqrt(variance.mean()) + 1e-6
+
+        # Candidatos: líneas con más borde persistente y los límites del cuadro
+        ys = self._candidates(persistent_y.sum(axis=1), h)
+        xs = self._candidates(persistent_x.sum(axis=0), w)
+
+        y_pairs = np.array([(a, b) for i, a in enumerate(ys) for b in ys[i + 1:]])
+        x_pairs = np.array([(a, b) for i, a in enumerate(xs) for b in xs[i + 1:]])
+        if len(y_pairs) == 0 or len(x_pairs) == 0:
+            return None
+        y1, y2 = y_pairs[:, 0][:, None], y_pairs[:, 1][:, None]
+        x1, x2 = x_pairs[:, 0][None, :], x_pairs[:, 1][None, :]
+        rect_w = (x2 - x1).astype(np.float32)
+        rect_h = (y2 - y1).astype(np.float32)
+
+        # Fracción de cada lado cubierta por borde persistente (NaN en los límites del cuadro)
+        def horizontal_side(y_line):
+            row = np.clip(y_line - 1, 0, h - 2)
+            value = (cum_y[row, x2] - cum_y[row, x1]) / rect_w
+            return np.where((y_line > 0) & (y_line < h), value, np.nan)
+
+        def vertical_side(x_line):
+            col = np.clip(x_line - 1, 0, w - 2)
+            value = (cum_x[y2, col] - cum_x[y1, col]) / rect_h
+            return np.where((x_line > 0) & (x_line < w), value, np.nan)
+
+        sides = np.stack(np.broadcast_arrays(
+            horizontal_side(y1), horizontal_side(y2), vertical_side(x1), vertical_side(x2)
+        ))
+        real_sides = (~np.isnan(sides)).sum(axis=0)
+        edge_score = np.nansum(sides, axis=0) / np.maximum(real_sides, 1)
+        weakest_side = np.nanmin(np.where(np.isnan(sides), 1, sides), axis=0)
+        # Un lado en el límite del cuadro no aporta evidencia: se prefieren los recuadros con más lados reales
+        edge_score *= np.sqrt(real_sides / 4)
+
+        # El interior debe cambiar entre fotogramas (no es un HUD); una cámara
+        # suele moverse menos que el juego, así que sólo penaliza lo estático
+        inside = (integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]) / (rect_w * rect_h)
+        motion = np.minimum(1, 2 * np.sqrt(np.maximum(inside, 0)) / global_std)
+
+        area = rect_w * rect_h / (w * h)
+        aspect = rect_w / rect_h
+        valid = ((real_sides >= 2) & (weakest_side >= MIN_SIDE_COVERAGE) & (area >= MIN_AREA) & (area <= MAX_AREA) &
+                 (rect_w >= MIN_SIDE * w) & (rect_h >= MIN_SIDE * h) &
+                 (aspect >= MIN_ASPECT) & (aspect <= MAX_ASPECT))
+        score = np.where(valid, edge_score * motion, 0)
+
+        best = np.unravel_index(np.argmax(score), score.shape)
+        if score[best] < MIN_SCORE:
+            return None
+        return (int(x_pairs[best[1], 0]), int(y_pairs[best[0], 0]),
+                int(x_pairs[best[1], 1]), int(y_pairs[best[0], 1]), float(score[best]))
+
+    def _candidates(self, profile, size):
+        """
+        Posiciones de línea (índice de píxel donde empieza el borde) con más
+        borde persistente, separadas al menos 3 píxeles, más 0 y size
+        """
+        positions = []
+        for index in np.argsort(profile)[::-1]:
+            if profile[index] <= 0 or len(positions) >= MAX_EDGE_CANDIDATES:
+                break
+            if all(abs(index - p) > 2 for p in positions):
+                positions.append(int(index))
+        # El borde entre la fila i e i+1 es el límite i+1
+        return sorted({0, size} | {p + 1 for p in positions})
@@ -0,0 +1,66 @@
+import zipfile
+
+# Tamaño de lectura de cada archivo que se agrega al ZIP
+ZIP_READ_CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipSink:
+    """
+    Destino de escritura para zipfile que acumula los bytes en memoria hasta
+    que el generador los entrega. No tiene seek() ni tell(), así que zipfile
+    escribe cada entrada con data descriptor y nunca vuelve atrás.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    Genera un archivo ZIP (sin compresión) bloque a bloque.
+
+    Los videos ya están comprimidos, así que se guardan en modo store: el
+    costo es sólo leer y enviar los bytes, sin archivo temporal en disco, y
+    el primer bloque sale en cuanto se lee el primer archivo.
+
+    Args:
+        entries: Iterable de tuplas (nombre_en_zip, origen) donde origen es la
+                 ruta de un archivo o un bytes con el contenido
+
+    Yields:
+        Bloques de bytes del ZIP
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for arcname, source in entries:
+            if isinstance(source, bytes):
+                zf.writestr(arcname, source)
+            else:
+                zinfo = zipfile.ZipInfo.from_file(source, arcname)
+                zinfo.compress_type = zipfile.ZIP_STORED
+                force_zip64 = zinfo.file_size >= zipfile.ZIP64_LIMIT
+                with open(source, 'rb') as src, zf.open(zinfo, 'w', force_zip64=force_zip64) as dest:
+                    for block in iter(lambda: src.read(ZIP_READ_CHUNK_SIZE), b''):
+                        dest.write(block)
+                        yield sink.drain()
+
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Directorio central
+    data = sink.drain()
+    if data:
+        yield data